@@ -1,5 +1,4 @@
 import numpy as np
-from scipy.stats import gamma
 
 def calculate_gamma_params(mean, variance):
     """
@@ -43,21 +42,77 @@ def arrival_time_prediction(current_time, e2e_travel_delay):
     """
     return current_time + e2e_travel_delay
 
-# Sample data (the mean and variance of each road section are provided by the service provider)
-segment_means = [10, 15, 20]  # The average value of each road segment
-segment_variances = [2, 3, 5]  # The variance of each road segment
-current_time = 5
+def path_sums(segment_values, offsets=None):
+    """
+    Sum segment values per path.
+    :param segment_values: 2D array (paths x segments, shorter paths padded with 0 or nan), or a flat array of
+                           all segments when offsets is given
+    :param offsets: path k is segment_values[offsets[k]:offsets[k + 1]] (len(offsets) = number of paths + 1)
+    :return: 1D array with one sum per path
+    """
+    segment_values = np.asarray(segment_values, dtype=float)
+    if offsets is None:
+        return np.nansum(np.atleast_2d(segment_values), axis=1)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_values)))
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+def end_to_end_travel_time_batch(segment_means, segment_variances, offsets=None):
+    """
+    end_to_end_travel_time for many paths at once.
+    :param segment_means: 2D array of segment means (paths x segments, padded with 0 or nan), or a flat array with offsets
+    :param segment_variances: segment variances in the same layout
+    :param offsets: optional path boundaries for flat inputs, see path_sums
+    :return: arrays of kappa and theta, one per path
+    """
+    return calculate_gamma_params(path_sums(segment_means, offsets), path_sums(segment_variances, offsets))
+
+def sample_arrival_times(current_time, kappa, theta, size=None, rng=None):
+    """
+    Draw arrival times current_time + Gamma(kappa, theta) for many paths in bulk.
+    :param current_time: current time (scalar or one per path)
+    :param kappa, theta: arrays of Gamma parameters, e.g. from end_to_end_travel_time_batch
+    :param size: samples per path (None: one sample per path, shape of kappa)
+    :param rng: a numpy Generator or a seed (None: fresh entropy)
+    :return: array of arrival times, shape kappa.shape (+ (size,))
+    """
+    rng = np.random.default_rng(rng)
+    kappa, theta, current_time = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in (kappa, theta, current_time)))
+    if size is None:
+        return current_time + rng.gamma(kappa, theta)
+    return current_time[..., None] + rng.gamma(kappa[..., None], theta[..., None], kappa.shape + (size,))
+
+def arrival_time_quantiles(current_time, kappa, theta, q):
+    """
+    Quantiles of the arrival time current_time + Gamma(kappa, theta) (same as gamma.ppf, vectorized).
+    :param q: probabilities (scalar or array)
+    :return: array of shape kappa.shape + np.shape(q)
+    """
+    from scipy.special import gammaincinv
+
+    kappa, theta, current_time = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in (kappa, theta, current_time)))
+    q = np.asarray(q, dtype=float)
+    expand = (...,) + (None,) * q.ndim
+    return current_time[expand] + gammaincinv(kappa[expand], q) * theta[expand]
+
+if __name__ == "__main__":
+    from scipy.stats import gamma
+
+    # Sample data (the mean and variance of each road section are provided by the service provider)
+    segment_means = [10, 15, 20]  # The average value of each road segment
+    segment_variances = [2, 3, 5]  # The variance of each road segment
+    current_time = 5
 
-# Calculate the Gamma parameter for each road segment
-segment_params = [travel_time_on_segment(mean, variance) for mean, variance in zip(segment_means, segment_variances)]
-print("Gamma distribution parameters (kappa, theta) for each road segment:", segment_params)
+    # Calculate the Gamma parameter for each road segment
+    segment_params = [travel_time_on_segment(mean, variance) for mean, variance in zip(segment_means, segment_variances)]
+    print("Gamma distribution parameters (kappa, theta) for each road segment:", segment_params)
 
-# Calculate the Gamma parameter for end-to-end travel time
-e2e_params = end_to_end_travel_time(segment_means, segment_variances)
-print("Gamma distribution parameters (kappa, theta) for end-to-end travel time:", e2e_params)
+    # Calculate the Gamma parameter for end-to-end travel time
+    e2e_params = end_to_end_travel_time(segment_means, segment_variances)
+    print("Gamma distribution parameters (kappa, theta) for end-to-end travel time:", e2e_params)
 
-# Calculate arrival time prediction
-e2e_travel_delay = gamma.rvs(a=e2e_params[0], scale=e2e_params[1])  # 从Gamma分布中抽样
-print("The sampling interval is:", e2e_travel_delay)
-arrival_time = arrival_time_prediction(current_time, e2e_travel_delay)
-print("The predicted arrival time of the vehicle at the target intersection:", arrival_time)
+    # Calculate arrival time prediction
+    e2e_travel_delay = gamma.rvs(a=e2e_params[0], scale=e2e_params[1])  # 从Gamma分布中抽样
+    print("The sampling interval is:", e2e_travel_delay)
+    arrival_time = arrival_time_prediction(current_time, e2e_travel_delay)
+    print("The predicted arrival time of the vehicle at the target intersection:", arrival_time)
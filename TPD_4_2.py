@@ -1,11 +1,12 @@
 import numpy as np
-from scipy.stats import gamma, norm
-from scipy.integrate import quad
+from scipy.special import gammainc, gammainccinv, gammaincinv, gammaln, xlogy
+
+from instrumentation import metrics
 
 
 # 1. 计算在一个路段上车辆 Va 和 Vb 相遇的概率。它使用Gamma分布的概率密度函数 (PDF) 来进行积分计算。  t1_2 和 t2_1 是链接旅行延迟的期望值。
 # 1. Computes the probability that vehicles Va and Vb meet on a road segment. It uses the probability density function (PDF) of the Gamma distribution for the integral calculation. t1_2 and t2_1 are the expected values ​​of the link travel delays.
-def encounter_probability_segment(mean_a, variance_a, mean_b, variance_b, t1_2, t2_1):
+def encounter_probability_segment(mean_a, variance_a, mean_b, variance_b, t1_2, t2_1, method="cdf", quadrature="gauss", tol=1e-8):
     """
     Calculate the probability of meeting on a road segment.
     :param mean_a: mean of vehicle Va
@@ -14,8 +15,19 @@ def encounter_probability_segment(mean_a, variance_a, mean_b, variance_b, t1_2,
     :param variance_b: variance of vehicle Vb
     :param t1_2: expected link travel delay for L1,2
     :param t2_1: expected link travel delay for L2,1
+    :param method: "cdf" (vectorized engine, see encounter_probability_segment_cdf) or
+                   "reference" (one quad call per 0.01 step of x, the original implementation)
+    :param quadrature, tol: options of the "cdf" method
     :return: meeting probability
     """
+    if method == "cdf":
+        return encounter_probability_segment_cdf(mean_a, variance_a, mean_b, variance_b, t1_2, t2_1, quadrature, tol)
+    if method != "reference":
+        raise ValueError(f"unknown method: {method!r}")
+
+    # 参考实现才需要 scipy.stats 和 scipy.integrate，按需导入。 Only the reference implementation needs scipy.stats / scipy.integrate
+    from scipy.integrate import quad
+    from scipy.stats import gamma
 
     # 计算 Gamma 分布的形状和尺度参数
     shape_a = (mean_a ** 2) / variance_a
@@ -39,6 +51,7 @@ def encounter_probability_segment(mean_a, variance_a, mean_b, variance_b, t1_2,
         # quad 是 SciPy 库中的一个数值积分函数，它返回的第一个元素是积分的结果，因此通过 [0] 取出结果并加到 prob 上。 返回值是(积分的结果, 估计的误差)
         # quad is a numerical integration function in the SciPy library. The first element it returns is the result of the integration, so the result is taken out through [0] and added to prob. The return value is (the result of the integration, the estimated error)
         total_integral += 1  # 记录积分次数
+    metrics.count("integration_calls", total_integral)
 
     # 归一化 Normalization
     prob /= total_integral  # 除以积分次数  Divide by the number of integrations
@@ -46,24 +59,131 @@ def encounter_probability_segment(mean_a, variance_a, mean_b, variance_b, t1_2,
     return prob
 
 
-# 示例数据
-mean_a = 10  # 车辆 Va从其他点 到点1的延迟均值(期望）， 其他点可能是固定的点， 也可能是不同的点。The mean (expected) delay of vehicle Va from other points to point 1. Other points may be fixed points or different points.
-variance_a = 2  # 车辆 Va从其他点 到点1的延迟方差。 The delay variance of vehicle Va from other points to point 1
-mean_b = 15  # 车辆Vb从点2到点1的延迟均值(期望)。 Mean (expected) delay of vehicle Vb from point 2 to point 1
-variance_b = 3  # 车辆Vb从点2到点1的延迟方差。 The delay variance of vehicle Vb from point 2 to point 1
+# 参考实现中 x 的积分范围和步长 (秒)。 Range and step of x in the reference implementation (seconds)
+X_MAX = 100
+X_STEP = 0.01
+GAUSS_ORDER = 16  # 每个子区间的 Gauss-Legendre 节点数。 Gauss-Legendre nodes per panel
+_GAUSS_NODES, _GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(GAUSS_ORDER)
+
+
+# 与 gamma.pdf / gamma.cdf 相同，但直接调用 scipy.special，没有 scipy.stats 的参数检查开销。
+# Same as gamma.pdf / gamma.cdf, calling scipy.special directly without the scipy.stats argument handling
+def _gamma_pdf(x, shape, scale):
+    return np.exp(xlogy(shape - 1, x / scale) - x / scale - gammaln(shape)) / scale
+
+
+def _gamma_cdf(x, shape, scale, lower=None, upper=None):
+    """
+    :param lower, upper: optional quantiles of the distribution, given like shape and scale as (N, 1, ...) arrays for
+                         an (N, ...) x; outside them the CDF is taken as 0 / 1 and gammainc (the expensive part) is
+                         only evaluated in between
+    """
+    if lower is None:
+        return gammainc(shape, np.maximum(x, 0) / scale)
+    cdf = (x >= upper).astype(float)
+    inside = (x > lower) & (x < upper)
+    rows = np.nonzero(inside)[0]  # 参数按第一维 (参数组) 广播。 The parameters vary along the first axis only
+    cdf[inside] = gammainc(shape.reshape(-1)[rows], x[inside] / scale.reshape(-1)[rows])
+    return cdf
+
+
+def _window_integrand(x, shape_a, scale_a, shape_b, scale_b, offset, window, lower_b=None, upper_b=None):
+    # 内层积分 ∫_{x+offset}^{x+offset+window} f(x) g(y) dy = f(x) (G(x + offset + window) - G(x + offset))
+    # The inner integral over y as a difference of Vb's CDF
+    return _gamma_pdf(x, shape_a, scale_a) * (_gamma_cdf(x + offset + window, shape_b, scale_b, lower_b, upper_b) -
+                                              _gamma_cdf(x + offset, shape_b, scale_b, lower_b, upper_b))
+
+
+def _composite_gauss(lower, upper, power, panels, parameters):
+    """
+    Composite Gauss-Legendre over [lower, upper], one row per parameter set, after the substitution
+    x = lower + (upper - lower) * s ** power (s in [0, 1]) that removes the x ** (shape - 1) singularity at 0 when shape < 1.
+    """
+    s = (np.arange(panels)[:, None] + (_GAUSS_NODES + 1) / 2) / panels
+    width, power = (upper - lower)[:, None, None], power[:, None, None]
+    jacobian = width * power * s ** (power - 1)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        # s ** power 下溢时 x 落在奇点上，但雅可比为 0。 Where s ** power underflows x sits on the singularity, but the jacobian is 0
+        values = _window_integrand(lower[:, None, None] + width * s ** power, *(parameter[:, None, None] for parameter in parameters))
+        values = np.where(jacobian > 0, values * jacobian, 0.0)
+    return np.sum(values @ _GAUSS_WEIGHTS, axis=-1) / (2 * panels)
+
+
+def _gauss_window_integral(parameters, tol, tail, max_panels):
+    """
+    ∫_0^X_MAX f(x) (G(x + offset + window) - G(x + offset)) dx for every parameter set.
+    :param parameters: 1-D arrays (shape_a, scale_a, shape_b, scale_b, offset, window)
+    :param tol: absolute error tolerance of the integral; the number of Gauss-Legendre panels of each parameter set
+                doubles until two estimates agree within tol
+    :param tail: tails of this mass are cut off Va's integration range and Vb's CDF
+    :param max_panels: parameter sets not converged with this many panels fall back to an adaptive quad call
+    """
+    shape_a, scale_a, shape_b, scale_b = parameters[:4]
+    # 只在 Va 到达时间的 [tail, 1 - tail] 分位数区间上积分; Vb 的 CDF 在它的分位数区间外取 0 或 1
+    # Integrate over Va's [tail, 1 - tail] quantiles only; Vb's CDF is 0 / 1 outside its own quantiles
+    lower = np.minimum(scale_a * gammaincinv(shape_a, tail), X_MAX)
+    upper = np.minimum(scale_a * gammainccinv(shape_a, tail), X_MAX)
+    parameters = list(parameters) + [scale_b * gammaincinv(shape_b, tail), scale_b * gammainccinv(shape_b, tail)]
+    power = np.maximum(1.0, 1.0 / np.minimum(shape_a, shape_b))
+
+    panels = 1
+    integral = _composite_gauss(lower, upper, power, panels, parameters)
+    active = np.arange(len(integral))  # 尚未收敛的参数组。 Parameter sets that have not converged yet
+    while len(active) and panels < max_panels:
+        panels *= 2
+        refined = _composite_gauss(lower[active], upper[active], power[active], panels,
+                                   [parameter[active] for parameter in parameters])
+        converged = np.abs(refined - integral[active]) <= tol
+        integral[active] = refined
+        active = active[~converged]
+    if len(active):
+        from scipy.integrate import quad
+    for i in active:
+        integral[i] = quad(lambda x: _window_integrand(x, *(parameter[i] for parameter in parameters[:6])),
+                           lower[i], upper[i], epsabs=tol, limit=200)[0]
+    metrics.count("encounter_quad_fallbacks", len(active))
+    return integral
+
+
+def _gamma_parameters(*values):
+    # 广播后展平为一维数组，并把 (均值, 方差) 换成 Gamma 分布的 (形状, 尺度)。 Broadcast, flatten and turn (mean, variance) into (shape, scale)
+    mean_a, variance_a, mean_b, variance_b, *rest = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in values))
+    return mean_a.shape, [value.ravel() for value in (mean_a ** 2 / variance_a, variance_a / mean_a,
+                                                       mean_b ** 2 / variance_b, variance_b / mean_b, *rest)]
+
 
-t1_2 = 5  # n1 ~ n2路段的延迟期望(相对于所有车辆计算的) Expected delay of segment n1 to n2 (calculated relative to all vehicles)
-t2_1 = 6  # n2 ~ n1路段的延迟期望 Expected delay of the n2 ~ n1 segment
+def encounter_probability_segment_cdf(mean_a, variance_a, mean_b, variance_b, t1_2, t2_1, quadrature="gauss", tol=1e-8, max_panels=64):
+    """
+    Vectorized encounter probability on a road segment. The inner quad of the reference implementation integrates
+    Vb's gamma PDF, so it is replaced by a difference of gamma CDFs and only the outer integral over x is numerical.
+    As in the reference, the result is the integral over x in [0, X_MAX) divided by X_MAX.
+    All parameters may be arrays (broadcast together), e.g. one entry per vehicle pair.
+    :param quadrature: "grid" evaluates the reference's grid (x = 0, 0.01, ..., 99.99) in one call and averages it;
+                       "gauss" uses composite Gauss-Legendre over the support of Va's arrival time, doubling the
+                       number of panels of each parameter set until two estimates agree within tol
+    :param tol: absolute error tolerance of the "gauss" quadrature; tails of mass below tol are cut off as well
+    :param max_panels: parameter sets not converged with this many panels fall back to an adaptive quad call
+    :return: meeting probability (float, or an array for array parameters)
+    """
+    shape, (shape_a, scale_a, shape_b, scale_b, t1_2, t2_1) = _gamma_parameters(mean_a, variance_a, mean_b, variance_b, t1_2, t2_1)
+    parameters = [shape_a, scale_a, shape_b, scale_b, np.zeros_like(t1_2), t1_2 + t2_1]
+    metrics.count("encounter_segment_evaluations", len(shape_a))
 
-# 计算相遇概率
-prob_segment = encounter_probability_segment(mean_a, variance_a, mean_b, variance_b, t1_2, t2_1)
-print(f"Probability of meeting on a road segment: {prob_segment}")
+    if quadrature == "grid":
+        x = np.arange(0, X_MAX, X_STEP)
+        prob = np.mean(_window_integrand(x, *(parameter[:, None] for parameter in parameters)), axis=-1)
+    elif quadrature == "gauss":
+        prob = _gauss_window_integral(parameters, tol * X_MAX, tol, max_panels) / X_MAX
+    else:
+        raise ValueError(f"unknown quadrature: {quadrature!r}")
+    prob = prob.reshape(shape)
+    return float(prob) if prob.ndim == 0 else prob
 
 
 # 2. 计算算车辆 Va 和 Vb 在交叉口的相遇概率。它考虑了两种情况： Calculate the probability of vehicles Va and Vb meeting at the intersection. It considers two cases:
 # 情况1：Va 早于 Vb 到达交叉口。    情况2：Vb 早于 Va 到达交叉口。      该函数同样使用 Gamma 分布的 PDF 来进行积分计算。
 # Case 1: Va reaches the intersection earlier than Vb. Case 2: Vb reaches the intersection earlier than Va. This function also uses the PDF of the Gamma distribution for integral calculation.
-def encounter_probability_intersection(mean_a, variance_a, mean_b, variance_b, ti_5, R, Sb):
+def encounter_probability_intersection(mean_a, variance_a, mean_b, variance_b, ti_5, R, Sb, method="cdf", tol=1e-8):
     """
     Calculate the probability of encounter at an intersection.
     :param mean_a: mean of vehicle Va
@@ -73,8 +193,17 @@ def encounter_probability_intersection(mean_a, variance_a, mean_b, variance_b, t
     :param ti_5: link travel delay at the intersection
     :param R: communication range
     :Sb: expected speed of Vb
+    :param method: "cdf" (single integral, see encounter_probability_intersection_batch) or
+                   "reference" (nested quad calls, the original implementation)
+    :param tol: error tolerance of the "cdf" method
     :return: encounter probability
     """
+    if method == "cdf":
+        return float(encounter_probability_intersection_batch(mean_a, variance_a, mean_b, variance_b, ti_5, R, Sb, tol))
+    if method != "reference":
+        raise ValueError(f"unknown method: {method!r}")
+    from scipy.integrate import quad
+    from scipy.stats import gamma
 
     def f(x):
         return gamma.pdf(x, a=mean_a ** 2 / variance_a, scale=variance_a / mean_a)
@@ -85,27 +214,77 @@ def encounter_probability_intersection(mean_a, variance_a, mean_b, variance_b, t
     # 计算相遇概率 Case 1
     #外层积分：quad(lambda x: ..., 0, np.inf) 表示对 x 从 0 到正无穷进行积分。
     #内层积分：表示对 y 从 x + ti_5 到 x + ti_5 + R/Sb 进行积分，f(x) 和 g(y) 是两个函数，分别与 x 和 y 有关。
-    prob_case_1 = quad(lambda x: quad(lambda y: f(x) * g(y), x + ti_5, x + ti_5 + R/Sb)[0], 0, 100)[0] #100
+    def inner(x, lower, upper):  # 内层积分，同时统计积分调用次数。 Inner integral, also counting integration calls
+        metrics.count("integration_calls")
+        return quad(lambda y: f(x) * g(y), lower, upper)[0]
+
+    prob_case_1 = quad(lambda x: inner(x, x + ti_5, x + ti_5 + R/Sb), 0, 100)[0] #100
 
     # 计算相遇概率 Case 2
-    prob_case_2 = quad(lambda x: quad(lambda y: f(x) * g(y), x + ti_5 - R/Sb, x + ti_5)[0], 0, 100)[0]
+    prob_case_2 = quad(lambda x: inner(x, x + ti_5 - R/Sb, x + ti_5), 0, 100)[0]
+    metrics.count("integration_calls", 2)
 
     # 总相遇概率
     total_prob = prob_case_1 + prob_case_2
     return total_prob
 
 
-# 示例数据
-mean_a_intersection = 10  # 车辆Va的均值   The mean value of vehicle Va
-variance_a_intersection = 2  # 车辆Va的方差  The variance of vehicle Va
-mean_b_intersection = 15  # 车辆Vb的均值   The mean value of vehicle Vb
-variance_b_intersection = 3  # 车辆Vb的方差  The variance of vehicle Vb
-ti_5 = 5  # 交叉口的链接旅行延迟。（Va从点i到点5的时间间隔） Link travel delay at the intersection. (The time interval between Va from point i to point 5)
-R = 10  # 通信范围   Communication range
-Sb = 0.5 #Vb的预期速度  Expected speed of Vb
-
-# 计算交叉口的相遇概率
-prob_intersection = encounter_probability_intersection(mean_a_intersection, variance_a_intersection,
-                                                       mean_b_intersection, variance_b_intersection,
-                                                       ti_5, R, Sb)
-print(f"Meeting probability at intersection: {prob_intersection}")
+def encounter_probability_intersection_batch(mean_a, variance_a, mean_b, variance_b, ti_5, R, Sb, tol=1e-8, max_panels=64):
+    """
+    Encounter probability at an intersection for arrays of vehicle pairs in one vectorized call.
+    Case 1 integrates y over [x + ti_5, x + ti_5 + R/Sb] and case 2 over [x + ti_5 - R/Sb, x + ti_5], so together they
+    are the single integral over x in [0, 100] of f(x) (G(x + ti_5 + R/Sb) - G(x + ti_5 - R/Sb)), G being Vb's gamma CDF.
+    :param mean_a, variance_a, mean_b, variance_b, ti_5, R, Sb: arrays (or scalars) broadcast together, as in
+                                                               encounter_probability_intersection
+    :param tol: absolute error tolerance (including the cut-off tails of Va's and Vb's distributions)
+    :param max_panels: pairs not converged with this many Gauss-Legendre panels fall back to an adaptive quad call
+    :return: array of encounter probabilities
+    """
+    shape, (shape_a, scale_a, shape_b, scale_b, ti_5, R, Sb) = _gamma_parameters(mean_a, variance_a, mean_b, variance_b, ti_5, R, Sb)
+    metrics.count("encounter_intersection_evaluations", len(shape_a))
+    return _gauss_window_integral([shape_a, scale_a, shape_b, scale_b, ti_5 - R / Sb, 2 * R / Sb], tol, tol / 4, max_panels).reshape(shape)
+
+
+def arrival_difference_cdf(mean_a, variance_a, mean_b, variance_b, delay, tol=1e-8, max_panels=64):
+    """
+    H(delay) = ∫_0^100 f(x) G(x + delay) dx: the probability that Va arrives within [0, 100] and Vb arrives at most
+    `delay` after it. Both encounter probabilities are differences of H:
+        encounter_probability_segment = (H(t1_2 + t2_1) - H(0)) / 100
+        encounter_probability_intersection = H(ti_5 + R/Sb) - H(ti_5 - R/Sb)
+    :param mean_a, variance_a, mean_b, variance_b, delay: arrays (or scalars) broadcast together
+    :return: array of H values
+    """
+    shape, (shape_a, scale_a, shape_b, scale_b, delay) = _gamma_parameters(mean_a, variance_a, mean_b, variance_b, delay)
+    # G(x + delay) = G(x + delay) - G(x - X_MAX - 1)，后一项在 x <= X_MAX 时恒为 0。 The second term is 0 for x <= X_MAX
+    offset = np.full_like(delay, -X_MAX - 1.0)
+    return _gauss_window_integral([shape_a, scale_a, shape_b, scale_b, offset, delay - offset], tol, tol / 4, max_panels).reshape(shape)
+
+
+if __name__ == "__main__":
+    # 示例数据
+    mean_a = 10  # 车辆 Va从其他点 到点1的延迟均值(期望）， 其他点可能是固定的点， 也可能是不同的点。The mean (expected) delay of vehicle Va from other points to point 1. Other points may be fixed points or different points.
+    variance_a = 2  # 车辆 Va从其他点 到点1的延迟方差。 The delay variance of vehicle Va from other points to point 1
+    mean_b = 15  # 车辆Vb从点2到点1的延迟均值(期望)。 Mean (expected) delay of vehicle Vb from point 2 to point 1
+    variance_b = 3  # 车辆Vb从点2到点1的延迟方差。 The delay variance of vehicle Vb from point 2 to point 1
+
+    t1_2 = 5  # n1 ~ n2路段的延迟期望(相对于所有车辆计算的) Expected delay of segment n1 to n2 (calculated relative to all vehicles)
+    t2_1 = 6  # n2 ~ n1路段的延迟期望 Expected delay of the n2 ~ n1 segment
+
+    # 计算相遇概率
+    prob_segment = encounter_probability_segment(mean_a, variance_a, mean_b, variance_b, t1_2, t2_1)
+    print(f"Probability of meeting on a road segment: {prob_segment}")
+
+    # 交叉口的示例数据
+    mean_a_intersection = 10  # 车辆Va的均值   The mean value of vehicle Va
+    variance_a_intersection = 2  # 车辆Va的方差  The variance of vehicle Va
+    mean_b_intersection = 15  # 车辆Vb的均值   The mean value of vehicle Vb
+    variance_b_intersection = 3  # 车辆Vb的方差  The variance of vehicle Vb
+    ti_5 = 5  # 交叉口的链接旅行延迟。（Va从点i到点5的时间间隔） Link travel delay at the intersection. (The time interval between Va from point i to point 5)
+    R = 10  # 通信范围   Communication range
+    Sb = 0.5 #Vb的预期速度  Expected speed of Vb
+
+    # 计算交叉口的相遇概率
+    prob_intersection = encounter_probability_intersection(mean_a_intersection, variance_a_intersection,
+                                                           mean_b_intersection, variance_b_intersection,
+                                                           ti_5, R, Sb)
+    print(f"Meeting probability at intersection: {prob_intersection}")
@@ -1,6 +1,11 @@
 import heapq
+import math
 from collections import defaultdict
 
+import numpy as np
+
+from instrumentation import metrics
+
 
 # 定义车辆节点。   Define vehicle node
 class VehicleNode:
@@ -32,6 +37,9 @@ class PredictedEncounterGraph:
 
     def predict_encounter(self, source_vehicle, destination_vehicle, vehicles, encounter_times, encounter_probs):
         # 使用最小优先队列（堆）实现扩展   Scaling with minimum priority queue (heap)
+        # 每次预测都从空图和空位图开始，同一个实例可以重复使用。 Start every prediction from an empty graph and bitmap, so an instance can be reused
+        self.graph = {source_vehicle: VehicleNode(source_vehicle, 0)}
+        self.bitmap = defaultdict(int)
         queue = []
         heapq.heappush(queue, (0, source_vehicle))  # 插入源车辆作为根节点。    Insert the source vehicle as the root node
         self.bitmap[source_vehicle] = 1  # 标记源车辆已访问。    Mark source vehicle visited
@@ -61,6 +69,311 @@ class PredictedEncounterGraph:
         return self.graph
 
 
+# 紧凑 (数组) 形式的相遇信息：车辆用整数编号，相遇边用 CSR 数组存储。
+# Compact encounter data: integer vehicle ids, encounter edges as CSR arrays
+class EncounterCSR:
+    def __init__(self, indptr, neighbours, times, probs, names=None):
+        """
+        The encounters of vehicle v are entries indptr[v]:indptr[v + 1] of neighbours / times / probs,
+        in the same order as its list in encounter_times.
+        :param names: optional vehicle names, names[v] being the name of id v
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.neighbours = np.asarray(neighbours)
+        self.times = np.asarray(times, dtype=float)
+        self.probs = np.asarray(probs, dtype=float)
+        self.names = names
+        self.num_vehicles = len(self.indptr) - 1
+        self._ids = None
+
+    @classmethod
+    def from_edges(cls, sources, targets, times, probs, num_vehicles, names=None):
+        """
+        Build from parallel edge arrays; edges of the same source keep their relative order.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=num_vehicles))))
+        id_type = np.int32 if num_vehicles < 2 ** 31 else np.int64
+        return cls(indptr, np.asarray(targets, dtype=id_type)[order], np.asarray(times, dtype=float)[order],
+                   np.asarray(probs, dtype=float)[order], names)
+
+    @classmethod
+    def from_dicts(cls, vehicles, encounter_times, encounter_probs):
+        """
+        Convert the dict format of PredictedEncounterGraph.predict_encounter. Ids follow the sorted vehicle names,
+        so ties between equal encounter times are broken in the same order as the name comparison of the heap.
+        """
+        names = sorted(set(vehicles) | set(encounter_times) |
+                       {next_vehicle for encounters in encounter_times.values() for next_vehicle, _ in encounters})
+        ids = {name: k for k, name in enumerate(names)}
+        sources, targets, times, probs = [], [], [], []
+        for vehicle, encounters in encounter_times.items():
+            for next_vehicle, encounter_time in encounters:
+                sources.append(ids[vehicle])
+                targets.append(ids[next_vehicle])
+                times.append(encounter_time)
+                # 原实现只在需要时读取概率，缺失的键在这里记为 -inf (永远低于阈值)。 Missing keys never pass the threshold
+                probs.append(encounter_probs.get((vehicle, next_vehicle), -np.inf))
+        encounters = cls.from_edges(sources, targets, times, probs, len(names), names)
+        encounters._ids = ids
+        return encounters
+
+    def id_of(self, name):
+        if self._ids is None:
+            self._ids = {name: k for k, name in enumerate(self.names)}
+        return self._ids[name]
+
+
+# 真正的位图：每辆车一位。 A real bitset, one bit per vehicle
+class Bitset:
+    def __init__(self, size):
+        self.size = size
+        self.bits = np.zeros((size + 7) // 8, dtype=np.uint8)
+
+    def test(self, ids):
+        ids = np.asarray(ids)
+        return ((self.bits[ids >> 3] >> (ids & 7).astype(np.uint8)) & 1).astype(bool)
+
+    def add(self, ids):
+        ids = np.asarray(ids)
+        np.bitwise_or.at(self.bits, ids >> 3, (1 << (ids & 7)).astype(np.uint8))
+
+    def clear(self):
+        self.bits[:] = 0
+
+    def __contains__(self, vehicle_id):
+        return bool(self.bits[vehicle_id >> 3] >> (vehicle_id & 7) & 1)
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits, count=self.size).sum())
+
+
+# 数组形式的预测相遇图 (适合百万级车辆)。 Array-backed predicted encounter graph for large fleets
+class CompactPredictedEncounterGraph:
+    def __init__(self, threshold=0.6, ttl=10.0):
+        self.threshold = threshold  # 相遇概率阈值   Encounter probability threshold
+        self.ttl = ttl
+        self.encounters = None
+        self.source = None
+        self.parent = None  # 树中每辆车的父节点，-1 表示根或未到达。 Parent in the tree, -1 for the root and unreached vehicles
+        self.time = None  # 每辆车的预计相遇时间，未到达为 nan。 Expected encounter time, nan if unreached
+        self.order = None  # 按加入顺序排列的子节点。 Vehicles in the order they were added to the tree
+        self.visited = None
+
+    def predict_encounter(self, source, destination, encounters):
+        """
+        Same search as PredictedEncounterGraph.predict_encounter on an EncounterCSR: vehicles are expanded in order of
+        (encounter time, id), an encounter is followed if the vehicle is unvisited, its probability >= threshold and its
+        time <= ttl, and the search stops when the destination is popped.
+        With destination=None every reachable vehicle is expanded (one-to-all). The parent and time of a vehicle are
+        fixed when it is added, so the full tree gives the same path to any destination as a search that stops there.
+        :param source, destination: vehicle ids (or names, if encounters has names)
+        :return: self, with the tree in parent / time / order
+        """
+        if isinstance(source, str):
+            source = encounters.id_of(source)
+        if isinstance(destination, str):
+            destination = encounters.id_of(destination)
+        self.encounters = encounters
+        self.source = source
+        self.parent = np.full(encounters.num_vehicles, -1, dtype=encounters.neighbours.dtype)
+        self.time = np.full(encounters.num_vehicles, np.nan)
+        self.time[source] = 0
+        self.visited = Bitset(encounters.num_vehicles)
+        self.visited.add(source)
+        order = []
+
+        # 阈值和 TTL 的筛选一次性向量化完成；遍历时通过 memoryview 逐个读取，避免每个节点多次调用 numpy。
+        # Threshold and TTL are checked for all edges at once; the traversal reads single items through memoryviews,
+        # which is much cheaper than several numpy calls per (small) adjacency list
+        usable = memoryview((encounters.probs >= self.threshold) & (encounters.times <= self.ttl)).cast("B")
+        indptr, neighbours, times = (memoryview(a) for a in (encounters.indptr, encounters.neighbours, encounters.times))
+        parent, time, bits = memoryview(self.parent), memoryview(self.time), memoryview(self.visited.bits)
+        queue = [(0, source)]
+        while queue:
+            current_time, current_vehicle = heapq.heappop(queue)
+            if current_vehicle == destination:
+                break
+
+            for edge in range(indptr[current_vehicle], indptr[current_vehicle + 1]):
+                next_vehicle = neighbours[edge]
+                if usable[edge] and not bits[next_vehicle >> 3] >> (next_vehicle & 7) & 1:
+                    encounter_time = times[edge]
+                    heapq.heappush(queue, (encounter_time, next_vehicle))
+                    parent[next_vehicle] = current_vehicle
+                    time[next_vehicle] = encounter_time
+                    order.append(next_vehicle)
+                    bits[next_vehicle >> 3] |= 1 << (next_vehicle & 7)
+
+        self.order = np.array(order, dtype=self.parent.dtype)
+        return self
+
+    def children(self, vehicle):
+        """
+        Children of a vehicle in the order they were added.
+        """
+        return self.order[self.parent[self.order] == vehicle]
+
+    def path_to(self, vehicle):
+        """
+        Vehicles from the source to `vehicle` along the tree, or [] if it was not reached.
+        """
+        if not (vehicle == self.source or self.parent[vehicle] >= 0):
+            return []
+        path = [vehicle]
+        while path[-1] != self.source:
+            path.append(int(self.parent[path[-1]]))
+        return path[::-1]
+
+    def to_graph(self):
+        """
+        The tree as the dict of VehicleNode returned by PredictedEncounterGraph.predict_encounter (keyed by name if known).
+        """
+        name = (lambda v: self.encounters.names[v]) if self.encounters.names is not None else int
+        graph = {name(self.source): VehicleNode(name(self.source), 0)}
+        for vehicle, parent, time in zip(self.order.tolist(), self.parent[self.order].tolist(), self.time[self.order].tolist()):
+            graph[name(vehicle)] = VehicleNode(name(vehicle), time)
+            graph[name(parent)].children.append(graph[name(vehicle)])
+        return graph
+
+
+# 可增量更新的因果最早到达相遇树。 Causal earliest-arrival encounter tree with incremental updates
+class IncrementalEncounterTree:
+    def __init__(self, source, threshold=0.6, ttl=10.0):
+        """
+        Encounter tree of a streaming encounter feed, repaired in place when predictions change instead of rebuilt.
+        The tree is the causal earliest-arrival tree: the source holds the message at time 0, and an encounter
+        u -> v at time t (probability >= threshold, t <= ttl) hands it to v if u already holds it (arrival[u] <= t);
+        every vehicle keeps the earliest such t and the vehicle it came from.
+        Unlike PredictedEncounterGraph.predict_encounter (whose tree depends on the order vehicles are discovered and
+        which stops at the destination), this tree is a fixed point of the encounters, so an update only touches the
+        vehicles whose arrival can change (dynamic shortest path, Ramalingam-Reps style):
+            - an encounter that got worse or disappeared and was a tree edge detaches the subtree below it, whose
+              vehicles are re-attached from their best incoming encounter;
+            - an encounter that got better relaxes its target;
+            - both are then propagated with Dijkstra, in order of arrival time, from those vehicles only.
+        :param source: the vehicle that holds the message
+        """
+        self.source = source
+        self.threshold = threshold  # 相遇概率阈值   Encounter probability threshold
+        self.ttl = ttl
+        self.times = defaultdict(dict)  # times[u][v]: 预计相遇时间。 Expected encounter time
+        self.probs = {}  # probs[(u, v)]: 相遇概率。 Encounter probability
+        self.incoming = defaultdict(set)  # incoming[v]: 会遇到 v 的车辆。 Vehicles with an encounter towards v
+        self.arrival = {source: 0}  # 每辆已到达车辆拿到消息的时间。 Time each reached vehicle gets the message
+        self.parent = {source: None}
+        self.children = defaultdict(set)
+
+    def _usable_time(self, u, v):
+        # 可用相遇的时间，不可用时返回 None。 Time of the encounter u -> v if it can carry the message, else None
+        t = self.times[u].get(v) if u in self.times else None
+        if t is None or t > self.ttl or self.probs.get((u, v), -math.inf) < self.threshold:
+            return None
+        return t
+
+    def _attach(self, vehicle, parent, t):
+        old_parent = self.parent.get(vehicle)
+        if old_parent is not None:
+            self.children[old_parent].discard(vehicle)
+        self.arrival[vehicle] = t
+        self.parent[vehicle] = parent
+        self.children[parent].add(vehicle)
+
+    def _detach_subtree(self, root):
+        # 移除 root 及其所有后代，返回 {车辆: (原到达时间, 原父节点)}。 Remove root and its descendants, return their old state
+        self.children[self.parent[root]].discard(root)
+        detached, stack = {}, [root]
+        while stack:
+            vehicle = stack.pop()
+            detached[vehicle] = (self.arrival.pop(vehicle), self.parent.pop(vehicle))
+            stack.extend(self.children.pop(vehicle, ()))
+        return detached
+
+    def update(self, encounter_times=None, encounter_probs=None, removed=()):
+        """
+        Apply a batch of new or changed predictions and repair the tree.
+        :param encounter_times: {u: [(v, time), ...]}, new encounters or new times of known ones (same format as
+            PredictedEncounterGraph.predict_encounter)
+        :param encounter_probs: {(u, v): probability}, new or changed probabilities
+        :param removed: (u, v) encounters that are no longer predicted (applied before the new predictions)
+        :return: set of vehicles whose arrival time or parent changed (including vehicles that became unreachable)
+        """
+        old = {}
+        for u, v in removed:
+            old.setdefault((u, v), self._usable_time(u, v))
+            if u in self.times:
+                self.times[u].pop(v, None)
+            self.probs.pop((u, v), None)
+            self.incoming[v].discard(u)
+        for u, encounters in (encounter_times or {}).items():
+            for v, t in encounters:
+                old.setdefault((u, v), self._usable_time(u, v))
+                self.times[u][v] = t
+                self.incoming[v].add(u)
+        for pair, p in (encounter_probs or {}).items():
+            old.setdefault(pair, self._usable_time(*pair))
+            self.probs[pair] = p
+
+        # 1. 变差的树边：断开其子树。 Tree edges that got worse: detach their subtrees
+        before = {}
+        changed = [(pair, self._usable_time(*pair)) for pair, old_time in old.items() if self._usable_time(*pair) != old_time]
+        for (u, v), t in changed:
+            if v in self.arrival and self.parent[v] == u and t != self.arrival[v]:
+                before.update(self._detach_subtree(v))
+        detached = list(before)
+
+        # 2. 被断开的车辆从仍在树中的车辆重新接入；变好的相遇直接松弛。
+        # Detached vehicles are re-attached from vehicles still in the tree; improved encounters relax their target
+        queue = []
+        for v in detached:
+            for u in self.incoming[v]:
+                t = self._usable_time(u, v)
+                if t is not None and u in self.arrival and self.arrival[u] <= t:
+                    heapq.heappush(queue, (t, v, u))
+        for (u, v), t in changed:
+            if t is not None and u in self.arrival and self.arrival[u] <= t and t < self.arrival.get(v, math.inf):
+                heapq.heappush(queue, (t, v, u))
+
+        # 3. Dijkstra：只从受影响的车辆向外传播。 Dijkstra, propagating from the affected vehicles only
+        relaxations = 0
+        while queue:
+            t, v, u = heapq.heappop(queue)
+            if v == self.source or t >= self.arrival.get(v, math.inf) or self.arrival.get(u, math.inf) > t:
+                continue
+            before.setdefault(v, (self.arrival.get(v), self.parent.get(v)))
+            self._attach(v, u, t)
+            for w, encounter_time in self.times.get(v, {}).items():
+                relaxations += 1
+                if t <= encounter_time < self.arrival.get(w, math.inf) and self._usable_time(v, w) is not None:
+                    heapq.heappush(queue, (encounter_time, w, v))
+
+        metrics.count("encounter_tree_updates")
+        metrics.count("encounter_tree_relaxations", relaxations)
+        return {vehicle for vehicle, state in before.items() if state != (self.arrival.get(vehicle), self.parent.get(vehicle))}
+
+    def path_to(self, vehicle):
+        """
+        Vehicles from the source to `vehicle` along the tree, or [] if it is not reached.
+        """
+        if vehicle not in self.arrival:
+            return []
+        path = [vehicle]
+        while path[-1] != self.source:
+            path.append(self.parent[path[-1]])
+        return path[::-1]
+
+    def to_graph(self):
+        """
+        The tree as a dict of VehicleNode (children sorted by encounter time), like PredictedEncounterGraph.graph.
+        """
+        graph = {vehicle: VehicleNode(vehicle, t) for vehicle, t in self.arrival.items()}
+        for vehicle, node in graph.items():
+            node.children = sorted((graph[child] for child in self.children.get(vehicle, ())),
+                                   key=lambda child: (child.expected_encounter_time, child.vehicle_id))
+        return graph
+
+
 # 模拟车辆网络和相遇信息。 Simulating vehicle networks and encounter information
 def simulate_encounter_graph():
     # 初始化车辆、相遇时间、相遇概率等信息。 Initialize vehicle, encounter time, encounter probability and other information
@@ -91,5 +404,6 @@ def simulate_encounter_graph():
             print(f"Vehicle {vehicle_id} will encounter vehicles: {child.vehicle_id} at time {child.expected_encounter_time}")
 
 
-# 运行模拟。 Run the simulation
-simulate_encounter_graph()
+if __name__ == "__main__":
+    # 运行模拟。 Run the simulation
+    simulate_encounter_graph()
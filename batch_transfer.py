@@ -0,0 +1,116 @@
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from router import Router
+from satallite2 import Constellation
+from shared_arrays import attach_arrays, share_arrays
+
+
+# 共享给工作进程的星座数组 (只读)。 Constellation arrays shared with the worker processes (read-only)
+SHARED_FIELDS = ("orbit_index", "speed", "orbit_height", "communication_radius", "theta", "inclination",
+                 "coverage_radius", "angular_velocity")
+
+# 每个任务一行：起始基站经纬度、目标基站经纬度、数据包大小、出发时间。 One row per job
+JOB_COLUMNS = ("start_lat", "start_lon", "target_lat", "target_lon", "packet_size", "start_time")
+
+_worker = {}  # 每个工作进程里的状态。 Per-process worker state
+
+
+# 只带经纬度的基站，工作进程里代替 Station。 Lat/lon-only station used inside the workers
+class _JobStation:
+    def __init__(self, lat, lon):
+        self.lat_lon = np.array((lat, lon))
+
+
+def _init_worker(block_name, layout, router_options, propagator=None):
+    block, views = attach_arrays(block_name, layout)
+    constellation = Constellation.from_arrays(*(views[name] for name in SHARED_FIELDS))
+    if propagator is not None:
+        # 外推器的轨道根数也在共享内存中。 The propagator's elements are in the shared block as well
+        from propagators import ELEMENT_FIELDS, OrbitalElements
+
+        propagator_class, options = propagator
+        elements = OrbitalElements(*(views["element_" + name] for name in ELEMENT_FIELDS), names=constellation.names)
+        constellation.time = views["time"]
+        constellation.propagator = propagator_class(elements, **options)
+    _worker.update(block=block, jobs=views["jobs"], router=Router(constellation, **router_options))
+
+
+def _run_chunk(rows):
+    """
+    Route a chunk of jobs with the worker's router (whose snapshots and search trees persist across chunks).
+    """
+    jobs, router = _worker["jobs"], _worker["router"]
+    latency = np.empty(len(rows))
+    hops = np.empty(len(rows), dtype=np.int64)
+    success = np.empty(len(rows), dtype=bool)
+    for i, row in enumerate(rows):
+        start_lat, start_lon, target_lat, target_lon, _, start_time = jobs[row]
+        route = router.route(_JobStation(start_lat, start_lon), _JobStation(target_lat, target_lon), departure=start_time)
+        latency[i], hops[i], success[i] = route.latency, route.hops, route.delivered
+    return rows, latency, hops, success
+
+
+def simulate_transfers(constellation, jobs, processes=None, hop_time=0.01, slot=None, horizon=None, chunksize=None):
+    """
+    Simulate many ground-to-ground transfers in parallel, each as Router.route from the job's start time
+    (i.e. the discrete-event version of simulate_data_transfer, without printing).
+    The constellation arrays and the job table are placed once in shared memory; every worker attaches to them
+    and keeps one Router, so jobs from the same start station and departure slot share one search.
+    :param constellation: a satallite2.Constellation; times are relative to its current state
+    :param jobs: iterable of (start Station, target Station, packet size, start time); the packet size is kept
+                 with the job but not modelled, as in simulate_data_transfer
+    :param processes: number of worker processes (default: os.cpu_count(); 1 runs in this process)
+    :param hop_time, slot, horizon: passed to Router
+    :param chunksize: jobs per task (default: about four tasks per worker, so small batches still use every worker)
+    :return: (latency, hops, success) arrays in job order; latency is inf for failed transfers
+    """
+    table = np.array([(start.lat_lon[0], start.lat_lon[1], target.lat_lon[0], target.lat_lon[1], size, start_time)
+                      for start, target, size, start_time in jobs], dtype=float).reshape(-1, len(JOB_COLUMNS))
+    router_options = {"hop_time": hop_time, "slot": slot, "horizon": horizon}
+    arrays = {name: np.ascontiguousarray(getattr(constellation, name)) for name in SHARED_FIELDS}
+    arrays["jobs"] = table
+    propagator = None
+    if constellation.propagator is not None:
+        propagator = (type(constellation.propagator), constellation.propagator.options())
+        arrays.update({"element_" + name: array for name, array in constellation.propagator.elements.arrays().items()})
+        arrays["time"] = constellation.time
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(table) // (4 * processes))
+
+    # 相同起始基站、相近出发时间的任务放在同一块，复用同一棵搜索树。 Group jobs by start station and time for search-tree reuse
+    order = np.lexsort((table[:, 5], table[:, 1], table[:, 0]))
+    chunks = [order[i:i + chunksize] for i in range(0, len(order), chunksize)]
+
+    latency = np.full(len(table), math.inf)
+    hops = np.zeros(len(table), dtype=np.int64)
+    success = np.zeros(len(table), dtype=bool)
+
+    block, layout = share_arrays(arrays)
+    try:
+        if processes <= 1:
+            _init_worker(block.name, layout, router_options, propagator)
+            try:
+                _collect(map(_run_chunk, chunks), latency, hops, success)
+            finally:
+                worker_block = _worker.pop("block")
+                _worker.clear()  # 先释放对共享内存的引用。 Drop the views before closing the block
+                worker_block.close()
+        else:
+            with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(block.name, layout, router_options, propagator)) as pool:
+                _collect(pool.imap_unordered(_run_chunk, chunks), latency, hops, success)
+    finally:
+        block.close()
+        block.unlink()
+    return latency, hops, success
+
+
+def _collect(results, latency, hops, success):
+    for rows, chunk_latency, chunk_hops, chunk_success in results:
+        latency[rows], hops[rows], success[rows] = chunk_latency, chunk_hops, chunk_success
@@ -0,0 +1,792 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from instrumentation import metrics
+
+# 各模块在不同规模下的性能基准，结果保存为 JSON 以便跨提交比较。
+# Scaling benchmarks of the simulation modules; results are saved as JSON so runs can be compared across commits.
+#
+#   python benchmarks.py                                  # all cases, default sizes -> benchmark_results.json
+#   python benchmarks.py --quick --cases propagation coverage
+#   python benchmarks.py --output new.json --compare old.json
+#
+# Every case is built from a fixed seed, so two runs on the same commit time exactly the same work.
+# A case with a fast path also runs the reference implementation on the same input and reports the error;
+# the runner exits with status 1 when an accuracy check fails.
+
+CASES = {}
+
+
+class BenchmarkCase:
+    def __init__(self, name, setup, sizes, quick_sizes, unit, max_repeat=None):
+        """
+        :param setup: setup(size, rng) -> dict with
+                      "run": callable timed by the runner (its last return value is checked),
+                      optional "reference": callable computing the same thing with the reference implementation,
+                      optional "error": error(result, reference_result) -> float,
+                      optional "tolerance": largest accepted error (default 0),
+                      optional "reference_size": number of items the reference computes (default: size),
+                      optional "reference_repeat": cap on the reference's repetitions
+        :param unit: what `size` counts, e.g. "satellites"
+        :param max_repeat: cap on the repetitions for slow cases
+        """
+        self.name = name
+        self.setup = setup
+        self.sizes = sizes
+        self.quick_sizes = quick_sizes
+        self.unit = unit
+        self.max_repeat = max_repeat
+
+
+def benchmark(name, sizes, quick_sizes, unit, max_repeat=None):
+    def register(setup):
+        CASES[name] = BenchmarkCase(name, setup, sizes, quick_sizes, unit, max_repeat)
+        return setup
+    return register
+
+
+def _time(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+# 随机星座参数 (每个轨道的高度不同, 卫星名字不重复)。 Random constellation parameters with distinct orbit heights
+def _constellation_parameters(size, rng, per_orbit=50):
+    from satallite2 import EARTH_RADIUS
+
+    num_orbits = max(1, size // per_orbit)
+    counts = np.full(num_orbits, size // num_orbits)
+    counts[:size % num_orbits] += 1
+    heights = np.linspace(500.0, 2500.0, num_orbits) + rng.uniform(0, 1, num_orbits)
+    return (counts.tolist(), heights.tolist(), [7.0] * num_orbits, 1000.0,
+            rng.uniform(0, math.pi, num_orbits).tolist(),
+            (EARTH_RADIUS * np.arccos(EARTH_RADIUS / (EARTH_RADIUS + heights))).tolist(),
+            rng.uniform(0.0005, 0.002, num_orbits).tolist())
+
+
+@benchmark("propagation", sizes=(1000, 10000, 100000), quick_sizes=(1000, 10000), unit="satellites")
+def _propagation(size, rng):
+    from satallite2 import create_constellation, create_orbiting_satellites
+
+    parameters = _constellation_parameters(size, rng)
+    constellation = create_constellation(*parameters)
+    orbits = create_orbiting_satellites(*parameters)
+
+    def run():
+        constellation.move(0.5)
+        return constellation.position_3d.copy()
+
+    def reference():
+        for orbit in orbits:
+            for satellite in orbit:
+                satellite.move(0.5)
+        return np.array([satellite.position_3d for orbit in orbits for satellite in orbit])
+
+    return {"run": run, "reference": reference, "tolerance": 1e-6,
+            "error": lambda result, expected: float(np.max(np.abs(result - expected), initial=0.0))}
+
+
+@benchmark("orbit_propagation", sizes=(1000, 10000, 100000), quick_sizes=(1000, 10000), unit="satellites")
+def _orbit_propagation(size, rng):
+    from propagators import J2Propagator, OrbitalElements
+
+    elements = OrbitalElements(rng.uniform(6800.0, 8000.0, size), rng.uniform(0.0, 0.05, size), rng.uniform(0.0, math.pi, size),
+                               rng.uniform(0.0, 2 * math.pi, size), rng.uniform(0.0, 2 * math.pi, size),
+                               rng.uniform(0.0, 2 * math.pi, size), rng.uniform(-600.0, 0.0, size))
+    propagator = J2Propagator(elements, earth_rotation=False)
+    rates = (propagator.raan_rate, propagator.arg_perigee_rate, propagator.mean_anomaly_rate)
+    checked = min(size, 1000)
+    t = 5400.0
+
+    def run():
+        return propagator.positions(t)
+
+    def reference():
+        # 逐颗卫星的标量公式。 Scalar formula, one satellite at a time
+        position_3d = np.empty((checked, 3))
+        for k in range(checked):
+            dt = t - elements.epoch[k]
+            e, i = elements.eccentricity[k], elements.inclination[k]
+            raan = elements.raan[k] + rates[0][k] * dt
+            arg_perigee = elements.arg_perigee[k] + rates[1][k] * dt
+            mean_anomaly = (elements.mean_anomaly[k] + rates[2][k] * dt) % (2 * math.pi)
+            anomaly = mean_anomaly
+            for _ in range(50):
+                anomaly -= (anomaly - e * math.sin(anomaly) - mean_anomaly) / (1 - e * math.cos(anomaly))
+            a = elements.semi_major_axis[k]
+            true_anomaly = 2 * math.atan2(math.sqrt(1 + e) * math.sin(anomaly / 2), math.sqrt(1 - e) * math.cos(anomaly / 2))
+            r, u = a * (1 - e * math.cos(anomaly)), arg_perigee + true_anomaly
+            position_3d[k] = (r * (math.cos(raan) * math.cos(u) - math.sin(raan) * math.sin(u) * math.cos(i)),
+                              r * (math.sin(raan) * math.cos(u) + math.cos(raan) * math.sin(u) * math.cos(i)),
+                              r * math.sin(u) * math.sin(i))
+        return position_3d
+
+    return {"run": run, "reference": reference, "reference_size": checked, "tolerance": 1e-6,
+            "error": lambda result, expected: float(np.max(np.abs(result[:checked] - expected), initial=0.0))}
+
+
+@benchmark("ephemeris_lookup", sizes=(1000, 10000, 100000), quick_sizes=(1000, 10000), unit="satellites")
+def _ephemeris_lookup(size, rng):
+    from satallite2 import create_constellation
+
+    # 少数几个壳层 (同高度同倾角的轨道共享一张表)。 A few shells, each shared by many orbits
+    counts, heights, speeds, communication_radius, inclinations, coverage_radius, angular_velocities = _constellation_parameters(size, rng)
+    shell = np.arange(len(counts)) % 4
+    parameters = (counts, np.array(heights)[shell].tolist(), speeds, communication_radius, np.array(inclinations)[shell].tolist(),
+                  np.array(coverage_radius)[shell].tolist(), np.array(angular_velocities)[shell].tolist())
+    constellation = create_constellation(*parameters)
+    constellation.use_ephemeris()
+    exact = create_constellation(*parameters)
+
+    def run():
+        constellation.move(0.5)
+        return np.concatenate((constellation.position_3d, constellation.lat_lon), axis=1)
+
+    def reference():
+        exact.move(0.5)
+        return np.concatenate((exact.position_3d, exact.lat_lon), axis=1)
+
+    def error(result, expected):
+        difference = np.abs(result - expected)
+        difference[:, 4] = np.minimum(difference[:, 4], 360.0 - difference[:, 4])  # ±180 是同一经度。 ±180 is one longitude
+        if np.any(np.abs(result[:, 4]) > 180.0):  # 经度必须和 compute_lat_lons 一样在 [-180, 180] 内。 Same range as compute_lat_lons
+            return math.inf
+        return float(np.max(difference, initial=0.0))
+
+    return {"run": run, "reference": reference, "tolerance": 1e-3, "error": error}
+
+
+@benchmark("parameter_sweep", sizes=(10, 100, 1000), quick_sizes=(10, 100), unit="configurations", max_repeat=3)
+def _parameter_sweep(size, rng):
+    from satallite import EARTH_PERIMETER, Node, Satellite, find_covering_satellite
+    from sweep import CONFIG_COLUMNS, SWEEP_COLUMNS, run_sweep
+
+    configs = np.column_stack((rng.integers(2, 40, size), rng.uniform(500.0, 2500.0, size), rng.uniform(0.03, 0.1, size),
+                               rng.uniform(1000.0, 6000.0, size))).reshape(-1, len(CONFIG_COLUMNS))
+    checked = min(size, 2)
+    samples = 4000
+    coverage = SWEEP_COLUMNS.index("coverage_fraction")
+
+    def run():
+        return run_sweep(configs, processes=1)[:, coverage]
+
+    def reference():
+        # 逐步移动 Satellite 对象并检查覆盖。 Step Satellite objects and test coverage
+        station = Node("GroundStation", [0, 0])
+        fractions = []
+        for num_satellites, orbit_height, speed, communication_radius in configs[:checked]:
+            num_satellites = int(num_satellites)
+            satellites = [Satellite(f"Satellite{i}", [i * EARTH_PERIMETER / num_satellites, 500], speed, orbit_height,
+                                    communication_radius, 2 * math.pi * i / num_satellites) for i in range(num_satellites)]
+            step = EARTH_PERIMETER / speed / samples
+            covered = 0
+            for _ in range(samples):
+                covered += find_covering_satellite(station, satellites) is not None
+                for satellite in satellites:
+                    satellite.move(step)
+            fractions.append(covered / samples)
+        return np.array(fractions)
+
+    return {"run": run, "reference": reference, "reference_size": checked, "reference_repeat": 1, "tolerance": 2e-3,
+            "error": lambda result, expected: float(np.max(np.abs(result[:checked] - expected), initial=0.0))}
+
+
+@benchmark("coverage", sizes=(1000, 5000, 20000), quick_sizes=(1000, 5000), unit="satellites")
+def _coverage(size, rng):
+    from coverage_index import CoverageIndex
+    from satallite2 import Station, create_constellation, create_orbiting_satellites, find_covering_satellite
+
+    parameters = _constellation_parameters(size, rng)
+    constellation = create_constellation(*parameters)
+    orbits = create_orbiting_satellites(*parameters)
+    index_of = {id(satellite): k for k, satellite in enumerate(itertools.chain.from_iterable(orbits))}
+    stations = [Station(f"Station{k}", [lat, lon]) for k, (lat, lon) in
+                enumerate(zip(rng.uniform(-60, 60, 100), rng.uniform(-180, 180, 100)))]
+
+    def run():
+        index = CoverageIndex(constellation)
+        return [getattr(index.find_covering_satellite(station), "_index", -1) for station in stations]
+
+    def reference():
+        return [index_of.get(id(find_covering_satellite(station, orbits)), -1) for station in stations]
+
+    return {"run": run, "reference": reference,
+            "error": lambda result, expected: float(np.mean(np.array(result) != np.array(expected)))}
+
+
+# 相遇概率的参数组 (均值、方差都在示例数据附近)。 Encounter parameter sets around the example data
+def _encounter_parameters(size, rng):
+    mean_a, mean_b = rng.uniform(8, 12, size), rng.uniform(12, 18, size)
+    variance_a, variance_b = rng.uniform(1, 4, size), rng.uniform(1, 4, size)
+    return mean_a, variance_a, mean_b, variance_b
+
+
+@benchmark("encounter_segment", sizes=(1, 1000, 100000), quick_sizes=(1, 1000), unit="parameter sets")
+def _encounter_segment(size, rng):
+    from TPD_4_2 import encounter_probability_segment
+
+    parameters = _encounter_parameters(size, rng) + (rng.uniform(3, 8, size), rng.uniform(3, 8, size))
+
+    def run():
+        return encounter_probability_segment(*parameters)
+
+    # 参考实现每组参数要几十秒，只核对第一组。 The reference takes tens of seconds per parameter set, so only the first is checked
+    def reference():
+        return np.array([encounter_probability_segment(*(value[0] for value in parameters), method="reference")])
+
+    return {"run": run, "reference": reference, "reference_size": 1, "reference_repeat": 1, "tolerance": 1e-8,
+            "error": lambda result, expected: float(np.max(np.abs(result[:len(expected)] - expected)))}
+
+
+@benchmark("encounter_intersection", sizes=(1, 1000, 100000), quick_sizes=(1, 1000), unit="parameter sets")
+def _encounter_intersection(size, rng):
+    from TPD_4_2 import encounter_probability_intersection, encounter_probability_intersection_batch
+
+    parameters = _encounter_parameters(size, rng) + (rng.uniform(3, 8, size), rng.uniform(5, 20, size), rng.uniform(0.3, 1.0, size))
+
+    def run():
+        return encounter_probability_intersection_batch(*parameters)
+
+    def reference():
+        return np.array([encounter_probability_intersection(*(value[0] for value in parameters), method="reference")])
+
+    return {"run": run, "reference": reference, "reference_size": 1, "reference_repeat": 1, "tolerance": 1e-8,
+            "error": lambda result, expected: float(np.max(np.abs(result[:len(expected)] - expected)))}
+
+
+@benchmark("encounter_table", sizes=(1000, 100000, 1000000), quick_sizes=(1000, 100000), unit="parameter sets")
+def _encounter_table(size, rng):
+    from encounter_table import EncounterTable
+    from TPD_4_2 import X_MAX, encounter_probability_segment_cdf
+
+    # 只覆盖基准参数范围的小表 (构建约几秒，不计入计时)。 A small table over the benchmark's parameter ranges, built untimed
+    table = EncounterTable.build({"mean_a": (8, 12, 5), "variance_a": (1, 4, 4), "mean_b": (12, 18, 5), "variance_b": (1, 4, 4)})
+    parameters = _encounter_parameters(size, rng) + (rng.uniform(3, 8, size), rng.uniform(3, 8, size))
+    checked = min(size, 10000)
+
+    def run():
+        return table.segment(*parameters)
+
+    def reference():
+        return encounter_probability_segment_cdf(*(value[:checked] for value in parameters))
+
+    return {"run": run, "reference": reference, "reference_size": checked, "reference_repeat": 1,
+            "tolerance": 2 * table.error_bound / X_MAX,
+            "error": lambda result, expected: float(np.max(np.abs(result[:len(expected)] - expected)))}
+
+
+# 随机路径：每条路径 2 到 10 段，段的均值和方差按 offsets 展平。 Random paths of 2-10 segments, flattened with offsets
+def _paths(size, rng):
+    lengths = rng.integers(2, 11, size)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    return rng.uniform(5, 30, offsets[-1]), rng.uniform(0.5, 10, offsets[-1]), offsets
+
+
+@benchmark("arrival_sampling", sizes=(1000, 100000, 1000000), quick_sizes=(1000, 100000), unit="paths")
+def _arrival_sampling(size, rng):
+    from scipy.stats import gamma
+
+    from TPD_4_1 import arrival_time_prediction, end_to_end_travel_time, end_to_end_travel_time_batch, sample_arrival_times
+
+    means, variances, offsets = _paths(size, rng)
+    seed = int(rng.integers(2 ** 32))
+    checked = min(size, 1000)
+
+    def run():
+        kappa, theta = end_to_end_travel_time_batch(means, variances, offsets)
+        return kappa, theta, sample_arrival_times(5.0, kappa, theta, rng=seed)
+
+    def reference():
+        samples = []
+        for k in range(checked):
+            kappa, theta = end_to_end_travel_time(means[offsets[k]:offsets[k + 1]].tolist(), variances[offsets[k]:offsets[k + 1]].tolist())
+            samples.append(arrival_time_prediction(5.0, gamma.rvs(a=kappa, scale=theta)))
+        return np.array(samples)
+
+    def error(result, expected):
+        # 随机样本无法逐个比较：检查标准化残差的均值是否在 5 个标准误差以内。
+        # Samples cannot be compared one by one: check the mean standardized residual (in standard errors)
+        kappa, theta, samples = result
+        residual = (samples - 5.0 - kappa * theta) / (np.sqrt(kappa) * theta)
+        return float(abs(residual.mean()) * np.sqrt(len(residual)))
+
+    return {"run": run, "reference": reference, "reference_size": checked, "reference_repeat": 1,
+            "error": error, "tolerance": 5.0}
+
+
+@benchmark("arrival_quantiles", sizes=(1000, 100000, 1000000), quick_sizes=(1000, 100000), unit="paths")
+def _arrival_quantiles(size, rng):
+    from scipy.stats import gamma
+
+    from TPD_4_1 import arrival_time_quantiles, end_to_end_travel_time_batch
+
+    means, variances, offsets = _paths(size, rng)
+    q = np.array([0.05, 0.5, 0.95])
+    checked = min(size, 1000)
+
+    def run():
+        kappa, theta = end_to_end_travel_time_batch(means, variances, offsets)
+        return arrival_time_quantiles(5.0, kappa, theta, q)
+
+    def reference():
+        kappa, theta = end_to_end_travel_time_batch(means[:offsets[checked]], variances[:offsets[checked]], offsets[:checked + 1])
+        return np.array([5.0 + gamma.ppf(q, kappa[k], scale=theta[k]) for k in range(checked)])
+
+    return {"run": run, "reference": reference, "reference_size": checked, "reference_repeat": 1, "tolerance": 1e-9,
+            "error": lambda result, expected: float(np.max(np.abs(result[:checked] - expected) / expected))}
+
+
+# 随机相遇信息 (与 simulate_encounter_graph 的格式相同)。 Random encounter data in the format of simulate_encounter_graph
+def _encounter_network(size, rng, degree=8):
+    vehicles = [f"v{k}" for k in range(size)]
+    sources = np.repeat(np.arange(size), degree)
+    targets = rng.integers(0, size, size * degree)
+    times = np.round(rng.uniform(0, 20, size * degree), 3)
+    probs = np.round(rng.uniform(0, 1, size * degree), 3)
+    encounter_times, encounter_probs = {}, {}
+    for i, j, t, p in zip(sources.tolist(), targets.tolist(), times.tolist(), probs.tolist()):
+        if i != j and (vehicles[i], vehicles[j]) not in encounter_probs:
+            encounter_times.setdefault(vehicles[i], []).append((vehicles[j], t))
+            encounter_probs[(vehicles[i], vehicles[j])] = p
+    for vehicle in vehicles:
+        encounter_times.setdefault(vehicle, [])
+    return vehicles, encounter_times, encounter_probs
+
+
+@benchmark("predict_encounter", sizes=(1000, 10000, 100000), quick_sizes=(1000, 10000), unit="vehicles")
+def _predict_encounter(size, rng):
+    from TPD_4_3 import PredictedEncounterGraph, VehicleNode
+
+    vehicles, encounter_times, encounter_probs = _encounter_network(size, rng)
+    threshold = 0.5
+    # 从可扩展邻居最多的车辆出发，避免源车辆孤立。 Start from the vehicle with the most usable encounters
+    source = max(vehicles, key=lambda v: sum(encounter_probs[(v, u)] >= threshold for u, _ in encounter_times[v]))
+    destination = vehicles[-1]
+
+    def run():
+        peg = PredictedEncounterGraph(threshold=threshold, ttl=15.0)
+        peg.graph[source] = VehicleNode(source, 0)
+        graph = peg.predict_encounter(source, destination, vehicles, encounter_times, encounter_probs)
+        return len(graph)
+
+    return {"run": run}
+
+
+@benchmark("predict_encounter_compact", sizes=(1000, 100000, 300000), quick_sizes=(1000, 100000), unit="vehicles",
+           max_repeat=3)
+def _predict_encounter_compact(size, rng):
+    from TPD_4_3 import CompactPredictedEncounterGraph, EncounterCSR, PredictedEncounterGraph, VehicleNode
+
+    vehicles, encounter_times, encounter_probs = _encounter_network(size, rng)
+    encounters = EncounterCSR.from_dicts(vehicles, encounter_times, encounter_probs)
+    threshold, ttl = 0.5, 15.0
+    source = max(vehicles, key=lambda v: sum(encounter_probs[(v, u)] >= threshold for u, _ in encounter_times[v]))
+    destination = vehicles[-1]
+
+    def edges(graph):
+        return sorted((vehicle, child.vehicle_id, child.expected_encounter_time)
+                      for vehicle, node in graph.items() for child in node.children)
+
+    def run():
+        peg = CompactPredictedEncounterGraph(threshold=threshold, ttl=ttl)
+        return peg.predict_encounter(source, destination, encounters)
+
+    def reference():
+        peg = PredictedEncounterGraph(threshold=threshold, ttl=ttl)
+        peg.graph[source] = VehicleNode(source, 0)
+        return peg.predict_encounter(source, destination, vehicles, encounter_times, encounter_probs)
+
+    return {"run": run, "reference": reference, "reference_size": size, "reference_repeat": 1,
+            "error": lambda result, expected: float(edges(result.to_graph()) != edges(expected)), "tolerance": 0}
+
+
+@benchmark("encounter_tree_update", sizes=(1000, 10000, 100000), quick_sizes=(1000, 10000), unit="vehicles")
+def _encounter_tree_update(size, rng):
+    from TPD_4_3 import IncrementalEncounterTree
+
+    vehicles, encounter_times, encounter_probs = _encounter_network(size, rng)
+    pairs = list(encounter_probs)
+    tree = IncrementalEncounterTree(vehicles[0], threshold=0.5, ttl=15.0)
+    tree.update(encounter_times, encounter_probs)
+
+    def run():
+        # 每次刷新 1% 的相遇预测 (新的时间和概率)。 Every refresh changes 1% of the predictions
+        changed = [pairs[k] for k in rng.choice(len(pairs), max(1, len(pairs) // 100), replace=False)]
+        times, probs = {}, {}
+        for (u, v), t, p in zip(changed, np.round(rng.uniform(0, 20, len(changed)), 3).tolist(),
+                                np.round(rng.uniform(0, 1, len(changed)), 3).tolist()):
+            times.setdefault(u, []).append((v, t))
+            probs[(u, v)] = encounter_probs[(u, v)] = p
+            encounter_times[u] = [(w, t if w == v else old) for w, old in encounter_times[u]]
+        tree.update(times, probs)
+        return tree
+
+    def reference():
+        rebuilt = IncrementalEncounterTree(vehicles[0], threshold=0.5, ttl=15.0)
+        rebuilt.update(encounter_times, encounter_probs)
+        return rebuilt
+
+    return {"run": run, "reference": reference, "reference_repeat": 1,
+            "error": lambda result, expected: float(result.arrival != expected.arrival), "tolerance": 0}
+
+
+@benchmark("encounter_queries", sizes=(100, 1000, 10000), quick_sizes=(100, 1000), unit="queries")
+def _encounter_queries(size, rng):
+    from encounter_queries import EncounterQueryEngine
+    from TPD_4_3 import CompactPredictedEncounterGraph, EncounterCSR
+
+    vehicles, encounter_times, encounter_probs = _encounter_network(20000, rng)
+    encounters = EncounterCSR.from_dicts(vehicles, encounter_times, encounter_probs)
+    # 调度器的一个时刻：少量源车辆发出大量查询。 One dispatcher tick: many queries from a few sources
+    sources = rng.choice(encounters.num_vehicles, size)
+    sources = rng.choice(sources[:16], size)
+    destinations = rng.choice(encounters.num_vehicles, size)
+    engine = EncounterQueryEngine(encounters, threshold=0.5, ttl=15.0, processes=1)
+    checked = min(size, 100)
+
+    def run():
+        engine.set_feed(encounters)  # 每个时刻是一个新的数据版本。 Every tick is a new feed version
+        return engine.query_many(sources, destinations)
+
+    def reference():
+        times = np.empty(checked)
+        for k in range(checked):
+            tree = CompactPredictedEncounterGraph(0.5, 15.0).predict_encounter(sources[k], destinations[k], encounters)
+            times[k] = tree.time[destinations[k]]
+        return times
+
+    def error(result, expected):
+        result = result[:checked]
+        return float(np.sum(~((result == expected) | (np.isnan(result) & np.isnan(expected)))))
+
+    return {"run": run, "reference": reference, "reference_size": checked, "reference_repeat": 1,
+            "error": error, "tolerance": 0}
+
+
+@benchmark("simulation_service", sizes=(10, 100, 1000), quick_sizes=(10, 100), unit="requests", max_repeat=3)
+def _simulation_service(size, rng):
+    import asyncio
+
+    from satallite2 import Station, create_constellation
+    from simulation_service import SimulationService
+
+    parameters = _constellation_parameters(1000, rng)
+    # 回放的流量来自固定的一组地面站。 Replayed traffic comes from a fixed set of ground stations
+    sites = rng.uniform((-60.0, -180.0), (60.0, 180.0), (8, 2))
+    stations = sites[rng.integers(0, len(sites), (size, 2))]
+    departures = rng.uniform(0.0, 25.0, size)
+    checked = min(size, 10)
+
+    async def serve(requests):
+        service = SimulationService(create_constellation(*parameters), tick=0.5)
+        runner = asyncio.create_task(service.run())
+        routes = await asyncio.gather(*(service.transfer(Station("start", start), Station("target", target), at=departure)
+                                        for (start, target), departure in requests))
+        service.stop()
+        await runner
+        return np.array([route.arrival_time if route.delivered else np.nan for route in routes])
+
+    def run():
+        # 所有请求共用一个时钟，每个时间步只移动一次星座。 One shared clock, one propagation per tick
+        return asyncio.run(serve(list(zip(stations, departures))))
+
+    def reference():
+        # 每个请求单独模拟 (各自移动星座)。 Every request simulated on its own, propagating its own constellation
+        return np.concatenate([asyncio.run(serve([(stations[k], departures[k])])) for k in range(checked)])
+
+    def error(result, expected):
+        result = result[:checked]
+        return float(np.sum(~(np.isclose(result, expected) | (np.isnan(result) & np.isnan(expected)))))
+
+    return {"run": run, "reference": reference, "reference_size": checked, "reference_repeat": 1,
+            "error": error, "tolerance": 0}
+
+
+# 随机网格城市地图。 Random grid city map
+def _grid_city_map(size, rng):
+    from TSF_display import CityMap
+
+    side = max(2, int(round(math.sqrt(size))))
+    city_map = CityMap()
+    city_map.graph.add_nodes_from(range(side * side))
+    for row in range(side):
+        for column in range(side):
+            node = row * side + column
+            for neighbour in ([node + 1] if column + 1 < side else []) + ([node + side] if row + 1 < side else []):
+                length = float(rng.uniform(300, 800))
+                city_map.add_edge(node, neighbour, length=length, arrival_rate=float(rng.uniform(0.02, 0.08)),
+                                  average_travel_time=length / float(rng.uniform(11, 22)), var=float(rng.uniform(2, 4)))
+    return city_map, 0, side * side - 1
+
+
+@benchmark("edge_delay_table", sizes=(400, 10000, 100000), quick_sizes=(400, 10000), unit="intersections")
+def _edge_delay_table(size, rng):
+    from TSF_display import Car, compute_link_packet_delay
+
+    city_map, _, _ = _grid_city_map(size, rng)
+    car = Car(speed=15, communication_range=100)
+    city_map.delay_table(car)
+    edges = city_map.edge_nodes
+
+    def run():
+        # 交通数据刷新 1% 的车辆到达率。 The traffic feed refreshes 1% of the arrival rates
+        changed = [edges[k] for k in rng.choice(len(edges), max(1, len(edges) // 100), replace=False)]
+        city_map.update_edges(changed, arrival_rate=rng.uniform(0.02, 0.08, len(changed)))
+        return city_map.delay_table(car).packet_mean.copy()
+
+    def reference():
+        return np.array([compute_link_packet_delay(car, city_map.graph[node1][node2]['length'],
+                                                   city_map.graph[node1][node2]['arrival_rate'])[0] for node1, node2 in edges])
+
+    return {"run": run, "reference": reference, "reference_repeat": 1, "tolerance": 1e-9,
+            "error": lambda result, expected: float(np.max(np.abs(result - expected) / expected))}
+
+
+# 随机网格路网的边列 (不经过 networkx)。 Edge columns of a random grid road network, without networkx
+def _grid_edges(size, rng):
+    side = max(2, int(round(math.sqrt(size))))
+    node = np.arange(side * side).reshape(side, side)
+    node1 = np.concatenate((node[:, :-1].ravel(), node[:-1, :].ravel()))
+    node2 = np.concatenate((node[:, 1:].ravel(), node[1:, :].ravel()))
+    length = rng.uniform(300, 800, len(node1))
+    return {"node1": node1, "node2": node2, "length": length, "arrival_rate": rng.uniform(0.02, 0.08, len(node1)),
+            "average_travel_time": length / rng.uniform(11, 22, len(node1)), "var": rng.uniform(2, 4, len(node1))}
+
+
+@benchmark("city_map_load", sizes=(10000, 100000, 1000000), quick_sizes=(10000, 100000), unit="intersections")
+def _city_map_load(size, rng):
+    from TSF_display import ArrayCityMap, Car, CityMap
+
+    edges = _grid_edges(size, rng)
+    directory = tempfile.TemporaryDirectory()
+    ArrayCityMap.from_edges(**edges).save(directory.name)
+    car = Car(speed=15, communication_range=100)
+    checked = min(size, 100000)
+    checked_edges = np.flatnonzero(np.maximum(edges["node1"], edges["node2"]) < checked)
+
+    def run():
+        # 内存映射加载并计算延迟表。 Memory-mapped load plus the delay table
+        city_map = ArrayCityMap.load(directory.name)
+        return city_map.delay_table(car).packet_mean
+
+    def reference():
+        # networkx 地图逐边构建 (只构建前 checked 个路口)。 networkx map built edge by edge (first `checked` intersections)
+        city_map = CityMap()
+        for k in checked_edges.tolist():
+            city_map.add_edge(int(edges["node1"][k]), int(edges["node2"][k]),
+                              **{name: float(edges[name][k]) for name in ("length", "arrival_rate", "average_travel_time", "var")})
+        return city_map.delay_table(car).packet_mean[:city_map.num_edges]
+
+    return {"run": run, "reference": reference, "reference_size": checked, "reference_repeat": 1,
+            "error": lambda result, expected: float(np.max(np.abs(result[checked_edges] - expected)))}
+
+
+@benchmark("snapshot_load", sizes=(1000, 10000, 100000), quick_sizes=(1000, 10000), unit="satellites")
+def _snapshot_load(size, rng):
+    from satallite2 import create_constellation
+    from snapshot import Snapshot, save_checkpoint
+
+    parameters = _constellation_parameters(size, rng)
+    steps = 100
+    constellation = create_constellation(*parameters)
+    for _ in range(steps):
+        constellation.move(0.5)
+    directory = tempfile.TemporaryDirectory()
+    save_checkpoint(directory.name, constellation, clock=steps * 0.5, step=steps)
+
+    def run():
+        # 内存映射读取保存的状态。 Memory-mapped read of the saved state
+        return np.array(Snapshot.load(directory.name).satellites["lat_lon"])
+
+    def reference():
+        # 重新外推到同一时刻。 Propagate again to the same time
+        replay = create_constellation(*parameters)
+        for _ in range(steps):
+            replay.move(0.5)
+        return replay.lat_lon
+
+    return {"run": run, "reference": reference, "reference_repeat": 1,
+            "error": lambda result, expected: float(np.max(np.abs(result - expected), initial=0.0))}
+
+
+@benchmark("find_optimal_path", sizes=(16, 400, 2500), quick_sizes=(16, 400), unit="intersections")
+def _find_optimal_path(size, rng):
+    from TSF_display import Car, compute_edge_delays, find_optimal_path, path_success_probability
+
+    city_map, source, destination = _grid_city_map(size, rng)
+    car = Car(speed=15, communication_range=100)
+    delays = compute_edge_delays(city_map, car)
+
+    def probability(path):
+        return path_success_probability(*np.sum([delays[edge] for edge in zip(path, path[1:])], axis=0))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return find_optimal_path(city_map, car, source, destination, method="labels")
+
+    def reference():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return find_optimal_path(city_map, car, source, destination, method="enumerate")
+
+    # 标签搜索找到的路径不应比枚举前 100 条路径的结果差。 The label search must not do worse than the 100-path enumeration
+    return {"run": run, "reference": reference, "reference_repeat": 1,
+            "error": lambda result, expected: max(0.0, float(probability(expected) - probability(result)))}
+
+
+# 随机的小地图 (路口之间随机连边), 可以枚举全部简单路径。 Small random maps whose simple paths can all be enumerated
+def _random_city_map(rng, num_nodes=8, edge_probability=0.5):
+    from TSF_display import CityMap
+
+    city_map = CityMap()
+    city_map.graph.add_nodes_from(range(num_nodes))
+    for node1, node2 in itertools.combinations(range(num_nodes), 2):
+        if rng.random() < edge_probability:
+            length = float(rng.uniform(100, 4000))
+            city_map.add_edge(node1, node2, length=length, arrival_rate=float(rng.uniform(0.002, 0.2)),
+                              average_travel_time=length / float(rng.uniform(3, 30)), var=3.0)
+    return city_map
+
+
+@benchmark("find_best_paths_exact", sizes=(50, 300), quick_sizes=(50,), unit="maps", max_repeat=1)
+def _find_best_paths_exact(size, rng):
+    import networkx as nx
+    from TSF_display import Car, compute_edge_delays, find_best_paths, path_success_probability
+
+    k = 3
+    cases = []
+    while len(cases) < size:
+        city_map = _random_city_map(rng)
+        if nx.has_path(city_map.graph, 0, 7):
+            cases.append((city_map, Car(speed=float(rng.uniform(5, 30)), communication_range=float(rng.uniform(20, 300)))))
+
+    def run():
+        return [[probability for _, probability in find_best_paths(city_map, car, 0, 7, k=k, max_labels=None)]
+                for city_map, car in cases]
+
+    def reference():
+        best = []
+        for city_map, car in cases:
+            delays = compute_edge_delays(city_map, car)
+            probabilities = [float(path_success_probability(*np.sum([delays[edge] for edge in zip(path, path[1:])], axis=0)))
+                             for path in nx.all_simple_paths(city_map.graph, 0, 7)]
+            best.append(sorted(probabilities, reverse=True)[:k])
+        return best
+
+    # 不限标签数时应与枚举全部简单路径的前 k 个结果一致。 Without a label budget the k best must match full enumeration
+    return {"run": run, "reference": reference, "reference_repeat": 1, "tolerance": 1e-9,
+            "error": lambda result, expected: max(float(np.max(np.abs(np.subtract(found, best)), initial=0.0))
+                                                  if len(found) == len(best) else math.inf
+                                                  for found, best in zip(result, expected))}
+
+
+def run_case(case, size, repeat, seed, check=True):
+    """
+    Time one case at one size.
+    :return: result record (seconds of every repetition, best / median, accuracy against the reference, counters)
+    """
+    rng = np.random.default_rng([seed, size])
+    spec = case.setup(size, rng)
+    repeat = min(repeat, case.max_repeat or repeat)
+
+    metrics.reset()
+    times, result = _time(spec["run"], repeat)
+    record = {"case": case.name, "size": size, "unit": case.unit, "repeat": repeat, "seconds": times,
+              "best": min(times), "median": statistics.median(times), "counters": dict(metrics.counters)}
+
+    if check and "reference" in spec:
+        reference_times, expected = _time(spec["reference"], min(repeat, spec.get("reference_repeat", repeat)))
+        error = spec["error"](result, expected)
+        # 每个元素的耗时之比 (参考实现可能只算了一部分)。 Per-item time ratio, as the reference may compute fewer items
+        reference_size = spec.get("reference_size", size)
+        record.update(reference_best=min(reference_times), reference_size=reference_size,
+                      speedup=(min(reference_times) / reference_size) / max(min(times) / size, 1e-12),
+                      error=error, ok=bool(error <= spec.get("tolerance", 0.0)))
+    return record
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, quick=False, repeat=3, seed=0, check=True, stream=sys.stdout):
+    """
+    Run the selected cases (default: all) at their default (or quick) sizes.
+    :return: report dict as written to the JSON file
+    """
+    results = []
+    for name in names or CASES:
+        case = CASES[name]
+        for size in case.quick_sizes if quick else case.sizes:
+            record = run_case(case, size, repeat, seed, check)
+            results.append(record)
+            line = f"{name:<24} {size:>8} {case.unit:<16} best {record['best']:.6f}s  median {record['median']:.6f}s"
+            if "error" in record:
+                line += f"  speedup {record['speedup']:.1f}x  error {record['error']:.3g}{'' if record['ok'] else '  FAILED'}"
+            print(line, file=stream, flush=True)
+    return {"commit": _git_commit(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "seed": seed, "quick": quick,
+            "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "results": results}
+
+
+def compare(report, baseline, threshold=1.25, stream=sys.stdout):
+    """
+    Print the time ratio (new / old, by best time) of every (case, size) present in both reports.
+    :return: list of (case, size, ratio) slower than `threshold`
+    """
+    old = {(record["case"], record["size"]): record for record in baseline["results"]}
+    regressions = []
+    print(f"\ncompared with {baseline.get('commit') or 'baseline'}:", file=stream)
+    for record in report["results"]:
+        key = (record["case"], record["size"])
+        if key not in old:
+            continue
+        ratio = record["best"] / max(old[key]["best"], 1e-12)
+        if ratio > threshold:
+            regressions.append((key[0], key[1], ratio))
+        print(f"{key[0]:<24} {key[1]:>8}  {old[key]['best']:.6f}s -> {record['best']:.6f}s  x{ratio:.2f}"
+              f"{'  SLOWER' if ratio > threshold else ''}", file=stream)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks of the satellite / vehicle simulation modules")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="cases to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="use the smaller quick sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per size (slow cases run once)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-check", action="store_true", help="skip the reference implementations")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.cases, args.quick, args.repeat, args.seed, not args.no_check)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0 if all(record.get("ok", True) for record in report["results"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
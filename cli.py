@@ -0,0 +1,291 @@
+import argparse
+import json
+import math
+import os
+import sys
+
+from instrumentation import _to_json, metrics, tracer
+
+# 命令行入口：每个子命令只导入自己用到的模块，绘图只输出到文件 (Agg 后端，不需要图形界面)。
+# Command-line entry point. Each subcommand imports only the modules it needs, so a short job does not pay for
+# scipy / networkx / matplotlib it never uses; plots are only rendered to files (Agg backend, no display needed).
+#
+#   python cli.py propagate --time 3600 --steps 60 --output positions.npy
+#   python cli.py propagate --time 86400 --steps 172800 --checkpoint run/state --trajectory run/frames --trajectory-every 120
+#   python cli.py propagate --elements shells.tle --propagator j2 --time 86400 --steps 1440 --output positions.npy
+#   python cli.py transfer --start 37.7749 -122.4194 --target 35.0148 114.4222
+#   python cli.py transfer --jobs jobs.csv --processes 8 --output results.csv
+#   python cli.py encounter segment --mean-a 10 --variance-a 2 --mean-b 15 --variance-b 3 --t1-2 5 --t2-1 6
+#   python cli.py route --map city_map/ --source 1 --destination 6 --k 3
+#   python cli.py sweep --satellites 4:40:37 --orbit-heights 500:2500:21 --output sweep.csv
+
+# 示例星座 (与 satallite2.py 的示例相同)。 The example constellation of satallite2.py
+DEFAULT_SATELLITES = [18, 10, 16, 20, 15]
+DEFAULT_ORBIT_HEIGHTS = [2000.0, 2200.0, 2500.0, 2300.0, 2100.0]
+DEFAULT_INCLINATIONS = [30.0, 60.0, 90.0, 120.0, 150.0]
+
+
+def _print(result):
+    print(json.dumps(result, default=_to_json))
+
+
+def _constellation(args):
+    if args.elements:
+        from propagators import OrbitalElements
+        from satallite2 import Constellation
+
+        return Constellation.from_elements(OrbitalElements.load(args.elements), args.communication_radius, args.view_angle,
+                                           args.propagator)
+
+    from satallite2 import EARTH_RADIUS, G, M, create_constellation
+
+    if not len(args.satellites) == len(args.orbit_heights) == len(args.inclinations):
+        raise SystemExit("--satellites, --orbit-heights and --inclinations need one value per orbit")
+    # 与 satallite2.py 示例相同的推导：线速度、角速度和覆盖半径。 Speeds, angular velocities and coverage radii as in the example
+    speeds = [math.sqrt(G * M / ((EARTH_RADIUS + height) * 10 ** 3)) / 1000.0 for height in args.orbit_heights]
+    angular_velocities = [speed / (EARTH_RADIUS + height) for speed, height in zip(speeds, args.orbit_heights)]
+    coverage_radius = [height * math.tan(math.radians(args.view_angle) / 2) for height in args.orbit_heights]
+    return create_constellation(args.satellites, args.orbit_heights, speeds, args.communication_radius,
+                                [math.radians(inclination) for inclination in args.inclinations], coverage_radius, angular_velocities)
+
+
+def _add_constellation_arguments(parser):
+    parser.add_argument("--satellites", type=int, nargs="+", default=DEFAULT_SATELLITES, help="satellites per orbit")
+    parser.add_argument("--orbit-heights", type=float, nargs="+", default=DEFAULT_ORBIT_HEIGHTS, help="km, one per orbit")
+    parser.add_argument("--inclinations", type=float, nargs="+", default=DEFAULT_INCLINATIONS, help="degrees, one per orbit")
+    parser.add_argument("--communication-radius", type=float, default=1000.0, help="inter-satellite range (km)")
+    parser.add_argument("--view-angle", type=float, default=30.0, help="field of view (degrees)")
+    parser.add_argument("--elements", help="orbital elements file (.npz, .csv or TLE) instead of the circular orbits above")
+    parser.add_argument("--propagator", choices=("kepler", "j2"), default="j2", help="propagator for --elements")
+
+
+def _save_table(path, array, header):
+    import numpy as np
+
+    if path.endswith(".npy"):
+        np.save(path, array)
+    else:
+        np.savetxt(path, array, delimiter=",", header=",".join(header), comments="")
+
+
+def propagate(args):
+    import numpy as np
+
+    constellation, first_step, log = _constellation(args), 0, None
+    if args.checkpoint or args.trajectory:
+        from snapshot import Snapshot, TrajectoryLog, save_checkpoint
+
+        if args.checkpoint and (os.path.exists(args.checkpoint) or os.path.exists(args.checkpoint + ".old")):
+            snapshot = Snapshot.load(args.checkpoint)
+            constellation, first_step = snapshot.constellation(), snapshot.step  # 从检查点继续。 Resume from the checkpoint
+        if args.trajectory:
+            log = TrajectoryLog(args.trajectory, constellation, every=args.trajectory_every, resume_step=first_step)
+    step_time = args.time / args.steps if args.steps else 0.0
+    try:
+        for step in range(first_step + 1, args.steps + 1):
+            constellation.move(step_time)
+            if log is not None:
+                log.record(constellation, step * step_time, step)
+            if args.checkpoint and (step % args.checkpoint_every == 0 or step == args.steps):
+                save_checkpoint(args.checkpoint, constellation, clock=step * step_time, step=step)
+    finally:
+        if log is not None:
+            log.close()
+    lat_lon = constellation.lat_lon
+    if args.output:
+        _save_table(args.output, lat_lon, ("lat", "lon"))
+    if args.plot:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        plt.scatter(lat_lon[:, 1], lat_lon[:, 0], s=4, c=constellation.orbit_index)
+        plt.xlabel("longitude")
+        plt.ylabel("latitude")
+        plt.title(f"Sub-points after {args.time:g}")
+        plt.savefig(args.plot)
+        plt.close()
+    _print({"satellites": constellation.size, "time": args.time,
+            "lat_lon": None if args.output else np.round(lat_lon, 6)})
+
+
+def transfer(args):
+    from satallite2 import Station
+
+    constellation = _constellation(args)
+    router_options = {"hop_time": args.hop_time, "slot": args.slot}
+    if args.jobs:
+        import numpy as np
+
+        from batch_transfer import JOB_COLUMNS, simulate_transfers
+
+        table = np.loadtxt(args.jobs, delimiter=",", skiprows=1, ndmin=2).reshape(-1, len(JOB_COLUMNS))
+        jobs = [(Station("start", row[0:2]), Station("target", row[2:4]), row[4], row[5]) for row in table]
+        latency, hops, success = simulate_transfers(constellation, jobs, processes=args.processes, **router_options)
+        results = np.column_stack((latency, hops, success))
+        if args.output:
+            _save_table(args.output, results, ("latency", "hops", "success"))
+        _print({"jobs": len(jobs), "delivered": int(success.sum()),
+                "results": None if args.output else results})
+        return
+
+    from router import Router
+
+    if args.start is None or args.target is None:
+        raise SystemExit("transfer needs --start and --target (or --jobs)")
+    route = Router(constellation, **router_options).route(Station("start", args.start), Station("target", args.target),
+                                                          departure=args.departure)
+    names = constellation.names
+    _print({"delivered": route.delivered, "departure": route.departure, "arrival_time": route.arrival_time,
+            "latency": route.latency if route.delivered else None, "hops": route.hops,
+            "path": [str(names[satellite]) for satellite in route.path]})
+
+
+# 每种相遇位置必须给出的参数。 Arguments each encounter mode requires
+ENCOUNTER_WINDOW_ARGUMENTS = {"segment": ("t1_2", "t2_1"), "intersection": ("ti_5", "R", "Sb")}
+
+
+def encounter(args):
+    common = (args.mean_a, args.variance_a, args.mean_b, args.variance_b)
+    if args.table:
+        from encounter_table import EncounterTable
+
+        table = EncounterTable.load(args.table)
+        if args.where == "segment":
+            prob = table.segment(*common, args.t1_2, args.t2_1)
+        else:
+            prob = table.intersection(*common, args.ti_5, args.R, args.Sb)
+    else:
+        from TPD_4_2 import encounter_probability_intersection, encounter_probability_segment
+
+        if args.where == "segment":
+            prob = encounter_probability_segment(*common, args.t1_2, args.t2_1, method=args.method, tol=args.tol)
+        else:
+            prob = encounter_probability_intersection(*common, args.ti_5, args.R, args.Sb, method=args.method, tol=args.tol)
+    _print({"where": args.where, "probability": float(prob)})
+
+
+def route(args):
+    from TSF_display import ArrayCityMap, Car, build_city_map, find_best_paths
+
+    if args.map:
+        city_map = ArrayCityMap.load(args.map)
+    elif args.edges:
+        city_map = ArrayCityMap.from_csv(args.edges, args.nodes)
+    else:
+        city_map = build_city_map()
+    if args.plot:
+        if not hasattr(city_map, "plot_graph"):
+            raise SystemExit("--plot needs the example map (array maps are not drawn)")
+        city_map.plot_graph(output=args.plot)
+
+    car = Car(speed=args.speed, communication_range=args.communication_range)
+    best_paths = find_best_paths(city_map, car, args.source, args.destination, k=args.k, max_labels=args.max_labels or None)
+    _print({"paths": [{"path": list(path), "probability": probability} for path, probability in best_paths]})
+
+
+def sweep(args):
+    from satallite import Node
+    from sweep import SWEEP_COLUMNS, configurations, parse_values, run_sweep
+
+    configs = configurations(parse_values(args.satellites, integer=True), parse_values(args.orbit_heights),
+                             parse_values(args.speeds), parse_values(args.communication_radii))
+    results = run_sweep(configs, Node("GroundStation", args.station), args.track_offset, processes=args.processes)
+    if args.output:
+        _save_table(args.output, results, SWEEP_COLUMNS)
+    _print({"configurations": len(results),
+            "results": None if args.output else [dict(zip(SWEEP_COLUMNS, row.tolist())) for row in results]})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Satellite transfer and vehicle encounter simulations")
+    parser.add_argument("--trace", help="trace level (off / info / debug / trace), events go to stderr")
+    parser.add_argument("--metrics", help="write the counters and timers to this file at the end (.prom or .json); "
+                        "per-satellite counters need --trace trace")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_propagate = commands.add_parser("propagate", help="move the constellation and report the sub-points")
+    _add_constellation_arguments(parser_propagate)
+    parser_propagate.add_argument("--time", type=float, default=0.0, help="total time to propagate")
+    parser_propagate.add_argument("--steps", type=int, default=1)
+    parser_propagate.add_argument("--output", help="write lat/lon to a .npy or .csv file instead of printing them")
+    parser_propagate.add_argument("--plot", help="render the sub-points to an image file")
+    parser_propagate.add_argument("--checkpoint", help="snapshot directory, saved during the run and resumed from if it exists")
+    parser_propagate.add_argument("--checkpoint-every", type=int, default=100, help="steps between checkpoints")
+    parser_propagate.add_argument("--trajectory", help="directory of an append-only trajectory log")
+    parser_propagate.add_argument("--trajectory-every", type=int, default=1, help="steps between trajectory frames")
+    parser_propagate.set_defaults(run=propagate)
+
+    parser_transfer = commands.add_parser("transfer", help="earliest-arrival ground-to-ground transfer")
+    _add_constellation_arguments(parser_transfer)
+    parser_transfer.add_argument("--start", type=float, nargs=2, metavar=("LAT", "LON"))
+    parser_transfer.add_argument("--target", type=float, nargs=2, metavar=("LAT", "LON"))
+    parser_transfer.add_argument("--departure", type=float, default=0.0)
+    parser_transfer.add_argument("--jobs", help="CSV of jobs (start_lat, start_lon, target_lat, target_lon, packet_size, start_time)")
+    parser_transfer.add_argument("--processes", type=int, help="worker processes for --jobs (default: all cores)")
+    parser_transfer.add_argument("--output", help="write the --jobs results to a .npy or .csv file")
+    parser_transfer.add_argument("--hop-time", type=float, default=0.01)
+    parser_transfer.add_argument("--slot", type=float)
+    parser_transfer.set_defaults(run=transfer)
+
+    parser_encounter = commands.add_parser("encounter", help="encounter probability of two vehicles")
+    parser_encounter.add_argument("where", choices=("segment", "intersection"))
+    for name in ("mean-a", "variance-a", "mean-b", "variance-b"):
+        parser_encounter.add_argument(f"--{name}", type=float, required=True)
+    parser_encounter.add_argument("--t1-2", dest="t1_2", type=float, help="segment: link travel delay 1 -> 2")
+    parser_encounter.add_argument("--t2-1", dest="t2_1", type=float, help="segment: link travel delay 2 -> 1")
+    parser_encounter.add_argument("--ti-5", dest="ti_5", type=float, help="intersection: link travel delay")
+    parser_encounter.add_argument("--R", type=float, help="intersection: communication range")
+    parser_encounter.add_argument("--Sb", type=float, help="intersection: expected speed of Vb")
+    parser_encounter.add_argument("--method", choices=("cdf", "reference"), default="cdf")
+    parser_encounter.add_argument("--tol", type=float, default=1e-8)
+    parser_encounter.add_argument("--table", help="directory of a saved EncounterTable to read instead of integrating")
+    parser_encounter.set_defaults(run=encounter)
+
+    parser_route = commands.add_parser("route", help="most reliable vehicle-to-vehicle transfer paths on a city map")
+    parser_route.add_argument("--map", help="directory of a saved ArrayCityMap (memory-mapped)")
+    parser_route.add_argument("--edges", help="edge CSV (node1, node2, length, arrival_rate, average_travel_time, var)")
+    parser_route.add_argument("--nodes", help="optional node CSV for --edges")
+    parser_route.add_argument("--source", type=int, default=1)
+    parser_route.add_argument("--destination", type=int, default=6)
+    parser_route.add_argument("--k", type=int, default=1)
+    parser_route.add_argument("--max-labels", type=int, default=32,
+                              help="labels expanded per intersection; 0 searches exactly (exponential worst case)")
+    parser_route.add_argument("--speed", type=float, default=15.0)
+    parser_route.add_argument("--communication-range", type=float, default=100.0)
+    parser_route.add_argument("--plot", help="render the (example) map to an image file")
+    parser_route.set_defaults(run=route)
+
+    # 单轨道模型 (satallite.py) 的参数扫描。 Sweep of the single-orbit model of satallite.py
+    parser_sweep = commands.add_parser("sweep", help="coverage, waiting-time and ISL statistics over parameter ranges")
+    values_help = "values or START:STOP:COUNT ranges"
+    parser_sweep.add_argument("--satellites", nargs="+", default=["9"], help=f"satellites in the orbit ({values_help})")
+    parser_sweep.add_argument("--orbit-heights", nargs="+", default=["2000"], help=f"km ({values_help})")
+    parser_sweep.add_argument("--speeds", nargs="+", default=["0.07"], help=f"km per time unit ({values_help})")
+    parser_sweep.add_argument("--communication-radii", nargs="+", default=["1500"], help=f"km ({values_help})")
+    parser_sweep.add_argument("--station", type=float, nargs=2, default=[0.0, 0.0], metavar=("X", "Y"))
+    parser_sweep.add_argument("--track-offset", type=float, default=500.0, help="y of the satellites' ground track")
+    parser_sweep.add_argument("--processes", type=int, help="worker processes (default: all cores)")
+    parser_sweep.add_argument("--output", help="write the results table to a .npy or .csv file")
+    parser_sweep.set_defaults(run=sweep)
+
+    args = parser.parse_args(argv)
+    if args.command == "encounter":
+        # 每种位置需要各自的窗口参数。 Each mode needs its own window arguments
+        options = {"t1_2": "--t1-2", "t2_1": "--t2-1", "ti_5": "--ti-5", "R": "--R", "Sb": "--Sb"}
+        missing = [options[name] for name in ENCOUNTER_WINDOW_ARGUMENTS[args.where] if getattr(args, name) is None]
+        if missing:
+            parser_encounter.error(f"{args.where} needs {', '.join(missing)}")
+    if args.trace:
+        tracer.set_level(args.trace)
+    try:
+        args.run(args)
+    finally:
+        if args.metrics:
+            metrics.dump(args.metrics)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
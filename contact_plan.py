@@ -0,0 +1,246 @@
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from coverage_index import ground_distance_to_chord, lat_lon_to_unit_vectors
+from isl_graph import isl_ranges
+from satallite2 import EARTH_RADIUS, compute_lat_lons, haversine_distances
+
+
+CONTACT_COLUMNS = ("satellite", "peer", "start", "end")
+CONTACT_DTYPES = {"satellite": np.int32, "peer": np.int32, "start": np.float64, "end": np.float64}
+
+
+# 接触计划：卫星-基站 (以及可选的卫星-卫星) 可见窗口。 Contact plan: satellite-station (and optional satellite-satellite) visibility windows
+class ContactPlan:
+    def __init__(self, station_windows, isl_windows=None, num_stations=0, horizon=0.0, key=None):
+        """
+        Windows are stored column-wise (one array per column in CONTACT_COLUMNS); times are relative to the
+        constellation state the plan was computed from, in Satellite.move time units, and both ends are visible.
+        station_windows are sorted by (peer = station index, start); isl_windows by (satellite, peer, start)
+        with satellite < peer.
+        """
+        self.station_windows = station_windows
+        self.isl_windows = isl_windows
+        self.num_stations = num_stations
+        self.horizon = horizon
+        self.key = key
+        # 每个基站的窗口在列中的范围 (CSR 偏移)。 Per-station row ranges (CSR offsets)
+        self.station_offsets = np.searchsorted(station_windows["peer"], np.arange(num_stations + 1))
+
+    def windows_for_station(self, station_index):
+        """
+        :return: dict of column views holding the windows of one station, sorted by start time
+        """
+        lo, hi = self.station_offsets[station_index], self.station_offsets[station_index + 1]
+        return {column: values[lo:hi] for column, values in self.station_windows.items()}
+
+    def is_visible(self, satellite_index, station_index, t):
+        windows = self.windows_for_station(station_index)
+        mask = windows["satellite"] == satellite_index
+        return bool(((windows["start"][mask] <= t) & (t <= windows["end"][mask])).any())
+
+    def next_contact(self, station_index, t):
+        """
+        Earliest time >= t at which some satellite sees the station (replaces a next_coverage_time scan).
+        :return: (time, satellite index), or (None, None) if there is no contact before the horizon
+        """
+        windows = self.windows_for_station(station_index)
+        open_windows = np.flatnonzero(windows["end"] >= t)
+        if len(open_windows) == 0:
+            return None, None
+        times = np.maximum(windows["start"][open_windows], t)
+        best = open_windows[np.argmin(times)]
+        return float(max(windows["start"][best], t)), int(windows["satellite"][best])
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name, windows in (("station", self.station_windows), ("isl", self.isl_windows)):
+            if windows is None:
+                continue
+            for column in CONTACT_COLUMNS:
+                np.save(os.path.join(directory, f"{name}_{column}.npy"), np.ascontiguousarray(windows[column]))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"num_stations": self.num_stations, "horizon": self.horizon, "key": self.key,
+                       "isl": self.isl_windows is not None}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Load a saved plan; with mmap_mode="r" the columns are memory-mapped, so loading is zero-copy
+        and several processes share the same pages.
+        """
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+
+        def read(name):
+            return {column: np.load(os.path.join(directory, f"{name}_{column}.npy"), mmap_mode=mmap_mode)
+                    for column in CONTACT_COLUMNS}
+
+        return cls(read("station"), read("isl") if meta["isl"] else None,
+                   num_stations=meta["num_stations"], horizon=meta["horizon"], key=meta["key"])
+
+
+def contact_plan_key(constellation, stations, horizon, step, tol, include_isl):
+    """
+    Hash of everything the windows depend on: orbital state, coverage/communication radii, stations, sampling and
+    boundary tolerance.
+    """
+    digest = hashlib.sha1()
+    for values in (constellation.theta, constellation.angular_velocity, constellation.inclination, constellation.orbit_height,
+                   constellation.coverage_radius, constellation.communication_radius, _station_lat_lons(stations)):
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    if constellation.propagator is not None:
+        digest.update(constellation.propagator.fingerprint().encode())
+        digest.update(np.ascontiguousarray(constellation.time, dtype=np.float64).tobytes())
+    digest.update(repr((float(horizon), float(step), float(tol), bool(include_isl), "km")).encode())  # 链路范围的单位。 Unit of the link ranges
+    return digest.hexdigest()
+
+
+def _station_lat_lons(stations):
+    return np.array([station.lat_lon for station in stations], dtype=float).reshape(-1, 2)
+
+
+def _default_step(constellation):
+    # 最短过顶时间的 1/8，与 next_coverage_time 相同。 1/8 of the shortest pass, as in next_coverage_time
+    return float(np.min(constellation.coverage_radius / EARTH_RADIUS / constellation.angular_velocity)) / 8
+
+
+def _lat_lons_at(constellation, satellites, times):
+    position_3d = constellation.positions_after(times, satellites)
+    return position_3d, compute_lat_lons(position_3d)
+
+
+def _refine(visible, lo, hi, state_lo, tol):
+    """
+    Vectorized bisection of many visibility transitions at once.
+    :param visible: function (pair indices, times) -> boolean array
+    :return: (lo, hi) with visible(lo) == state_lo != visible(hi) and hi - lo <= tol
+    """
+    pairs = np.arange(len(lo))
+    lo, hi = lo.astype(float), hi.astype(float)
+    while len(pairs) and (hi - lo).max() > tol:
+        mid = (lo + hi) / 2
+        same = visible(pairs, mid) == state_lo
+        lo = np.where(same, mid, lo)
+        hi = np.where(same, hi, mid)
+    return lo, hi
+
+
+def _collect_windows(codes_by_sample, times, visible, tol, horizon):
+    """
+    Turn the visible pair codes of consecutive samples into refined [start, end] windows per pair code.
+    All transitions of the whole horizon are refined together in one vectorized bisection.
+    """
+    changed, lo, hi, state_lo = [], [], [], []
+    previous = codes_by_sample[0]
+    for k in range(1, len(codes_by_sample)):
+        codes = codes_by_sample[k]
+        for transition, state in ((np.setdiff1d(codes, previous, assume_unique=True), False),
+                                  (np.setdiff1d(previous, codes, assume_unique=True), True)):
+            changed.append(transition)
+            lo.append(np.full(len(transition), times[k - 1]))
+            hi.append(np.full(len(transition), times[k]))
+            state_lo.append(np.full(len(transition), state))
+        previous = codes
+
+    changed = np.concatenate(changed) if changed else np.empty(0, dtype=np.int64)
+    state_lo = np.concatenate(state_lo) if state_lo else np.empty(0, dtype=bool)
+    lo, hi = _refine(lambda index, t: visible(changed[index], t), np.concatenate(lo) if lo else np.empty(0),
+                     np.concatenate(hi) if hi else np.empty(0), state_lo, tol)
+
+    # 窗口的两端都取可见的时间点; 初始可见的编码从 0 开始, 最后仍可见的编码到 horizon 结束。
+    # Both window ends are visible instants; codes visible at the first sample start at 0, those still visible at the end close at horizon
+    first, last = codes_by_sample[0], codes_by_sample[-1]
+    code = np.concatenate((first, changed, last))
+    time = np.concatenate((np.zeros(len(first)), np.where(state_lo, lo, hi), np.full(len(last), float(horizon))))
+    is_end = np.concatenate((np.zeros(len(first), dtype=bool), state_lo, np.ones(len(last), dtype=bool)))
+    # 对同一个编码，开始和结束事件按时间交替出现。 For one code, start and end events alternate in time
+    starts = np.lexsort((time[~is_end], code[~is_end]))
+    ends = np.lexsort((time[is_end], code[is_end]))
+    return code[~is_end][starts], time[~is_end][starts], time[is_end][ends]
+
+
+def compute_contact_plan(constellation, stations, horizon, step=None, include_isl=False, tol=1e-3):
+    """
+    Compute every satellite-station visibility window (and optionally every satellite-satellite window)
+    over [0, horizon] from the constellation's current state, with the same tests as Satellite.is_covering
+    and Satellite.can_communicate. Visibility is sampled on a time grid with KD-tree queries and every
+    transition is refined by vectorized bisection; windows shorter than `step` can be missed.
+    :param constellation: a satallite2.Constellation (not moved)
+    :param stations: list of Station
+    :param horizon: time horizon, in Satellite.move time units
+    :param step: sampling step (default: 1/8 of the shortest pass)
+    :param include_isl: also compute inter-satellite windows
+    :param tol: time tolerance of the window boundaries
+    :return: ContactPlan
+    """
+    if step is None:
+        step = _default_step(constellation)
+    num_stations = len(stations)
+    station_lat_lon = _station_lat_lons(stations)
+    station_tree = cKDTree(lat_lon_to_unit_vectors(station_lat_lon))
+    chord_radius = ground_distance_to_chord(constellation.coverage_radius)
+    isl_radius = isl_ranges(constellation)  # 与 Satellite.can_communicate 相同的阈值 (公里)。 Same threshold as can_communicate (km)
+    satellite_index = np.arange(constellation.size)
+    times = np.append(np.arange(0.0, horizon, step), horizon)
+
+    station_codes, isl_codes = [], []
+    for t in times:
+        position_3d, lat_lon = _lat_lons_at(constellation, satellite_index, t)
+        neighbours = station_tree.query_ball_point(lat_lon_to_unit_vectors(lat_lon), chord_radius)
+        counts = np.fromiter(map(len, neighbours), dtype=np.int64, count=len(neighbours))
+        peers = np.fromiter(itertools.chain.from_iterable(neighbours), dtype=np.int64, count=int(counts.sum()))
+        station_codes.append(np.unique(np.repeat(satellite_index, counts) * num_stations + peers))
+        if include_isl:
+            pairs = cKDTree(position_3d).query_pairs(isl_radius.max(), output_type="ndarray")
+            distance = np.linalg.norm(position_3d[pairs[:, 0]] - position_3d[pairs[:, 1]], axis=1)
+            pairs = pairs[distance <= isl_radius[pairs[:, 0]]]
+            isl_codes.append(np.unique(pairs.min(axis=1) * constellation.size + pairs.max(axis=1)))
+
+    def station_visible(codes, t):
+        satellites, peers = np.divmod(codes, num_stations)
+        _, lat_lon = _lat_lons_at(constellation, satellites, t)
+        return haversine_distances(lat_lon, station_lat_lon[peers]) <= constellation.coverage_radius[satellites]
+
+    code, start, end = _collect_windows(station_codes, times, station_visible, tol, horizon)
+    satellites, peers = np.divmod(code, max(num_stations, 1))
+    order = np.lexsort((start, peers))
+    station_windows = {"satellite": satellites[order], "peer": peers[order], "start": start[order], "end": end[order]}
+
+    isl_windows = None
+    if include_isl:
+        def isl_visible(codes, t):
+            first, second = np.divmod(codes, constellation.size)
+            first_position, _ = _lat_lons_at(constellation, first, t)
+            second_position, _ = _lat_lons_at(constellation, second, t)
+            return np.linalg.norm(first_position - second_position, axis=-1) <= isl_radius[first]
+
+        code, start, end = _collect_windows(isl_codes, times, isl_visible, tol, horizon)
+        first, second = np.divmod(code, constellation.size)
+        isl_windows = {"satellite": first, "peer": second, "start": start, "end": end}
+
+    station_windows = {column: values.astype(CONTACT_DTYPES[column]) for column, values in station_windows.items()}
+    if isl_windows is not None:
+        isl_windows = {column: values.astype(CONTACT_DTYPES[column]) for column, values in isl_windows.items()}
+    return ContactPlan(station_windows, isl_windows, num_stations=num_stations, horizon=float(horizon),
+                       key=contact_plan_key(constellation, stations, horizon, step, tol, include_isl))
+
+
+def load_or_compute_contact_plan(constellation, stations, horizon, cache_dir=".contact_plans", step=None,
+                                 include_isl=False, tol=1e-3):
+    """
+    Return the cached plan for these parameters (memory-mapped, zero-copy) or compute and cache it.
+    """
+    if step is None:
+        step = _default_step(constellation)
+    directory = os.path.join(cache_dir, contact_plan_key(constellation, stations, horizon, step, tol, include_isl))
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        return ContactPlan.load(directory)
+    plan = compute_contact_plan(constellation, stations, horizon, step=step, include_isl=include_isl, tol=tol)
+    plan.save(directory)
+    return ContactPlan.load(directory)
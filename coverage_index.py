@@ -0,0 +1,87 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from instrumentation import metrics
+from satallite2 import EARTH_RADIUS
+
+
+# 把经纬度 (度) 转换为单位球面上的三维向量。 Convert lat/lon (degrees) into unit vectors on the sphere
+def lat_lon_to_unit_vectors(lat_lon):
+    lat_lon = np.radians(np.asarray(lat_lon, dtype=float))
+    lat, lon = lat_lon[..., 0], lat_lon[..., 1]
+    cos_lat = np.cos(lat)
+    return np.stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)), axis=-1)
+
+
+# 地面距离 (公里) 对应的单位球弦长。 Chord length on the unit sphere for a ground distance in km
+def ground_distance_to_chord(distance):
+    central_angle = np.minimum(np.asarray(distance, dtype=float) / EARTH_RADIUS, np.pi)
+    return 2 * np.sin(central_angle / 2)
+
+
+# 卫星星下点的覆盖索引。 Coverage index over the current satellite sub-points
+class CoverageIndex:
+    def __init__(self, constellation, lat_lon=None):
+        """
+        Build a KD-tree over the unit vectors of the satellites' sub-points.
+        The haversine test in Satellite.is_covering (great-circle distance <= coverage_radius) is
+        equivalent to a chord-length test on the unit sphere, so each query is one ball query with the
+        largest coverage radius followed by a per-satellite filter.
+        :param constellation: a satallite2.Constellation
+        :param lat_lon: optional (N, 2) sub-points to index instead of the current ones (e.g. a predicted state)
+        """
+        self.constellation = constellation
+        self.update(lat_lon)
+
+    def update(self, lat_lon=None):
+        """
+        Rebuild the index from the constellation's current lat/lon (or the given one); call it after every propagation step.
+        """
+        if lat_lon is None:
+            lat_lon = self.constellation.lat_lon
+        self.unit_vectors = lat_lon_to_unit_vectors(lat_lon)
+        self.chord_radius = ground_distance_to_chord(self.constellation.coverage_radius)  # 每颗卫星的覆盖半径 (弦长)
+        self.max_chord_radius = float(self.chord_radius.max()) if len(self.chord_radius) else 0.0
+        self._tree = cKDTree(self.unit_vectors)
+        metrics.count("coverage_index_builds")
+
+    def _filter(self, candidates, station_vector):
+        candidates = np.asarray(candidates, dtype=np.int64)
+        chord = np.linalg.norm(self.unit_vectors[candidates] - station_vector, axis=1)
+        covering = candidates[chord <= self.chord_radius[candidates]]
+        covering.sort()
+        return covering
+
+    def query(self, station):
+        """
+        Find the satellites covering one ground station.
+        :param station: a Station (or any object with a lat_lon attribute)
+        :return: sorted array of satellite indices in the constellation
+        """
+        metrics.count("coverage_queries")
+        station_vector = lat_lon_to_unit_vectors(station.lat_lon)
+        return self._filter(self._tree.query_ball_point(station_vector, self.max_chord_radius), station_vector)
+
+    def query_many(self, stations):
+        """
+        Find the covering satellites of many ground stations with one batched tree query.
+        :param stations: list of Station objects, or an (M, 2) array of lat/lon
+        :return: list of M sorted arrays of satellite indices
+        """
+        if isinstance(stations, np.ndarray):
+            lat_lon = stations
+        else:
+            lat_lon = np.array([station.lat_lon for station in stations], dtype=float).reshape(-1, 2)
+        metrics.count("coverage_queries", len(lat_lon))
+        station_vectors = lat_lon_to_unit_vectors(lat_lon)
+        candidates = self._tree.query_ball_point(station_vectors, self.max_chord_radius)
+        return [self._filter(candidates[k], station_vectors[k]) for k in range(len(station_vectors))]
+
+    def find_covering_satellite(self, station):
+        """
+        Same result as satallite2.find_covering_satellite: the first covering satellite (as a view) or None.
+        """
+        covering = self.query(station)
+        if len(covering) == 0:
+            return None
+        return self.constellation.satellites[covering[0]]
@@ -0,0 +1,193 @@
+import math
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from instrumentation import metrics
+from shared_arrays import attach_arrays, share_arrays
+from TPD_4_3 import CompactPredictedEncounterGraph, EncounterCSR
+
+# 共享给工作进程的相遇数组 (只读)。 Encounter arrays shared with the worker processes (read-only)
+SHARED_FIELDS = ("indptr", "neighbours", "times", "probs")
+
+_worker = {}  # 每个工作进程里的状态。 Per-process worker state
+
+
+def _init_worker(block_name, layout, threshold, ttl):
+    block, views = attach_arrays(block_name, layout)
+    _worker.update(block=block, encounters=EncounterCSR(*(views[name] for name in SHARED_FIELDS)),
+                   threshold=threshold, ttl=ttl)
+
+
+def _expand(source):
+    """
+    One-to-all expansion of one source in a worker.
+    :return: (source, parent, time, order) arrays of the tree
+    """
+    tree = CompactPredictedEncounterGraph(_worker["threshold"], _worker["ttl"])
+    tree.predict_encounter(source, None, _worker["encounters"])
+    return source, tree.parent, tree.time, tree.order
+
+
+# 批量相遇查询：一次展开回答所有目的车辆，结果按 (源车辆, 数据版本) 缓存。
+# Batched encounter queries: one expansion answers every destination, trees cached by (source, feed version)
+class EncounterQueryEngine:
+    def __init__(self, encounters, threshold=0.6, ttl=10.0, feed_version=0, cache_size=256, cache_ttl=30.0,
+                 processes=None, clock=time.monotonic):
+        """
+        Each source is expanded once to every reachable vehicle (CompactPredictedEncounterGraph with no destination);
+        the tree answers all destinations, with the same paths predict_encounter finds for each pair.
+        Trees are kept in an LRU cache of at most cache_size entries, each valid for cache_ttl seconds of `clock`.
+        Uncached sources of one batch are expanded concurrently on a process pool that shares the encounter arrays
+        through shared memory (started on first use and kept until the feed changes or close() is called).
+        :param encounters: a TPD_4_3.EncounterCSR
+        :param feed_version: version of the encounter feed, part of every cache key
+        :param cache_ttl: seconds a cached tree stays valid (None: until evicted)
+        :param processes: worker processes (default: os.cpu_count(); 1 expands in this process)
+        """
+        self.threshold = threshold  # 相遇概率阈值   Encounter probability threshold
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.clock = clock
+        self._trees = OrderedDict()  # (source, feed_version) -> (expiry, tree)
+        self._pool = None
+        self._block = None
+        self.feed_version = -1
+        self.set_feed(encounters, feed_version)
+
+    def set_feed(self, encounters, feed_version=None):
+        """
+        Switch to a new encounter feed; trees of older versions are dropped (default version: previous + 1).
+        """
+        self.close()
+        self.encounters = encounters
+        self.feed_version = self.feed_version + 1 if feed_version is None else feed_version
+        self._trees.clear()
+
+    def _id(self, vehicle):
+        return self.encounters.id_of(vehicle) if isinstance(vehicle, str) else int(vehicle)
+
+    def _cached(self, source):
+        key = (source, self.feed_version)
+        if key not in self._trees:
+            return None
+        expiry, tree = self._trees[key]
+        if expiry < self.clock():
+            del self._trees[key]
+            return None
+        self._trees.move_to_end(key)
+        return tree
+
+    def _store(self, source, tree):
+        expiry = math.inf if self.cache_ttl is None else self.clock() + self.cache_ttl
+        self._trees[(source, self.feed_version)] = (expiry, tree)
+        self._trees.move_to_end((source, self.feed_version))
+        while len(self._trees) > self.cache_size:
+            self._trees.popitem(last=False)
+
+    def _tree(self, source, parent, times, order):
+        tree = CompactPredictedEncounterGraph(self.threshold, self.ttl)
+        tree.encounters, tree.source, tree.parent, tree.time, tree.order = self.encounters, source, parent, times, order
+        return tree
+
+    def _start_pool(self):
+        arrays = {name: np.ascontiguousarray(getattr(self.encounters, name)) for name in SHARED_FIELDS}
+        self._block, layout = share_arrays(arrays)
+        self._pool = multiprocessing.Pool(self.processes, initializer=_init_worker,
+                                          initargs=(self._block.name, layout, self.threshold, self.ttl))
+
+    def trees(self, sources):
+        """
+        One-to-all trees of many sources; cached trees are reused, the others are expanded (in parallel if
+        processes > 1 and more than one is missing).
+        :param sources: vehicle ids or names
+        :return: list of CompactPredictedEncounterGraph, one per source
+        """
+        ids = [self._id(source) for source in sources]
+        found = {source: self._cached(source) for source in set(ids)}
+        missing = sorted(source for source, tree in found.items() if tree is None)
+        metrics.count("encounter_query_cache_hits", len(ids) - len(missing))
+        metrics.count("encounter_tree_expansions", len(missing))
+
+        if len(missing) > 1 and self.processes > 1:
+            if self._pool is None:
+                self._start_pool()
+            chunksize = max(1, len(missing) // (4 * self.processes))
+            results = self._pool.imap_unordered(_expand, missing, chunksize)
+        else:
+            results = ((source,) + self._expand_here(source) for source in missing)
+        for source, parent, times, order in results:
+            found[source] = self._tree(source, parent, times, order)
+            self._store(source, found[source])
+        return [found[source] for source in ids]
+
+    def _expand_here(self, source):
+        tree = CompactPredictedEncounterGraph(self.threshold, self.ttl).predict_encounter(source, None, self.encounters)
+        return tree.parent, tree.time, tree.order
+
+    def one_to_all(self, source):
+        """
+        :return: the (cached) CompactPredictedEncounterGraph of source over every reachable vehicle
+        """
+        return self.trees([source])[0]
+
+    def query(self, source, destination):
+        """
+        Same answer as predict_encounter for one pair.
+        :return: (expected encounter time of the destination or nan, path of vehicle ids or [])
+        """
+        tree = self.one_to_all(source)
+        destination = self._id(destination)
+        return float(tree.time[destination]), tree.path_to(destination)
+
+    def query_many(self, sources, destinations):
+        """
+        Many (source, destination) pairs, e.g. the route queries of one dispatcher tick; every distinct source is
+        expanded (or read from the cache) once.
+        :return: array of expected encounter times, nan where the destination is not reached
+        """
+        ids = np.array([self._id(source) for source in sources], dtype=np.int64)
+        destinations = np.array([self._id(destination) for destination in destinations], dtype=np.int64)
+        unique, rows = np.unique(ids, return_inverse=True)
+        order = np.argsort(rows, kind="stable")
+        groups = np.split(order, np.cumsum(np.bincount(rows, minlength=len(unique)))[:-1])
+        result = np.empty(len(ids))
+        for pairs, tree in zip(groups, self.trees(unique)):
+            result[pairs] = tree.time[destinations[pairs]]
+        return result
+
+    def many_to_many(self, sources, destinations):
+        """
+        Expected encounter times from every source to every destination.
+        :return: (len(sources), len(destinations)) array, nan where the destination is not reached
+        """
+        destinations = np.array([self._id(destination) for destination in destinations], dtype=np.int64)
+        trees = self.trees(sources)
+        result = np.empty((len(trees), len(destinations)))
+        for row, tree in enumerate(trees):
+            result[row] = tree.time[destinations]
+        return result
+
+    def close(self):
+        """
+        Stop the worker pool and release the shared encounter arrays.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,162 @@
+import json
+import os
+
+import numpy as np
+
+from instrumentation import metrics
+from TPD_4_2 import X_MAX, arrival_difference_cdf
+
+# 查找表的坐标轴：两辆车到达时间的均值、方差，以及标准化的延迟 z。
+# Table axes: mean and variance of both arrival times, and the standardized delay
+#   z = (delay - (mean_b - mean_a)) / sqrt(variance_a + variance_b)
+# In z, H is close to a normal CDF whatever the variances are, so one grid resolves narrow and wide distributions alike.
+TABLE_AXES = ("mean_a", "variance_a", "mean_b", "variance_b", "z")
+
+# 默认网格 (起点, 终点, 点数)。 Default grid (start, stop, points)
+DEFAULT_GRID = {"mean_a": (5.0, 30.0, 9), "variance_a": (0.5, 10.0, 7), "mean_b": (5.0, 30.0, 9),
+                "variance_b": (0.5, 10.0, 7), "z": (-8.0, 8.0, 161)}
+
+# 五维单元的 32 个角。 The 32 corners of a 5-dimensional cell
+_CORNERS = (np.arange(2 ** len(TABLE_AXES))[:, None] >> np.arange(len(TABLE_AXES))) & 1
+
+
+def _standardized_delay(mean_a, variance_a, mean_b, variance_b, delay):
+    return (delay - (mean_b - mean_a)) / np.sqrt(variance_a + variance_b)
+
+
+def _result(prob):
+    return float(prob) if prob.ndim == 0 else prob
+
+
+# 相遇概率的预计算查找表。 Precomputed lookup table for the encounter probabilities
+class EncounterTable:
+    def __init__(self, grid, values, tol=1e-9, error_bound=None, sampled_error=None):
+        """
+        Table of H = TPD_4_2.arrival_difference_cdf on a uniform grid over TABLE_AXES, read with multilinear
+        interpolation (32 table reads per query, independent of the parameters). Queries outside the grid fall back
+        to the exact evaluation.
+        Error bounds (absolute, for H inside the grid):
+            error_bound   = sum over the axes of max |second difference| / 8, the multilinear interpolation error
+                            h^2 max|H''| / 8 estimated from the table itself
+            sampled_error = largest error measured against the exact H at random points when the table was built
+        The segment probability is a difference of two H values divided by X_MAX, so its error is at most
+        2 * error_bound / X_MAX; the intersection probability's is at most 2 * error_bound.
+        :param grid: {axis: (start, stop, points)} for every axis in TABLE_AXES
+        :param values: array of H with one dimension per axis (may be memory-mapped)
+        :param tol: tolerance of the exact evaluation (table entries and fallbacks)
+        """
+        self.grid = {axis: tuple(grid[axis]) for axis in TABLE_AXES}
+        self.values = values
+        self.tol = tol
+        self.error_bound = error_bound
+        self.sampled_error = sampled_error
+
+        start, stop, points = (np.array([self.grid[axis][k] for axis in TABLE_AXES], dtype=float) for k in range(3))
+        self._start = start
+        self._step = (stop - start) / (points - 1)
+        self._last_cell = points.astype(np.int64) - 2
+        strides = np.cumprod(np.concatenate(([1], points[:0:-1].astype(np.int64))))[::-1]
+        self._strides = strides
+        self._corner_offsets = _CORNERS @ strides
+
+    @classmethod
+    def build(cls, grid=None, tol=1e-9, validation_samples=1000, seed=0, chunk=1 << 16):
+        """
+        Evaluate H on the grid (offline; about 40 microseconds per entry) and estimate the error bounds.
+        :param grid: {axis: (start, stop, points)}, missing axes use DEFAULT_GRID; every axis needs at least 2 points
+        :param validation_samples: random points at which the interpolation is compared with the exact H
+        :param chunk: entries evaluated per vectorized call
+        """
+        grid = dict(DEFAULT_GRID, **(grid or {}))
+        axes = [np.linspace(*grid[axis]) for axis in TABLE_AXES]
+        points = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(TABLE_AXES))
+        values = np.empty(len(points))
+        for first in range(0, len(points), chunk):
+            mean_a, variance_a, mean_b, variance_b, z = points[first:first + chunk].T
+            delay = z * np.sqrt(variance_a + variance_b) + (mean_b - mean_a)
+            values[first:first + chunk] = arrival_difference_cdf(mean_a, variance_a, mean_b, variance_b, delay, tol=tol)
+
+        table = cls(grid, values.astype(np.float32).reshape([len(axis) for axis in axes]), tol)
+        table.error_bound = float(sum(np.max(np.abs(np.diff(table.values, 2, axis=k)), initial=0.0)
+                                      for k in range(len(TABLE_AXES))) / 8)
+        if validation_samples:
+            rng = np.random.default_rng(seed)
+            sample = [rng.uniform(axis[0], axis[-1], validation_samples) for axis in axes]
+            mean_a, variance_a, mean_b, variance_b, z = sample
+            delay = z * np.sqrt(variance_a + variance_b) + (mean_b - mean_a)
+            exact = arrival_difference_cdf(mean_a, variance_a, mean_b, variance_b, delay, tol=tol)
+            table.sampled_error = float(np.max(np.abs(table._interpolate(np.stack(sample, axis=-1)) - exact)))
+        return table
+
+    def _interpolate(self, coordinates):
+        # coordinates: (n, 5)，必须都在网格内。 All inside the grid
+        position = (coordinates - self._start) / self._step
+        cell = np.clip(np.floor(position).astype(np.int64), 0, self._last_cell)
+        fraction = position - cell
+        corners = (cell @ self._strides)[:, None] + self._corner_offsets
+        values = np.asarray(self.values).reshape(-1)[corners].reshape((-1,) + (2,) * len(TABLE_AXES))
+        # 角 c 的第 k 位对应第 k 个轴，即最后一维是第 0 个轴；逐轴线性插值。 Bit k of corner c is axis k (the last dimension is axis 0)
+        for k in range(len(TABLE_AXES)):
+            t = fraction[:, k].reshape((-1,) + (1,) * (len(TABLE_AXES) - k - 1))
+            values = values[..., 0] + (values[..., 1] - values[..., 0]) * t
+        return values
+
+    def difference_cdf(self, mean_a, variance_a, mean_b, variance_b, delay):
+        """
+        Interpolated arrival_difference_cdf; parameters outside the grid are evaluated exactly.
+        :return: array of H values (broadcast shape of the parameters)
+        """
+        mean_a, variance_a, mean_b, variance_b, delay = np.broadcast_arrays(
+            *(np.asarray(value, dtype=float) for value in (mean_a, variance_a, mean_b, variance_b, delay)))
+        shape = mean_a.shape
+        mean_a, variance_a, mean_b, variance_b, delay = (value.ravel() for value in (mean_a, variance_a, mean_b, variance_b, delay))
+        coordinates = np.stack((mean_a, variance_a, mean_b, variance_b,
+                                _standardized_delay(mean_a, variance_a, mean_b, variance_b, delay)), axis=-1)
+        position = (coordinates - self._start) / self._step
+        inside = np.all((position >= 0) & (position <= self._last_cell + 1), axis=1)
+
+        result = np.empty(len(coordinates))
+        result[inside] = self._interpolate(coordinates[inside])
+        outside = ~inside
+        if outside.any():
+            result[outside] = arrival_difference_cdf(mean_a[outside], variance_a[outside], mean_b[outside],
+                                                     variance_b[outside], delay[outside], tol=self.tol)
+        metrics.count("encounter_table_lookups", len(result))
+        metrics.count("encounter_table_fallbacks", int(outside.sum()))
+        return result.reshape(shape)
+
+    def segment(self, mean_a, variance_a, mean_b, variance_b, t1_2, t2_1):
+        """
+        Table version of TPD_4_2.encounter_probability_segment (error at most 2 * error_bound / X_MAX).
+        """
+        window = np.asarray(t1_2, dtype=float) + t2_1
+        delay = np.stack(np.broadcast_arrays(window, 0.0))
+        h = self.difference_cdf(mean_a, variance_a, mean_b, variance_b, delay)
+        return _result((h[0] - h[1]) / X_MAX)
+
+    def intersection(self, mean_a, variance_a, mean_b, variance_b, ti_5, R, Sb):
+        """
+        Table version of TPD_4_2.encounter_probability_intersection (error at most 2 * error_bound).
+        """
+        ti_5, reach = np.asarray(ti_5, dtype=float), np.asarray(R, dtype=float) / Sb
+        h = self.difference_cdf(mean_a, variance_a, mean_b, variance_b, np.stack(np.broadcast_arrays(ti_5 + reach, ti_5 - reach)))
+        return _result(h[0] - h[1])
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "values.npy"), np.ascontiguousarray(self.values))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"axes": list(TABLE_AXES), "grid": self.grid, "tol": self.tol, "error_bound": self.error_bound,
+                       "sampled_error": self.sampled_error}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Load a saved table; with mmap_mode="r" the values are memory-mapped and only the cells that are read are paged in.
+        """
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if tuple(meta["axes"]) != TABLE_AXES:
+            raise ValueError(f"table axes {meta['axes']} do not match {TABLE_AXES}")
+        values = np.load(os.path.join(directory, "values.npy"), mmap_mode=mmap_mode)
+        return cls(meta["grid"], values, meta["tol"], meta["error_bound"], meta["sampled_error"])
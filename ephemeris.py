@@ -0,0 +1,110 @@
+import math
+
+import numpy as np
+
+from instrumentation import metrics
+from satallite2 import compute_3d_positions, compute_lat_lons
+
+# 表的列: 三维位置和经纬度 (经度沿表展开, 没有 ±180 的跳变)。
+# Table columns: position_3d and lat/lon, with the longitude unwrapped along the table (no jump at ±180)
+TABLE_COLUMNS = ("x", "y", "z", "lat", "lon")
+
+DEFAULT_RESOLUTION = 1 << 14  # 每个轨道壳层一个周期的采样点数。 Phase samples per orbital period of a shell
+DEFAULT_LAT_LON_TOLERANCE = 1e-5  # 经纬度插值误差超过此值 (度) 的单元改为精确计算。 Cells less accurate than this are computed exactly
+
+
+# 按轨道壳层共享的星历查找表。 Ephemeris lookup tables shared by every satellite of a shell
+class ShellEphemeris:
+    def __init__(self, orbit_height, inclination, shell_index, table, exact_cells, error_bound=None):
+        """
+        In the circular model of satallite2 a satellite's position depends only on its shell (orbit height and
+        inclination) and its angle theta, so one table per shell over theta in [0, 2*pi] serves every satellite in it,
+        read with linear interpolation in theta (no trigonometry per query).
+        :param orbit_height, inclination: (S,) parameters of the shells
+        :param shell_index: (N,) shell of every satellite
+        :param table: (S, resolution + 1, len(TABLE_COLUMNS)) samples at theta = 2*pi*k/resolution; only the per-cell
+                      start values and increments derived from it are kept (S * resolution * 80 bytes)
+        :param exact_cells: (S, resolution) True for the cells where interpolating lat/lon is not accurate enough
+                            (the ground track of a near-polar orbit jumps or turns sharply over the pole); lat/lon in
+                            these cells are computed from the interpolated position instead
+        :param error_bound: largest distance (km) between interpolated and exact positions at the cell midpoints
+        """
+        self.orbit_height = orbit_height
+        self.inclination = inclination
+        self.shell_index = shell_index
+        self.exact_cells = exact_cells
+        self.error_bound = error_bound
+        self.resolution = table.shape[1] - 1
+        self._scale = self.resolution / (2 * math.pi)
+        # 每个单元的起点值和增量放在一行, 一次读取即可插值。 Start value and increment of every cell in one row, one read per query
+        cells = np.concatenate((table[:, :-1], np.diff(table, axis=1)), axis=-1)
+        cells[..., 4] = np.remainder(cells[..., 4] + 180.0, 360.0) - 180.0  # 起点经度在 [-180, 180) 内。 Start longitudes in [-180, 180)
+        self._cells = cells.reshape(-1, 2 * table.shape[-1])
+        self._exact_cells = exact_cells.reshape(-1)
+
+    @classmethod
+    def build(cls, orbit_height, inclination, resolution=DEFAULT_RESOLUTION, lat_lon_tolerance=DEFAULT_LAT_LON_TOLERANCE):
+        """
+        :param orbit_height, inclination: per-satellite arrays (e.g. Constellation.orbit_height / .inclination);
+                                          satellites with equal values share one shell
+        """
+        shells, shell_index = np.unique(np.stack((np.asarray(orbit_height, dtype=float), np.asarray(inclination, dtype=float))),
+                                        axis=1, return_inverse=True)
+        orbit_height, inclination = shells
+        theta = np.linspace(0.0, 2 * math.pi, resolution + 1)
+        position_3d = compute_3d_positions(theta, inclination[:, None], orbit_height[:, None])
+        lat_lon = compute_lat_lons(position_3d)
+
+        table = np.empty(position_3d.shape[:-1] + (len(TABLE_COLUMNS),))
+        table[..., :3] = position_3d
+        table[..., 3] = lat_lon[..., 0]
+        table[..., 4] = np.unwrap(lat_lon[..., 1], period=360.0, axis=-1)
+
+        # 在每个单元的中点比较插值和精确值。 Compare interpolated and exact values at the midpoint of every cell
+        midpoints = compute_3d_positions((theta[:-1] + theta[1:]) / 2, inclination[:, None], orbit_height[:, None])
+        interpolated = (table[:, :-1] + table[:, 1:]) / 2
+        error = np.linalg.norm(interpolated[..., :3] - midpoints, axis=-1)
+        lat_lon_error = np.abs(interpolated[..., 3:] - compute_lat_lons(midpoints))
+        lat_lon_error[..., 1] = np.abs(np.remainder(lat_lon_error[..., 1] + 180.0, 360.0) - 180.0)
+        exact_cells = np.max(lat_lon_error, axis=-1) > lat_lon_tolerance
+        metrics.count("ephemeris_shells", len(orbit_height))
+        return cls(orbit_height, inclination, shell_index.reshape(-1), table, exact_cells, float(np.max(error, initial=0.0)))
+
+    @classmethod
+    def for_constellation(cls, constellation, resolution=DEFAULT_RESOLUTION):
+        return cls.build(constellation.orbit_height, constellation.inclination, resolution)
+
+    @property
+    def num_shells(self):
+        return len(self.orbit_height)
+
+    def lookup(self, theta, index=slice(None)):
+        """
+        :param theta: angles of the selected satellites, broadcastable against them (e.g. (K, n) for K instants)
+        :param index: satellites the angles belong to (default: all)
+        :return: position_3d (..., 3) and lat_lon (..., 2), as compute_3d_positions / compute_lat_lons would give
+        """
+        u = np.multiply(theta, self._scale)
+        cell = np.floor(u)
+        fraction = (u - cell)[..., None]
+        row = self.shell_index[index] * self.resolution + cell.astype(np.int64) % self.resolution
+        values = self._cells.take(row, axis=0)
+        columns = len(TABLE_COLUMNS)
+        values = values[..., :columns] + fraction * values[..., columns:]
+
+        position_3d = values[..., :3]
+        lat_lon = values[..., 3:]
+        lon = lat_lon[..., 1]  # 增量可正可负 (逆行轨道为负), 两侧都要回绕。 Increments are negative for retrograde shells, so wrap both sides
+        lon[lon >= 180.0] -= 360.0
+        lon[lon < -180.0] += 360.0
+        exact = self._exact_cells.take(row)
+        if exact.any():
+            lat_lon[exact] = compute_lat_lons(position_3d[exact])
+        metrics.count("ephemeris_lookups", cell.size)
+        return position_3d, lat_lon
+
+    def positions(self, theta, index=slice(None)):
+        return self.lookup(theta, index)[0]
+
+    def nbytes(self):
+        return self._cells.nbytes + self.exact_cells.nbytes + self.shell_index.nbytes
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+# 虚拟时钟：离散事件模拟中代替 time.sleep。 Virtual clock: replaces time.sleep in discrete-event simulation
+class VirtualClock:
+    def __init__(self, start=0.0):
+        """
+        :param start: initial simulation time, in the same unit as Satellite.move
+        """
+        self.now = float(start)
+
+    def advance(self, dt):
+        """
+        Jump forward by dt (no real waiting).
+        :return: the new simulation time
+        """
+        if dt < 0:
+            raise ValueError(f"Cannot move the clock backwards (dt={dt})")
+        self.now += dt
+        return self.now
+
+    def advance_to(self, t):
+        """
+        Jump straight to the absolute simulation time t.
+        """
+        return self.advance(t - self.now)
+
+    def sleep(self, dt):
+        # 与 time.sleep 同名，便于替换。 Same name as time.sleep so it can be dropped in
+        self.advance(dt)
+
+
+def first_crossing(margin, t_start, t_end, step, xtol=1e-6):
+    """
+    Find the earliest time in [t_start, t_end] at which margin(t) >= 0, by scanning a time grid and
+    refining the first bracketed sign change with Brent's method.
+    Events shorter than `step` can be missed, so `step` must be smaller than the shortest event window.
+    :param margin: vectorized function mapping an array of K times to a (K,) or (K, N) array
+                   (one column per candidate, e.g. per satellite); >= 0 means the event has happened
+    :param t_start: start of the search interval
+    :param t_end: end of the search interval
+    :param step: grid step used for bracketing
+    :param xtol: absolute time tolerance of the refinement
+    :return: (t, column) of the earliest event, or (None, None) if there is none before t_end
+    """
+    previous_t = t_start
+    previous = np.atleast_1d(margin(np.array([t_start]))[0])
+    if (previous >= 0).any():
+        return t_start, int(np.argmax(previous >= 0))
+
+    # 每次评估的时间点数，保证每块大约 100 万个元素。 Grid points per chunk, ~1M margin values per block
+    chunk = max(1, 2 ** 20 // previous.size)
+    while previous_t < t_end:
+        count = min(chunk, int(np.ceil((t_end - previous_t) / step)))
+        times = np.minimum(previous_t + step * np.arange(1, count + 1), t_end)
+        values = margin(times).reshape(len(times), -1)
+        hit = (values >= 0).any(axis=1)
+        if hit.any():
+            k = int(np.argmax(hit))
+            lower = previous_t if k == 0 else times[k - 1]
+            lower_values = previous if k == 0 else values[k - 1]
+            best_t, best_column = None, None
+            # 在同一个区间内可能有多个候选同时跨过 0，取最早的那个。 Several columns may cross in the same bracket; keep the earliest
+            for column in np.flatnonzero(values[k] >= 0):
+                if lower_values[column] >= 0:
+                    t = lower
+                else:
+                    from scipy.optimize import brentq  # 只在需要细化时导入。 Imported only when a crossing is refined
+
+                    column_margin = lambda s: np.atleast_1d(margin(np.array([s]))[0])[column]
+                    t = brentq(column_margin, lower, times[k], xtol=xtol)
+                    # 保证返回的时间点上事件确实已经发生。 Make sure the event has really happened at the returned time
+                    while column_margin(t) < 0:
+                        t = min(t + xtol, times[k])
+                if best_t is None or t < best_t:
+                    best_t, best_column = t, int(column)
+            return best_t, best_column
+        previous_t, previous = times[-1], values[-1]
+        if times[-1] >= t_end:
+            break
+    return None, None
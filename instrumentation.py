@@ -0,0 +1,102 @@
+import atexit
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+# 追踪级别，数值越大越详细。 Trace levels, higher is more verbose
+OFF, INFO, DEBUG, TRACE = 0, 10, 20, 30
+LEVEL_NAMES = {"off": OFF, "info": INFO, "debug": DEBUG, "trace": TRACE}
+
+
+# 分级追踪事件。 Level-gated trace events
+class Tracer:
+    def __init__(self, level=OFF, stream=None):
+        self.set_level(level, stream)
+
+    def set_level(self, level, stream=None):
+        """
+        Enable the events up to `level`; they are written as JSON lines to `stream` (default: stderr).
+        Call sites guard every event with the matching flag, e.g.
+            if tracer.trace: tracer.event("satellite.move", name=..., theta=...)
+        so a disabled event costs one attribute check and its arguments are never built.
+        """
+        if isinstance(level, str):
+            level = int(level) if level.isdigit() else LEVEL_NAMES.get(level.lower(), OFF)
+        self.level = level
+        self.stream = sys.stderr if stream is None else stream
+        self.info = self.level >= INFO
+        self.debug = self.level >= DEBUG
+        self.trace = self.level >= TRACE
+
+    def event(self, event, /, **fields):
+        # 位置参数, 字段里可以有 name。 Positional-only, so the fields may include `name`
+        record = {"t": time.time(), "event": event}
+        record.update(fields)
+        self.stream.write(json.dumps(record, default=_to_json) + "\n")
+
+
+# 热路径计数器和计时器。 Hot-path counters and timers
+# 单颗卫星的逐次计数 (link_checks, coverage_checks, satellite_moves) 只在 TRACE 级别记录, 批量调用总是记录。
+# Per-satellite counters (link_checks, coverage_checks, satellite_moves) are recorded only at the TRACE level; batched calls always count
+class Metrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.timers = {}  # 名称 -> [次数, 总秒数]。 name -> [count, total seconds]
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.timers.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+
+    def to_dict(self):
+        return {"counters": dict(self.counters),
+                "timers": {name: {"count": count, "seconds": seconds} for name, (count, seconds) in self.timers.items()}}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix="satellite_"):
+        """
+        Prometheus text exposition format: counters as <name>_total, timers as <name>_seconds summaries.
+        """
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines += [f"# TYPE {prefix}{name}_total counter", f"{prefix}{name}_total {value}"]
+        for name, (count, seconds) in sorted(self.timers.items()):
+            lines += [f"# TYPE {prefix}{name}_seconds summary",
+                      f"{prefix}{name}_seconds_sum {seconds}", f"{prefix}{name}_seconds_count {count}"]
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """
+        Write the metrics to `path`: Prometheus text for *.prom / *.txt, JSON otherwise.
+        """
+        with open(path, "w") as f:
+            f.write(self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json())
+
+
+def _to_json(value):
+    # numpy 标量和数组。 numpy scalars and arrays
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+tracer = Tracer(os.environ.get("SATELLITE_TRACE", "off"))
+metrics = Metrics()
+
+# 设置 SATELLITE_METRICS 后，进程结束时自动导出。 Dump automatically at exit when SATELLITE_METRICS is set
+if os.environ.get("SATELLITE_METRICS"):
+    atexit.register(metrics.dump, os.environ["SATELLITE_METRICS"])
@@ -0,0 +1,80 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+
+from instrumentation import metrics
+
+
+def isl_ranges(constellation):
+    """
+    Per-satellite link range in the unit of position_3d (km), the same threshold as Satellite.can_communicate.
+    """
+    return np.asarray(constellation.communication_radius, dtype=float)
+
+
+def _pairs_to_csr(pairs, distance, size):
+    # 对称存储：每条链路在两端各出现一次。 Symmetric storage: every link appears once per endpoint
+    rows = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    cols = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    return csr_matrix((np.concatenate((distance, distance)), (rows, cols)), shape=(size, size))
+
+
+def _link_distances(position_3d, pairs, ranges):
+    distance = np.linalg.norm(position_3d[pairs[:, 0]] - position_3d[pairs[:, 1]], axis=1)
+    in_range = distance <= np.minimum(ranges[pairs[:, 0]], ranges[pairs[:, 1]])
+    return pairs[in_range], distance[in_range]
+
+
+def build_isl_graph(constellation, position_3d=None):
+    """
+    Build the inter-satellite link graph of the current constellation snapshot with one KD-tree radius query.
+    :param constellation: a satallite2.Constellation
+    :param position_3d: optional (N, 3) positions to use instead of the current ones (e.g. a predicted state)
+    :return: symmetric (N, N) scipy.sparse.csr_matrix whose entries are the link distances
+    """
+    if position_3d is None:
+        position_3d = constellation.position_3d
+    with metrics.timer("isl_graph_build"):
+        ranges = isl_ranges(constellation)
+        pairs = cKDTree(position_3d).query_pairs(ranges.max(), output_type="ndarray")
+        metrics.count("link_checks", len(pairs))
+        pairs, distance = _link_distances(position_3d, pairs, ranges)
+        return _pairs_to_csr(pairs, distance, constellation.size)
+
+
+# 增量维护的星间链路图 (Verlet 邻居表)。 Incrementally maintained ISL graph (Verlet neighbour list)
+class ISLGraphTracker:
+    def __init__(self, constellation, skin=None):
+        """
+        Keep the candidate pairs within range + skin from the last KD-tree build. While no satellite has moved
+        more than skin / 2 since that build, every pair that can be in range is still a candidate, so an update
+        only recomputes the candidates' distances (O(candidates)) instead of querying the tree again.
+        :param constellation: a satallite2.Constellation, moved by the caller between updates
+        :param skin: extra search radius (default: 10% of the largest link range)
+        """
+        self.constellation = constellation
+        self.ranges = isl_ranges(constellation)
+        self.skin = float(0.1 * self.ranges.max()) if skin is None else float(skin)
+        self.rebuilds = 0
+        self._rebuild()
+
+    def _rebuild(self):
+        position_3d = self.constellation.position_3d
+        self._reference_position = position_3d.copy()
+        self._candidates = cKDTree(position_3d).query_pairs(self.ranges.max() + self.skin, output_type="ndarray")
+        self.rebuilds += 1
+        metrics.count("isl_tracker_rebuilds")
+
+    def update(self):
+        """
+        Refresh the graph for the constellation's current positions.
+        :return: symmetric (N, N) csr_matrix of link distances, identical to build_isl_graph
+        """
+        position_3d = self.constellation.position_3d
+        displacement = np.linalg.norm(position_3d - self._reference_position, axis=1)
+        if len(displacement) and displacement.max() > self.skin / 2:
+            self._rebuild()
+        pairs, distance = _link_distances(position_3d, self._candidates, self.ranges)
+        metrics.count("link_checks", len(self._candidates))
+        self.graph = _pairs_to_csr(pairs, distance, self.constellation.size)
+        return self.graph
@@ -0,0 +1,251 @@
+import calendar
+import hashlib
+import math
+
+import numpy as np
+
+from satallite2 import EARTH_RADIUS
+
+MU_EARTH = 398600.4418  # 地球引力常数 (km^3/s^2)。 Earth's gravitational parameter
+J2 = 1.08262668e-3  # 地球扁率的二阶带谐系数。 Second zonal harmonic
+J2_RADIUS = 6378.137  # J2 对应的地球赤道半径 (km)。 Equatorial radius the J2 coefficient refers to
+EARTH_ROTATION = 7.2921159e-5  # 地球自转角速度 (rad/s)。 Earth's rotation rate
+
+# 每颗卫星一个元素的轨道根数 (角度为弧度, epoch 为秒)。 Per-satellite orbital elements (radians, epoch in seconds)
+ELEMENT_FIELDS = ("semi_major_axis", "eccentricity", "inclination", "raan", "arg_perigee", "mean_anomaly", "epoch")
+
+
+# 星座的轨道根数 (结构数组)。 Orbital elements of a constellation (struct-of-arrays)
+class OrbitalElements:
+    def __init__(self, semi_major_axis, eccentricity, inclination, raan, arg_perigee, mean_anomaly, epoch=0.0,
+                 names=None, origin=0.0):
+        """
+        :param semi_major_axis: km
+        :param inclination, raan, arg_perigee, mean_anomaly: radians, at each satellite's epoch
+        :param epoch: time of each satellite's elements, in seconds after `origin` (time 0 of the simulation)
+        :param origin: POSIX time of simulation time 0 (TLE files: the earliest epoch), kept for reference
+        """
+        arrays = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in
+                                       (semi_major_axis, eccentricity, inclination, raan, arg_perigee, mean_anomaly, epoch)))
+        for name, array in zip(ELEMENT_FIELDS, arrays):
+            setattr(self, name, np.ascontiguousarray(array).reshape(-1))
+        self.names = [f"Satellite_{k}" for k in range(len(self))] if names is None else list(names)
+        self.origin = float(origin)
+
+    def __len__(self):
+        return len(self.semi_major_axis)
+
+    @property
+    def altitude(self):
+        return self.semi_major_axis - EARTH_RADIUS
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in ELEMENT_FIELDS}
+
+    def take(self, index):
+        """
+        :return: OrbitalElements of the satellites in `index` (in that order)
+        """
+        index = np.asarray(index)
+        return OrbitalElements(*(array[index] for array in self.arrays().values()),
+                               names=[self.names[k] for k in index.tolist()], origin=self.origin)
+
+    @classmethod
+    def walker(cls, num_satellites, num_planes, phasing, altitude, inclination, raan_spread=2 * math.pi, prefix="Satellite"):
+        """
+        Walker constellation i:T/P/F of circular orbits: P planes with evenly spaced RAAN over raan_spread (2*pi for a
+        delta, pi for a star pattern), T/P satellites per plane, neighbouring planes offset by F * 2*pi / T.
+        :param altitude: km above EARTH_RADIUS
+        :param inclination: radians
+        """
+        per_plane = num_satellites // num_planes
+        plane = np.repeat(np.arange(num_planes), per_plane)
+        slot = np.tile(np.arange(per_plane), num_planes)
+        return cls(EARTH_RADIUS + altitude, 0.0, inclination, raan_spread * plane / num_planes, 0.0,
+                   2 * math.pi * slot / per_plane + 2 * math.pi * phasing * plane / num_satellites,
+                   names=[f"{prefix}_{altitude}_{p}_{s}" for p, s in zip(plane.tolist(), slot.tolist())])
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Load elements from a CSV file with a header. Columns: semi_major_axis (km) or altitude (km above EARTH_RADIUS),
+        and optionally name, eccentricity, inclination, raan, arg_perigee, mean_anomaly (degrees) and epoch (seconds);
+        missing optional columns are 0.
+        """
+        table = np.genfromtxt(path, delimiter=",", names=True, dtype=None, encoding="utf-8", ndmin=1)
+        columns = table.dtype.names
+
+        def column(name, scale=1.0):
+            return table[name].astype(float) * scale if name in columns else np.zeros(len(table))
+
+        if "semi_major_axis" in columns:
+            semi_major_axis = column("semi_major_axis")
+        else:
+            semi_major_axis = column("altitude") + EARTH_RADIUS
+        degrees = math.pi / 180
+        return cls(semi_major_axis, column("eccentricity"), column("inclination", degrees), column("raan", degrees),
+                   column("arg_perigee", degrees), column("mean_anomaly", degrees), column("epoch"),
+                   names=table["name"].astype(str).tolist() if "name" in columns else None)
+
+    @classmethod
+    def from_tle(cls, path):
+        """
+        Load two-line element sets (with or without a name line before each). Epochs are converted to seconds after the
+        earliest epoch in the file, which becomes the origin. The mean elements are used as osculating ones, which is
+        accurate enough for geometry studies but is not SGP4.
+        """
+        with open(path) as f:
+            lines = [line.rstrip() for line in f if line.strip()]
+        rows, names, name = [], [], None
+        for line in lines:
+            if line.startswith("1 ") and len(line) >= 64:
+                first = line
+            elif line.startswith("2 ") and len(line) >= 63:
+                year = int(first[18:20])
+                year += 2000 if year < 57 else 1900
+                epoch = calendar.timegm((year, 1, 1, 0, 0, 0)) + (float(first[20:32]) - 1) * 86400.0
+                revolutions_per_day = float(line[52:63])
+                mean_motion = revolutions_per_day * 2 * math.pi / 86400.0
+                rows.append((float(line[8:16]), float(line[17:25]), float("0." + line[26:33].strip()),
+                             float(line[34:42]), float(line[43:51]), (MU_EARTH / mean_motion ** 2) ** (1 / 3), epoch))
+                names.append(name or line[2:7].strip())
+                name = None
+            else:
+                name = line.strip()
+        table = np.array(rows, dtype=float).reshape(-1, 7)
+        inclination, raan, _, arg_perigee, mean_anomaly = np.radians(table[:, :5]).T
+        eccentricity = table[:, 2]
+        origin = float(table[:, 6].min()) if len(table) else 0.0
+        return cls(table[:, 5], eccentricity, inclination, raan, arg_perigee, mean_anomaly, table[:, 6] - origin,
+                   names=names, origin=origin)
+
+    def save(self, path):
+        np.savez(path, names=np.array(self.names), origin=self.origin, **self.arrays())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load elements saved with save() (.npz), a CSV file (.csv) or a TLE file (anything else).
+        """
+        if str(path).endswith(".npz"):
+            with np.load(path) as data:
+                return cls(*(data[name] for name in ELEMENT_FIELDS), names=data["names"].tolist(), origin=float(data["origin"]))
+        if str(path).endswith(".csv"):
+            return cls.from_csv(path)
+        return cls.from_tle(path)
+
+
+def solve_kepler(mean_anomaly, eccentricity, tol=1e-12, max_iterations=20):
+    """
+    Solve Kepler's equation E - e sin E = M for arrays with Newton's method (elliptic orbits, e < 1).
+    :return: eccentric anomaly, same shape as the broadcast inputs
+    """
+    mean_anomaly = np.remainder(mean_anomaly, 2 * math.pi)
+    eccentricity = np.broadcast_to(eccentricity, mean_anomaly.shape)
+    if not eccentricity.any():
+        return mean_anomaly
+    # 高偏心率时从 pi 开始更稳定。 Starting from pi is more robust for high eccentricities
+    anomaly = np.where(eccentricity < 0.8, mean_anomaly, math.pi)
+    for _ in range(max_iterations):
+        step = (anomaly - eccentricity * np.sin(anomaly) - mean_anomaly) / (1 - eccentricity * np.cos(anomaly))
+        anomaly -= step
+        if np.max(np.abs(step), initial=0.0) < tol:
+            break
+    return anomaly
+
+
+# 批量二体 (开普勒) 轨道外推。 Batched two-body (Keplerian) propagation
+class KeplerPropagator:
+    def __init__(self, elements, earth_rotation=True, gmst0=0.0):
+        """
+        Positions of every satellite at arrays of times, in the Earth-fixed frame and the unit of
+        Satellite.position_3d (km from the Earth's centre), so compute_lat_lons, the coverage tests and the ISL
+        distances work on them unchanged.
+        :param elements: OrbitalElements
+        :param earth_rotation: rotate the inertial positions into the Earth-fixed frame (False: sub-points drift with
+                               the inertial frame, as in the circular model of satallite2)
+        :param gmst0: Greenwich sidereal angle at time 0 (radians)
+        """
+        self.elements = elements
+        self.earth_rotation = earth_rotation
+        self.gmst0 = float(gmst0)
+        a, e = elements.semi_major_axis, elements.eccentricity
+        self.mean_motion = np.sqrt(MU_EARTH / a ** 3)  # rad/s
+        self.raan_rate, self.arg_perigee_rate, self.mean_anomaly_rate = self._rates()
+        self._semi_minor = a * np.sqrt(1 - e ** 2)
+
+    def _rates(self):
+        return np.zeros(len(self.elements)), np.zeros(len(self.elements)), self.mean_motion
+
+    @property
+    def angular_velocity(self):
+        """
+        Mean rate of the argument of latitude of every satellite (rad/s), the analogue of Satellite.angular_velocity.
+        """
+        return self.arg_perigee_rate + self.mean_anomaly_rate
+
+    def options(self):
+        return {"earth_rotation": self.earth_rotation, "gmst0": self.gmst0}
+
+    def fingerprint(self):
+        """
+        Hash of the elements and options, for caches keyed by the orbital state.
+        """
+        digest = hashlib.sha1(repr((type(self).__name__, self.options())).encode())
+        for array in self.elements.arrays().values():
+            digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def positions(self, times, index=None):
+        """
+        :param times: simulation times broadcastable against the selected satellites, e.g. a scalar, an (n,) array of
+                      per-satellite times, or (K, 1) for K instants of every satellite
+        :param index: satellites to propagate (default: all)
+        :return: (..., n, 3) Earth-fixed positions (km)
+        """
+        select = (lambda array: array) if index is None else (lambda array: array[index])
+        elements = self.elements
+        dt = np.asarray(times, dtype=float) - select(elements.epoch)
+        raan = select(elements.raan) + select(self.raan_rate) * dt
+        arg_perigee = select(elements.arg_perigee) + select(self.arg_perigee_rate) * dt
+        eccentricity = select(elements.eccentricity)
+        anomaly = solve_kepler(select(elements.mean_anomaly) + select(self.mean_anomaly_rate) * dt, eccentricity)
+
+        # 近焦点坐标系中的位置。 Position in the perifocal frame
+        xp = select(elements.semi_major_axis) * (np.cos(anomaly) - eccentricity)
+        yp = select(self._semi_minor) * np.sin(anomaly)
+        cos_raan, sin_raan = np.cos(raan), np.sin(raan)
+        cos_arg, sin_arg = np.cos(arg_perigee), np.sin(arg_perigee)
+        inclination = select(elements.inclination)
+        cos_inc, sin_inc = np.cos(inclination), np.sin(inclination)
+
+        position_3d = np.empty(np.broadcast(xp, raan).shape + (3,))
+        x = (cos_raan * cos_arg - sin_raan * sin_arg * cos_inc) * xp - (cos_raan * sin_arg + sin_raan * cos_arg * cos_inc) * yp
+        y = (sin_raan * cos_arg + cos_raan * sin_arg * cos_inc) * xp - (sin_raan * sin_arg - cos_raan * cos_arg * cos_inc) * yp
+        position_3d[..., 2] = sin_arg * sin_inc * xp + cos_arg * sin_inc * yp
+        if self.earth_rotation:
+            # 惯性系 -> 地固系。 Inertial -> Earth-fixed
+            angle = self.gmst0 + EARTH_ROTATION * np.asarray(times, dtype=float)
+            cos_angle, sin_angle = np.cos(angle), np.sin(angle)
+            x, y = cos_angle * x + sin_angle * y, cos_angle * y - sin_angle * x
+        position_3d[..., 0] = x
+        position_3d[..., 1] = y
+        return position_3d
+
+
+# 带 J2 长期摄动的外推 (升交点赤经、近地点幅角和平近点角的长期变化)。
+# Keplerian propagation plus the secular J2 drift of the RAAN, argument of perigee and mean anomaly
+class J2Propagator(KeplerPropagator):
+    def _rates(self):
+        elements = self.elements
+        e2 = elements.eccentricity ** 2
+        p = elements.semi_major_axis * (1 - e2)
+        sin2_inc = np.sin(elements.inclination) ** 2
+        factor = 1.5 * J2 * (J2_RADIUS / p) ** 2 * self.mean_motion
+        raan_rate = -factor * np.cos(elements.inclination)
+        arg_perigee_rate = factor * (2 - 2.5 * sin2_inc)
+        mean_anomaly_rate = self.mean_motion + factor * np.sqrt(1 - e2) * (1 - 1.5 * sin2_inc)
+        return raan_rate, arg_perigee_rate, mean_anomaly_rate
+
+
+PROPAGATORS = {"kepler": KeplerPropagator, "j2": J2Propagator}
@@ -0,0 +1,208 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from coverage_index import CoverageIndex, lat_lon_to_unit_vectors
+from instrumentation import metrics, tracer
+from isl_graph import build_isl_graph
+from satallite2 import EARTH_RADIUS, compute_lat_lons
+
+
+# 路由结果。 Result of one route query
+class Route:
+    def __init__(self, delivered, departure, arrival_time=None, path=()):
+        self.delivered = delivered
+        self.departure = departure
+        self.arrival_time = arrival_time  # 数据包到达目标基站的时间。 Time the packet reaches the target station
+        self.path = list(path)  # 经过的卫星编号 (上行卫星 -> ... -> 下行卫星)。 Satellite indices, uplink -> ... -> downlink
+        self.hops = max(len(self.path) - 1, 0)  # 星间转发次数。 Number of inter-satellite hops
+        self.latency = arrival_time - departure if delivered else math.inf
+
+    def __repr__(self):
+        if not self.delivered:
+            return f"Route(delivered=False, departure={self.departure})"
+        return f"Route(latency={self.latency}, hops={self.hops}, path={self.path})"
+
+
+# 一次搜索的状态 (从一个起始基站、一个出发时隙开始)。 Search state for one (start station, departure slot)
+class _SearchTree:
+    def __init__(self, size, first_slot):
+        self.arrival = np.full(size, np.inf)  # 每颗卫星最早拿到数据包的时间。 Earliest time each satellite holds the packet
+        self.reached_slot = np.full(size, np.iinfo(np.int64).max)  # 在哪个时隙被扩展到。 Slot in which it was reached
+        self.parent = np.full(size, -1, dtype=np.int64)  # 上一跳卫星，-1 表示上行。 Previous satellite, -1 for the uplink
+        self.first_slot = first_slot
+        self.next_slot = first_slot  # 下一个待扩展的时隙。 Next slot to expand
+        self.complete = False
+
+
+# 时变星间链路图上的最早到达路由。 Earliest-arrival routing over the time-varying satellite graph
+class Router:
+    def __init__(self, constellation, hop_time=0.01, slot=None, horizon=None, cache_size=1024, start=0.0):
+        """
+        Time is split into topology slots; the ISL graph and the sub-points of slot k are those at time k * slot
+        (relative to the constellation's state when the router is created, in Satellite.move time units).
+        At the start of every slot each satellite that holds the packet (store-and-carry) and each satellite
+        covering the start station forwards it; every hop takes hop_time and uses the topology of the slot in
+        which the search front departed. With a uniform hop cost, Dijkstra reduces to one vectorized BFS layer
+        per hop, so the search is earliest-arrival optimal under this model.
+        Snapshots and search trees are cached, so packets from the same station in the same slot reuse one search.
+        :param constellation: a satallite2.Constellation (not moved by the router)
+        :param hop_time: per-hop forwarding time
+        :param slot: topology refresh interval (default: 1/8 of the shortest pass, as in next_coverage_time)
+        :param horizon: give up after this long (default: one orbital period of the slowest satellite)
+        :param cache_size: number of slot snapshots (coverage indexes, ISL graphs) and search trees kept in memory
+        :param start: time 0 of the router relative to the constellation's current state (e.g. negative to put slot 0
+                      on an earlier slot boundary)
+        """
+        self.constellation = constellation
+        self.hop_time = float(hop_time)
+        self.slot = float(np.min(constellation.coverage_radius / EARTH_RADIUS / constellation.angular_velocity)) / 8 if slot is None else float(slot)
+        self.horizon = float(2 * math.pi / np.min(constellation.angular_velocity)) if horizon is None else float(horizon)
+        self.last_slot = int(math.ceil(self.horizon / self.slot))
+        self.cache_size = cache_size
+        self._theta = constellation.theta_after(start)  # 路由器时间 0 的状态。 State at router time 0
+        self._time = constellation.time + start  # 带外推器时使用。 Used with a propagator
+        self._coverages = OrderedDict()
+        self._graphs = OrderedDict()
+        self._trees = OrderedDict()
+        self._covered_slots = {}
+
+    def _positions(self, times):
+        c = self.constellation
+        if c.propagator is not None:
+            return c.propagator.positions(self._time + times)
+        return c.positions_at((self._theta + c.angular_velocity * times) % (2 * math.pi))
+
+    def _cached(self, cache, k, build):
+        if k in cache:
+            cache.move_to_end(k)
+            return cache[k]
+        value = cache[k] = build(k)
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def coverage(self, k):
+        """
+        :return: CoverageIndex of the sub-points at the start of slot k
+        """
+        return self._cached(self._coverages, k, lambda k: CoverageIndex(self.constellation, compute_lat_lons(self._positions(k * self.slot))))
+
+    def graph(self, k):
+        """
+        :return: ISL csr graph at the start of slot k
+        """
+        return self._cached(self._graphs, k, lambda k: build_isl_graph(self.constellation, self._positions(k * self.slot)))
+
+    def covered_slots(self, station):
+        """
+        Sorted slots (within the horizon) at whose start at least one satellite covers the station; cached per station.
+        The sub-point of a satellite is the direction of its position, so the haversine test of Satellite.is_covering
+        becomes a dot product with the station's unit vector.
+        """
+        key = tuple(np.asarray(station.lat_lon, dtype=float))
+        if key not in self._covered_slots:
+            c = self.constellation
+            station_vector = lat_lon_to_unit_vectors(np.asarray(station.lat_lon, dtype=float))
+            min_cosine = np.cos(np.minimum(c.coverage_radius / EARTH_RADIUS, math.pi))
+            chunk = max(1, 2 ** 20 // c.size)
+            covered = []
+            for first in range(0, self.last_slot + 1, chunk):
+                slots = np.arange(first, min(first + chunk, self.last_slot + 1))
+                position_3d = self._positions(slots[:, None] * self.slot)
+                cosine = position_3d @ station_vector / np.linalg.norm(position_3d, axis=-1)
+                covered.append(slots[(cosine >= min_cosine).any(axis=1)])
+            self._covered_slots[key] = np.concatenate(covered)
+        return self._covered_slots[key]
+
+    def _tree(self, start_station, first_slot):
+        key = (tuple(np.asarray(start_station.lat_lon, dtype=float)), first_slot)
+        if key in self._trees:
+            self._trees.move_to_end(key)
+        else:
+            tree = _SearchTree(self.constellation.size, first_slot)
+            # 在起始基站第一次被覆盖之前没有卫星能拿到数据包。 Nothing can hold the packet before the start station is first covered
+            uplink_slots = self.covered_slots(start_station)
+            uplink_slots = uplink_slots[uplink_slots >= first_slot]
+            tree.next_slot = int(uplink_slots[0]) if len(uplink_slots) else self.last_slot + 1
+            self._trees[key] = (start_station, tree)
+            if len(self._trees) > self.cache_size:
+                self._trees.popitem(last=False)
+        return self._trees[key]
+
+    def _expand(self, start_station, tree):
+        k = tree.next_slot
+        t = k * self.slot
+        tree.next_slot += 1
+        if tree.complete:
+            return
+        metrics.count("route_slot_expansions")
+        if tracer.debug:
+            tracer.event("router.expand", slot=k, reached=int(np.isfinite(tree.arrival).sum()))
+
+        # 上行：覆盖起始基站的卫星在时隙开始时拿到数据包。 Uplink: satellites covering the start station get the packet at the slot start
+        uplink = self.coverage(k).query(start_station)
+        uplink = uplink[np.isinf(tree.arrival[uplink])]
+        tree.arrival[uplink] = t
+        tree.reached_slot[uplink] = k
+
+        # 从所有已持有数据包的卫星开始逐跳扩展。 Expand hop by hop from every satellite already holding the packet
+        frontier = np.flatnonzero(tree.arrival <= t)
+        if len(frontier) == 0:
+            return
+        graph = self.graph(k)
+        hops = 0
+        while len(frontier):
+            hops += 1
+            neighbours = graph[frontier]
+            sources = np.repeat(frontier, np.diff(neighbours.indptr))
+            targets = neighbours.indices
+            new = np.isinf(tree.arrival[targets])
+            targets, first = np.unique(targets[new], return_index=True)
+            tree.arrival[targets] = t + hops * self.hop_time
+            tree.reached_slot[targets] = k
+            tree.parent[targets] = sources[new][first]
+            frontier = targets
+        # 所有卫星都已持有数据包后不再需要扩展。 Once every satellite holds the packet there is nothing left to expand
+        tree.complete = not np.isinf(tree.arrival).any()
+
+    def route(self, start_station, target_station, departure=0.0):
+        """
+        Earliest-arrival route from the start station to the target station.
+        :param departure: time the packet is handed to the start station (rounded up to the next slot)
+        :return: Route
+        """
+        metrics.count("route_queries")
+        first_slot = int(math.ceil(departure / self.slot - 1e-9))
+        start_station, tree = self._tree(start_station, first_slot)
+        best_time, best_satellite = math.inf, -1
+        # 目标基站没有被任何卫星覆盖的时隙不可能交付，直接跳过。 Skip slots in which nothing covers the target at all
+        delivery_slots = self.covered_slots(target_station)
+        for k in delivery_slots[delivery_slots >= first_slot].tolist():
+            if best_time <= k * self.slot:
+                break
+            while tree.next_slot <= k:
+                self._expand(start_station, tree)
+            candidates = self.coverage(k).query(target_station)
+            candidates = candidates[tree.reached_slot[candidates] <= k]
+            if len(candidates) == 0:
+                continue
+            # 下行：持有数据包且覆盖目标基站的卫星。 Downlink: a satellite holding the packet and covering the target
+            delivery = np.maximum(tree.arrival[candidates], k * self.slot)
+            i = int(np.argmin(delivery))
+            if delivery[i] < best_time:
+                best_time, best_satellite = float(delivery[i]), int(candidates[i])
+        if best_satellite < 0:
+            return Route(False, departure)
+
+        path = [best_satellite]
+        while tree.parent[path[-1]] >= 0:
+            path.append(int(tree.parent[path[-1]]))
+        return Route(True, departure, best_time, reversed(path))
+
+    def clear(self):
+        self._covered_slots.clear()
+        self._coverages.clear()
+        self._graphs.clear()
+        self._trees.clear()
@@ -2,6 +2,9 @@ import numpy as np
 import random
 import math
 import time
+
+from event_clock import VirtualClock, first_crossing
+from instrumentation import metrics, tracer
 # 顺行轨道（与地球自转同方向）： 假设一颗 LEO 卫星的速度为 7.8 公里/秒，而地面在赤道的自转速度为 0.465 公里/秒，那么顺行轨道上卫星相对于地面的速度约为 7.8 公里/秒 - 0.465 公里/秒 = 7.335 公里/秒。
 # 逆行轨道（与地球自转方向相反）：举例：如果卫星的速度为 7.8 公里/秒，地面自转速度为 0.465 公里/秒，那么逆行轨道上卫星相对于地面的速度约为 7.8 公里/秒 + 0.465 公里/秒 = 8.265 公里/秒。
 # 这里是顺行轨道，不过用的是卫星相对于地面的速度。所以没关系
@@ -55,6 +58,8 @@ class Satellite(Node):
         y2 = (self.orbitHeight + EARTH_RADIUS) * math.sin(self.theta)
 
         # 计算两个卫星的直线距离
+        if tracer.trace:  # 逐次调用的计数也只在追踪时记录。 Per-call counters are recorded only while tracing
+            metrics.count("link_checks")
         distance = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
         return distance <= self.communication_radius
 
@@ -67,7 +72,9 @@ class Satellite(Node):
             distance = math.sqrt((EARTH_PERIMETER - (self.position[0] - groundStation.position[0]) - groundStation.position[0]) ** 2  + (self.position[1] - groundStation.position[1]) ** 2)
         else:
             distance = math.sqrt((self.position[0] - groundStation.position[0]) ** 2 + (self.position[1] - groundStation.position[1]) ** 2)
-        print(f"The distance between {self.name} and the ground base station is: {distance}") # 4527.69,  9013.87, …………
+        if tracer.trace:  # 关闭追踪时不会格式化或计数任何内容。 Nothing is formatted or counted while tracing is off
+            metrics.count("coverage_checks")
+            tracer.event("satellite.coverage_check", name=self.name, station=groundStation.name, distance=distance) # 4527.69,  9013.87, …………
         return distance <= self.coverage_radius
 
     def move(self, timeUnit): #单位时间是0.01S
@@ -77,6 +84,8 @@ class Satellite(Node):
 
         #更新卫星的所处角度
         self.theta = (self.theta + self.angular_velocity * timeUnit) % (2 * math.pi)
+        if tracer.trace:
+            metrics.count("satellite_moves")
 
 
 
@@ -103,8 +112,42 @@ def find_closest_covering_satellite(target_station, satellites):
     return None
 
 
+# 计算下一次有卫星覆盖基站的时间 (离散事件模式)。 Compute when the next coverage event happens (discrete-event mode)
+def next_coverage_time(station, satellites, step=None, horizon=None):
+    """
+    Find the earliest time (in Satellite.move time units) at which one of the satellites covers the station,
+    without moving them: the coverage margin of every satellite is evaluated on a time grid in one NumPy call
+    and the first sign change is refined with Brent's method.
+    step defaults to 1/8 of the shortest pass, horizon to one ground-track period of the slowest satellite.
+    :return: (time, satellite index), or (None, None) if no satellite ever covers the station
+    """
+    x0 = np.array([satellite.position[0] for satellite in satellites], dtype=float)
+    y = np.array([satellite.position[1] for satellite in satellites], dtype=float)
+    speed = np.array([satellite.speed for satellite in satellites], dtype=float)
+    coverage_radius = np.array([satellite.coverage_radius for satellite in satellites], dtype=float)
+    station_x, station_y = station.position
+
+    if step is None:
+        step = float(np.min(coverage_radius / speed)) / 8
+    if horizon is None:
+        horizon = float(EARTH_PERIMETER / np.min(speed))
+
+    def margin(times):
+        # 与 Satellite.move 和 Satellite.is_covering 相同的公式。 Same formulas as Satellite.move and Satellite.is_covering
+        dx = (x0 + speed * times[:, None]) % EARTH_PERIMETER - station_x
+        wrapped = np.where(dx > EARTH_PERIMETER / 2, EARTH_PERIMETER - dx - station_x, dx)
+        distance = np.sqrt(wrapped ** 2 + (y - station_y) ** 2)
+        return coverage_radius - distance
+
+    return first_crossing(margin, 0.0, horizon, step)
+
+
 # 模拟数据传输过程
-def simulate_data_transfer(ground_station, satellites, target_station, packet_size):
+def simulate_data_transfer(ground_station, satellites, target_station, packet_size, clock=None):
+    """
+    With clock=None the waits poll in real time (time.sleep); with a VirtualClock the simulation jumps
+    straight to the next coverage event instead of moving the satellites step by step.
+    """
     print("Start detecting satellites.......\n")
     packet = Packet(packet_size)
     print(f"Packet size: {packet.size} MB， Send from: {ground_station.name}\n")
@@ -115,6 +158,16 @@ def simulate_data_transfer(ground_station, satellites, target_station, packet_si
     if not covering_satellite:
         print(f"There is currently no satellite coverage {ground_station.name}, waiting for satellite coverage...")
 
+        if clock is not None:
+            wait_time, index = next_coverage_time(ground_station, satellites)
+            if wait_time is None:
+                print(f"No satellite will ever cover {ground_station.name}")
+                return
+            clock.advance(wait_time)
+            for satellite in satellites:
+                satellite.move(wait_time)
+            covering_satellite = satellites[index]
+
         while not covering_satellite:
             time.sleep(0.01)  # 模拟时间流逝， 每0.01S检查一次
             #卫星移动
@@ -132,6 +185,8 @@ def simulate_data_transfer(ground_station, satellites, target_station, packet_si
 
         # 移动卫星并预测转发时间后的卫星位置
         time_hours = 0.1  # 假设转发时间为0.1小时
+        if clock is not None:
+            clock.advance(time_hours)
         for sat in satellites:
             sat.move(time_hours)
 
@@ -150,35 +205,44 @@ def simulate_data_transfer(ground_station, satellites, target_station, packet_si
     else:
         print(f"{final_satellite.name} 尚未覆盖 {target_station.name}，等待卫星移动...")
         # 等待此为姓覆盖到 目标基站
+        if clock is not None:
+            wait_time, _ = next_coverage_time(target_station, [final_satellite])
+            if wait_time is None:
+                print(f"{final_satellite.name} will never cover {target_station.name}")
+                return
+            clock.advance(wait_time)
+            for satellite in satellites:
+                satellite.move(wait_time)
         while not final_satellite.is_covering(target_station):
             time.sleep(1)
             final_satellite.move(0.1)
         print(f"{final_satellite.name} 现在覆盖到了 {target_station.name}，成功发送数据包")
 
 
-# 定义节点
-ground_station = Node("StartGroundStation", [0, 0])
-print("The location of the ground station is:", ground_station.position[0], ",", ground_station.position[1])
+if __name__ == "__main__":
+    # 定义节点
+    ground_station = Node("StartGroundStation", [0, 0])
+    print("The location of the ground station is:", ground_station.position[0], ",", ground_station.position[1])
 
-target_station = Node("TargetGroundStation", [1000, 0]) #Km
-print("The location of the target station is:", target_station.position[0], ",",  target_station.position[1])
-print(f"The satellite's orbital altitude is:2000, so the angular velocity is:0.000825 rad, The satellite coverage radius of the earth is:{EARTH_RADIUS * math.acos(EARTH_RADIUS / (EARTH_RADIUS + 2000))}\n")
+    target_station = Node("TargetGroundStation", [1000, 0]) #Km
+    print("The location of the target station is:", target_station.position[0], ",",  target_station.position[1])
+    print(f"The satellite's orbital altitude is:2000, so the angular velocity is:0.000825 rad, The satellite coverage radius of the earth is:{EARTH_RADIUS * math.acos(EARTH_RADIUS / (EARTH_RADIUS + 2000))}\n")
 
 
-satellites = [Satellite(f"Satellite{i}", [i * 4500, 500], speed=0.07, orbit_height=2000, communication_radius=1500, theta=(2 * math.pi / 30) * i) for i in range(1, 10)] # 9颗卫星，每颗卫星 每0.01S移动70m，轨道高度2000Km，自身通信半径为1500Km,覆盖地面信号范围半径是2000km
-for satellite in satellites:
-    print(f"{satellite.name},  Satellite's starting position: {satellite.position}") #
+    satellites = [Satellite(f"Satellite{i}", [i * 4500, 500], speed=0.07, orbit_height=2000, communication_radius=1500, theta=(2 * math.pi / 30) * i) for i in range(1, 10)] # 9颗卫星，每颗卫星 每0.01S移动70m，轨道高度2000Km，自身通信半径为1500Km,覆盖地面信号范围半径是2000km
+    for satellite in satellites:
+        print(f"{satellite.name},  Satellite's starting position: {satellite.position}") #
 
 
 
 
 
 
-# 模拟数据传输
-simulate_data_transfer(ground_station, satellites, target_station, packet_size=10)
+    # 模拟数据传输
+    simulate_data_transfer(ground_station, satellites, target_station, packet_size=10)
 
-# 更新卫星位置（每小时移动一次）
-time_hours = 1
-for satellite in satellites:
-    satellite.move(time_hours)
-    print(f"{satellite.name} 新位置: {satellite.position}")
+    # 更新卫星位置（每小时移动一次）
+    time_hours = 1
+    for satellite in satellites:
+        satellite.move(time_hours)
+        print(f"{satellite.name} 新位置: {satellite.position}")
@@ -3,6 +3,13 @@ import random
 import math
 import time
 
+from event_clock import VirtualClock, first_crossing
+from instrumentation import metrics, tracer
+
+# propagators、ephemeris、coverage_index 和 router 都从本模块导入常量和函数，为避免循环导入，它们在用到的函数里导入。
+# propagators, ephemeris, coverage_index and router import from this module, so they are imported inside the functions
+# that use them to avoid circular imports
+
 EARTH_PERIMETER = 40075.0
 EARTH_RADIUS = 6360.0
 
@@ -63,12 +70,16 @@ class Satellite():
 
     def can_communicate(self, other):
         """检查两个卫星之间是否可以通信 (三维距离)"""
+        if tracer.trace:  # 逐次调用的计数也只在追踪时记录。 Per-call counters are recorded only while tracing
+            metrics.count("link_checks")
         distance = np.linalg.norm(self.position_3d - other.position_3d)
-        return distance <= self.communication_radius * 10 ** 3  # 转换为米
+        return distance <= self.communication_radius  # 位置和通信范围的单位都是公里
 
     def is_covering(self, groundStation):
         """检查卫星是否覆盖了某个地面节点"""
         """使用 Haversine 公式计算两个经纬度之间的距离"""
+        if tracer.trace:
+            metrics.count("coverage_checks")
         lat1, lon1 = self.lat_lon
         lat2, lon2 =  groundStation.lat_lon
 
@@ -86,15 +97,16 @@ class Satellite():
     def move(self, timeUnit):  # 单位时间是0.5S, 0.5s检测一次
         # 更新卫星的所处角度
         self.theta = (self.theta + self.angular_velocity * timeUnit) % (2 * math.pi)
-        print(f"{self.name}'s new theta is {self.theta}")
 
         # 更新卫星的三维空间位置
         self.position_3d = self.compute_3d_position()  # 调用 compute_3d_position() 更新三维位置
-        print(f"{self.name}'s new 3D position is {self.position_3d}")
 
         # 更新卫星的经纬度投影
         self.lat_lon = self.compute_lat_lon()  # 调用 compute_lat_lon() 更新经纬度投影
-        print(f"{self.name}'s new lat/lon projection is {self.lat_lon}")
+
+        if tracer.trace:  # 关闭追踪时不会构造任何参数, 也不计数
+            metrics.count("satellite_moves")
+            tracer.event("satellite.move", name=self.name, theta=self.theta, position_3d=self.position_3d, lat_lon=self.lat_lon)
 
 # 定义数据包类
 class Packet:
@@ -102,8 +114,294 @@ class Packet:
         self.size = size  # 数据包大小，单位为MB
 
 
+def compute_3d_positions(theta, inclination, orbit_height):
+    """批量计算卫星的三维位置, 公式与 Satellite.compute_3d_position 相同 (参数可以是任意可广播的数组, 返回形状为 (..., 3))"""
+    theta, inclination, orbit_height = np.broadcast_arrays(theta, inclination, orbit_height)
+    r = orbit_height + EARTH_RADIUS
+    position_3d = np.empty(theta.shape + (3,))
+    position_3d[..., 0] = r * np.cos(theta)
+    position_3d[..., 1] = r * np.sin(theta) * np.cos(inclination)
+    position_3d[..., 2] = r * np.sin(inclination)
+    return position_3d
+
+
+def compute_lat_lons(position_3d):
+    """批量把三维位置投影为经纬度, 公式与 Satellite.compute_lat_lon 相同 (返回形状为 (..., 2))"""
+    position_3d = np.asarray(position_3d, dtype=float)
+    r = np.linalg.norm(position_3d, axis=-1)  # 距离地心的距离
+    lat_lon = np.empty(position_3d.shape[:-1] + (2,))
+    lat_lon[..., 0] = np.degrees(np.arcsin(position_3d[..., 2] / r))  # arcsin 的结果已在 [-90, 90] 内
+    lat_lon[..., 1] = np.degrees(np.arctan2(position_3d[..., 1], position_3d[..., 0]))  # arctan2 的结果已在 [-180, 180] 内
+    return lat_lon
+
+
+def haversine_distances(lat_lon1, lat_lon2):
+    """批量计算两组经纬度之间的地面距离 (公里), 公式与 Satellite.is_covering 中的 Haversine 公式相同"""
+    lat_lon1 = np.radians(lat_lon1)
+    lat_lon2 = np.radians(lat_lon2)
+    lat1, lon1 = lat_lon1[..., 0], lat_lon1[..., 1]
+    lat2, lon2 = lat_lon2[..., 0], lat_lon2[..., 1]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def _view_field(array_name):
+    """生成一个读写 Constellation 中对应数组元素的属性"""
+    def fget(self):
+        return getattr(self._constellation, array_name)[self._index]
+
+    def fset(self, value):
+        getattr(self._constellation, array_name)[self._index] = value
+
+    return property(fget, fset)
+
+
+# Constellation 中单颗卫星的轻量视图
+class SatelliteView(Satellite):
+    """不保存任何状态, 所有属性都直接读写所属 Constellation 的数组, 因此可以用在所有接受 Satellite 的地方"""
+    name = property(lambda self: self._constellation.names[self._index])
+    speed = _view_field("speed")
+    orbitHeight = _view_field("orbit_height")
+    communication_radius = _view_field("communication_radius")
+    theta = _view_field("theta")
+    inclination = _view_field("inclination")
+    coverage_radius = _view_field("coverage_radius")
+    angular_velocity = _view_field("angular_velocity")
+    position_3d = _view_field("position_3d")
+    lat_lon = _view_field("lat_lon")
+
+    def __init__(self, constellation, index):
+        self._constellation = constellation
+        self._index = index
+
+    def move(self, timeUnit):
+        """只移动这一颗卫星 (整个星座请使用 Constellation.move)"""
+        constellation = self._constellation
+        constellation.theta[self._index] = (self.theta + self.angular_velocity * timeUnit) % (2 * math.pi)
+        constellation.time[self._index] += timeUnit
+        constellation.update_positions(self._index)
+        if tracer.trace:
+            metrics.count("satellite_moves")
+            tracer.event("satellite.move", name=self.name, theta=self.theta, position_3d=self.position_3d, lat_lon=self.lat_lon)
+
+    def __repr__(self):
+        return f"SatelliteView({self.name!r})"
+
+
+# 星座类: 用结构数组 (struct-of-arrays) 保存所有卫星的状态
+class Constellation:
+    def __init__(self, num_satellites, orbit_heights, speeds, communication_radius, inclinations, coverage_radius, angular_velocities):
+        """参数与 create_orbiting_satellites 相同, 每个轨道的卫星均匀分布在轨道上"""
+        counts = np.asarray(num_satellites, dtype=np.int64)
+        orbit_index = np.repeat(np.arange(len(counts)), counts)  # 每颗卫星所在的轨道编号
+        index_in_orbit = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)  # 它在此轨道中的序号
+
+        # 每个轨道的参数展开为每颗卫星一个元素的连续数组
+        self._set_arrays(orbit_index,
+                         speed=np.asarray(speeds, dtype=float)[orbit_index],
+                         orbit_height=np.asarray(orbit_heights, dtype=float)[orbit_index],
+                         communication_radius=np.full(len(orbit_index), float(communication_radius)),
+                         theta=(2 * math.pi / counts[orbit_index]) * index_in_orbit,  # 将卫星均匀分布在轨道上
+                         inclination=np.asarray(inclinations, dtype=float)[orbit_index],
+                         coverage_radius=np.asarray(coverage_radius, dtype=float)[orbit_index],
+                         angular_velocity=np.asarray(angular_velocities, dtype=float)[orbit_index],
+                         names=[f"Satellite_{orbit_heights[i]}_{j}" for i in range(len(counts)) for j in range(num_satellites[i])])
+
+    def _set_arrays(self, orbit_index, speed, orbit_height, communication_radius, theta, inclination, coverage_radius, angular_velocity, names):
+        self.orbit_index = orbit_index
+        self.num_orbits = int(orbit_index.max()) + 1 if len(orbit_index) else 0
+        self.size = len(orbit_index)  # 卫星总数
+        self.orbit_start = np.concatenate(([0], np.cumsum(np.bincount(orbit_index, minlength=self.num_orbits))))  # 第 i 个轨道的卫星是 [orbit_start[i], orbit_start[i + 1])
+        self.index_in_orbit = np.arange(self.size) - self.orbit_start[orbit_index]
+
+        self.speed = speed
+        self.orbit_height = orbit_height
+        self.communication_radius = communication_radius
+        self.theta = theta
+        self.inclination = inclination
+        self.coverage_radius = coverage_radius
+        self.angular_velocity = angular_velocity
+
+        self.names = names
+        self.time = np.zeros(self.size)  # 每颗卫星已经移动的时间 (传给 propagator)
+        self.propagator = None  # 为 None 时使用 compute_3d_positions 的圆轨道公式, 否则使用 propagators 模块中的外推器
+        self.ephemeris = None  # 圆轨道模型的星历查找表 (ephemeris.ShellEphemeris), 见 use_ephemeris
+        self._coverage_index = None  # 星下点的 KD 树覆盖索引, 位置变化后在下一次查询时重建 (见 coverage_index)
+        self._coverage_index_stale = True
+        self.position_3d = np.empty((self.size, 3))  # 卫星的三维位置
+        self.lat_lon = np.empty((self.size, 2))  # 卫星投影到地面的经纬度
+        self.update_positions()
+        self._orbits = None
+
+    @classmethod
+    def from_arrays(cls, orbit_index, speed, orbit_height, communication_radius, theta, inclination, coverage_radius, angular_velocity, names=None):
+        """
+        由每颗卫星一个元素的数组直接构造 Constellation (同一轨道的卫星必须相邻)。
+        数组不会被复制, 所以可以是共享内存或内存映射; 只读的数组只能用于不移动卫星的计算
+        """
+        orbit_index = np.asarray(orbit_index)
+        if names is None:
+            names = [f"Satellite_{orbit_height[k]}_{k}" for k in range(len(orbit_index))]
+        constellation = cls.__new__(cls)
+        constellation._set_arrays(orbit_index, speed, orbit_height, communication_radius, theta, inclination, coverage_radius, angular_velocity, list(names))
+        return constellation
+
+    @classmethod
+    def from_orbits(cls, orbits):
+        """由 create_orbiting_satellites 得到的二维列表构造 Constellation, 保留每颗卫星当前的状态和名字"""
+        orbits = [list(orbit) for orbit in orbits]
+        satellites = [satellite for orbit in orbits for satellite in orbit]
+
+        def column(attribute):
+            return np.array([getattr(satellite, attribute) for satellite in satellites], dtype=float)
+
+        return cls.from_arrays(np.repeat(np.arange(len(orbits)), [len(orbit) for orbit in orbits]),
+                               column("speed"), column("orbitHeight"), column("communication_radius"), column("theta"),
+                               column("inclination"), column("coverage_radius"), column("angular_velocity"),
+                               names=[satellite.name for satellite in satellites])
+
+    @classmethod
+    def from_elements(cls, elements, communication_radius, view_angle=30.0, propagator="j2", **options):
+        """
+        由轨道根数 (propagators.OrbitalElements) 构造 Constellation, 位置由批量外推器计算 (包含升交点赤经和地球自转)。
+        同一轨道面 (半长轴、倾角、升交点赤经相同) 的卫星按轨道排在一起; 覆盖半径与示例相同: 高度 * tan(视场角 / 2)。
+        propagator 可以是 "kepler"、"j2" 或外推器类, options 传给外推器
+        """
+        from propagators import MU_EARTH, PROPAGATORS
+
+        planes = np.stack((elements.semi_major_axis.round(3), elements.inclination.round(6),
+                           np.remainder(elements.raan, 2 * math.pi).round(6)))
+        order = np.lexsort(planes[::-1])
+        elements = elements.take(order)
+        _, orbit_index = np.unique(planes[:, order], axis=1, return_inverse=True)
+        propagator = PROPAGATORS.get(propagator, propagator)(elements, **options)
+
+        height = elements.altitude
+        angular_velocity = propagator.angular_velocity
+        # 时间 0 的纬度幅角 (近似为近地点幅角 + 平近点角)。 Argument of latitude at time 0
+        theta = np.remainder(elements.arg_perigee + elements.mean_anomaly - angular_velocity * elements.epoch, 2 * math.pi)
+        constellation = cls.from_arrays(orbit_index.reshape(-1), np.sqrt(MU_EARTH / elements.semi_major_axis), height,
+                                        np.full(len(height), float(communication_radius)), theta, elements.inclination.copy(),
+                                        height * math.tan(math.radians(view_angle) / 2), angular_velocity, names=elements.names)
+        constellation.propagator = propagator
+        constellation.update_positions()
+        return constellation
+
+    def use_ephemeris(self, enabled=True, resolution=None):
+        """
+        为圆轨道模型建立按轨道壳层 (高度和倾角相同) 共享的星历查找表, 之后的位置由查表插值得到, 不再调用三角函数。
+        内存和建表时间与壳层数成正比, 与卫星数无关; resolution 为每个周期的采样点数 (默认 ephemeris.DEFAULT_RESOLUTION)
+        """
+        if not enabled:
+            self.ephemeris = None
+        else:
+            if self.propagator is not None:
+                raise ValueError("星历查找表只适用于圆轨道模型, 不能与 propagator 同时使用")
+            from ephemeris import DEFAULT_RESOLUTION, ShellEphemeris
+
+            self.ephemeris = ShellEphemeris.for_constellation(self, resolution or DEFAULT_RESOLUTION)
+        self.update_positions()
+        return self.ephemeris
+
+    def positions_at(self, theta, index=slice(None)):
+        """圆轨道模型中 (部分) 卫星在角度 theta 处的三维位置 (有星历查找表时查表)"""
+        if self.ephemeris is not None:
+            return self.ephemeris.positions(theta, index)
+        return compute_3d_positions(theta, self.inclination[index], self.orbit_height[index])
+
+    def update_positions(self, index=slice(None)):
+        """根据当前角度 (或外推器和当前时间) 重新计算 (部分) 卫星的三维位置和经纬度投影"""
+        self._coverage_index_stale = True
+        if self.ephemeris is not None:
+            self.position_3d[index], self.lat_lon[index] = self.ephemeris.lookup(self.theta[index], index)
+            return
+        if self.propagator is not None:
+            self.position_3d[index] = self.propagator.positions(self.time[index], index)
+        else:
+            self.position_3d[index] = compute_3d_positions(self.theta[index], self.inclination[index], self.orbit_height[index])
+        self.lat_lon[index] = compute_lat_lons(self.position_3d[index])
+
+    def positions_after(self, timeUnit, index=slice(None)):
+        """
+        不移动卫星, 计算 timeUnit 之后 (部分) 卫星的三维位置; timeUnit 与所选卫星广播
+        (例如形状为 (K, 1) 的时间数组, 结果为 (K, N, 3))
+        """
+        if self.propagator is not None:
+            return self.propagator.positions(self.time[index] + timeUnit, index)
+        theta = (self.theta[index] + self.angular_velocity[index] * timeUnit) % (2 * math.pi)
+        return self.positions_at(theta, index)
+
+    def coverage_index(self):
+        """当前星下点的 coverage_index.CoverageIndex, 第一次使用时建立, 卫星移动后在下一次调用时重建"""
+        if self._coverage_index is None:
+            from coverage_index import CoverageIndex
+
+            self._coverage_index = CoverageIndex(self)
+        elif self._coverage_index_stale:
+            self._coverage_index.update()
+        self._coverage_index_stale = False
+        return self._coverage_index
+
+    def theta_after(self, timeUnit):
+        """不移动卫星, 计算 timeUnit 之后所有卫星的角度 (timeUnit 可以是形状为 (K, 1) 的时间数组, 结果为 (K, N))"""
+        return (self.theta + self.angular_velocity * timeUnit) % (2 * math.pi)
+
+    def lat_lon_after(self, timeUnit):
+        """不移动卫星, 计算 timeUnit 之后所有卫星的经纬度投影"""
+        if self.ephemeris is not None:
+            return self.ephemeris.lookup(self.theta_after(timeUnit))[1]
+        return compute_lat_lons(self.positions_after(timeUnit))
+
+    def move(self, timeUnit):
+        """一次批量调用移动所有卫星, 与逐颗调用 Satellite.move 的结果相同"""
+        with metrics.timer("propagation"):
+            self.theta += self.angular_velocity * timeUnit
+            np.remainder(self.theta, 2 * math.pi, out=self.theta)
+            self.time += timeUnit
+            self.update_positions()
+        metrics.count("propagation_steps")
+        metrics.count("satellite_moves", self.size)
+        if tracer.debug:
+            tracer.event("constellation.move", time_unit=timeUnit, size=self.size)
+
+    @property
+    def orbits(self):
+        """与 create_orbiting_satellites 相同的二维列表, 元素是 SatelliteView"""
+        self._build_views()
+        return self._orbits
+
+    @property
+    def satellites(self):
+        """按编号排列的所有卫星视图"""
+        self._build_views()
+        return self._satellites
+
+    def _build_views(self):
+        if self._orbits is None:
+            self._satellites = [SatelliteView(self, k) for k in range(self.size)]
+            self._orbits = [self._satellites[self.orbit_start[i]:self.orbit_start[i + 1]] for i in range(self.num_orbits)]
+
+    def __iter__(self):
+        # 按轨道迭代, 这样接受 orbits 二维列表的函数 (如 find_covering_satellite) 也可以直接接受 Constellation
+        return iter(self.orbits)
+
+
+def move_orbits(orbits, timeUnit):
+    """移动所有卫星: Constellation 一次批量更新, 普通的二维列表则逐颗更新"""
+    if isinstance(orbits, Constellation):
+        orbits.move(timeUnit)
+        return
+    for orbit in orbits:  # 遍历出轨道
+        for satellite in orbit:  # 遍历出卫星
+            satellite.move(timeUnit)
+
+
 # 查找当前覆盖到起始基站的卫星
 def find_covering_satellite(station, orbits):
+    if isinstance(orbits, Constellation):  # 用 KD 树索引代替逐颗检查, 结果相同
+        return orbits.coverage_index().find_covering_satellite(station)
     for orbit in orbits: #遍历出轨道
         for satellite in orbit: # 遍历出此轨道的卫星
             if satellite.is_covering(station):
@@ -113,14 +411,58 @@ def find_covering_satellite(station, orbits):
 
 # 查找能与目标基站通讯的卫星
 def find_closest_covering_satellite(target_station, satellites):
+    if isinstance(satellites, Constellation):
+        return satellites.coverage_index().find_covering_satellite(target_station)
     covering_satellites = [sat for sat in satellites if sat.is_covering(target_station)]
     if covering_satellites:
         return covering_satellites[0]  # 简化：假设找到的第一个卫星为最近的
     return None
 
 
+# 计算下一次有卫星覆盖基站的时间 (离散事件模式)
+def next_coverage_time(station, satellites, step=None, horizon=None):
+    """
+    不逐步移动卫星, 直接求出最早的覆盖时刻: 在时间网格上批量计算所有卫星的覆盖余量 (覆盖半径 - 地面距离),
+    找到第一个变号区间后用 Brent 方法求根。
+    satellites 可以是 Constellation, 也可以是 Satellite 对象的列表。
+    step 默认取最短过顶时间的 1/8, horizon 默认取最慢卫星的一个轨道周期 (此后所有卫星的轨迹都会重复)。
+    返回 (时间, 卫星编号), 永远不会覆盖时返回 (None, None)
+    """
+    if isinstance(satellites, Constellation):
+        theta, angular_velocity = satellites.theta, satellites.angular_velocity
+        inclination, orbit_height, coverage_radius = satellites.inclination, satellites.orbit_height, satellites.coverage_radius
+    else:
+        theta = np.array([satellite.theta for satellite in satellites], dtype=float)
+        angular_velocity = np.array([satellite.angular_velocity for satellite in satellites], dtype=float)
+        inclination = np.array([satellite.inclination for satellite in satellites], dtype=float)
+        orbit_height = np.array([satellite.orbitHeight for satellite in satellites], dtype=float)
+        coverage_radius = np.array([satellite.coverage_radius for satellite in satellites], dtype=float)
+
+    if step is None:
+        step = float(np.min(coverage_radius / EARTH_RADIUS / angular_velocity)) / 8
+    if horizon is None:
+        horizon = float(2 * math.pi / np.min(angular_velocity))
+    station_lat_lon = np.asarray(station.lat_lon, dtype=float)
+
+    def margin(times):
+        if isinstance(satellites, Constellation):  # 可能带有外推器。 May have a propagator
+            position_3d = satellites.positions_after(times[:, None])
+        else:
+            position_3d = compute_3d_positions((theta + angular_velocity * times[:, None]) % (2 * math.pi), inclination, orbit_height)
+        return coverage_radius - haversine_distances(compute_lat_lons(position_3d), station_lat_lon)
+
+    return first_crossing(margin, 0.0, horizon, step)
+
+
 # 模拟数据传输过程
-def simulate_data_transfer(start_station, orbits, target_station, packet_size):
+def simulate_data_transfer(start_station, orbits, target_station, packet_size, clock=None):
+    """
+    clock 为 None 时按真实时间等待 (time.sleep); 传入 VirtualClock 时使用离散事件模式:
+    直接计算下一次覆盖发生的时间并跳过去, 不再逐步移动卫星
+    返回 router.Route; 没有卫星会覆盖起始基站时 delivered 为 False (与 SimulationService 相同)
+    """
+    from router import Route, Router
+
     print("开始检测卫星.......\n")
     packet = Packet(packet_size)
     print(f"数据包大小: {packet.size} MB，来自: {start_station.name}\n")
@@ -131,48 +473,55 @@ def simulate_data_transfer(start_station, orbits, target_station, packet_size):
     if not covering_satellite:
         print(f"检测完成, 当前没有卫星覆盖 {start_station.name}, 等待卫星覆盖...")
 
+        if clock is not None:
+            all_satellites = [satellite for orbit in orbits for satellite in orbit]
+            wait_time, index = next_coverage_time(start_station, orbits if isinstance(orbits, Constellation) else all_satellites)
+            if wait_time is None:
+                print(f"没有任何卫星会覆盖 {start_station.name}")
+                return Route(False, clock.now)
+            clock.advance(wait_time)
+            move_orbits(orbits, wait_time)
+            covering_satellite = all_satellites[index]
+
         while not covering_satellite:
             time.sleep(0.5)  # 模拟时间流逝，每0.5S检查一次
             print("开始移动..................")
             # 卫星移动
-            for orbit in orbits:  # 遍历输出轨道
-                for satellite in orbit:  # 遍历出卫星
-                    satellite.move(0.5)  # 更新0.5秒后卫星的位置和角度
+            move_orbits(orbits, 0.5)  # 更新0.5秒后卫星的位置和角度
             # 再次检查有无覆盖卫星
             covering_satellite = find_covering_satellite(start_station, orbits)
 
         print(f"{covering_satellite.name} 现在覆盖 {start_station.name}, 开始发送数据包")
     print(f"\n找到覆盖卫星。卫星名称: {covering_satellite.name}\n")
     # --------------------------------------------卫星间转发数据包--------------------------------------------
-    for i in range(len(satellites) - 1):  # 只是检查了卫星列表中相连的两颗卫星是否可以通讯
-        current_satellite = satellites[i]
-        next_satellite = satellites[i + 1]
-
-        # 移动卫星并预测转发时间后的卫星位置
-        time_hours = 0.01  # 假设转发时间为0.01小时, 36s
-        for orbit in orbits:  # 遍历出轨道
-            for satellite in orbit:  # 遍历出卫星
-                satellite.move(time_hours)
-
-        if current_satellite.can_communicate(next_satellite):
-            print(f"{current_satellite.name} -> {next_satellite.name} 成功转发数据包")
-        else:
-            print(f"{current_satellite.name} -> {next_satellite.name} 转发失败, 距离过远")
-            return
-
-    # -----------------------------------------------预测最终的卫星是否覆盖目标基站--------------------------------
-    final_satellite = satellites[-1]
-    print(f"预测 {final_satellite.name} 将覆盖目标基站 {target_station.name}")
-
-    if final_satellite.is_covering(target_station):
-        print(f"{final_satellite.name} 已覆盖到 {target_station.name}，成功发送数据包")
+    # 在时变的星间链路图上搜索最早到达目标基站的路径 (卫星可以携带数据包, 直到覆盖目标基站)
+    constellation = orbits if isinstance(orbits, Constellation) else Constellation.from_orbits(orbits)
+    route = Router(constellation, hop_time=0.01).route(start_station, target_station)  # 假设每跳转发时间为0.01
+    if not route.delivered:
+        print(f"在一个轨道周期内没有到达 {target_station.name} 的路径, 转发失败")
+        return route
+
+    names = constellation.names
+    for current_satellite, next_satellite in zip(route.path, route.path[1:]):
+        print(f"{names[current_satellite]} -> {names[next_satellite]} 成功转发数据包")
+
+    # -----------------------------------------------最终的卫星覆盖目标基站--------------------------------
+    if clock is not None:
+        clock.advance(route.arrival_time)
+        move_orbits(orbits, route.arrival_time)
     else:
-        print(f"{final_satellite.name} 尚未覆盖 {target_station.name}，等待卫星移动...")
-        # 等待此卫星覆盖到目标基站
-        while not final_satellite.is_covering(target_station):
-            time.sleep(0.5)
-            final_satellite.move(0.5)
-        print(f"{final_satellite.name} 现在覆盖到了 {target_station.name}，成功发送数据包")
+        # 按真实时间每 0.5 秒前进一步 (与等待覆盖时相同), 每 10 秒报告一次进度
+        elapsed, step = 0.0, 0
+        while elapsed < route.arrival_time:
+            dt = min(0.5, route.arrival_time - elapsed)
+            time.sleep(dt)
+            move_orbits(orbits, dt)
+            elapsed += dt
+            step += 1
+            if step % 20 == 0:
+                print(f"数据包传输中...... {elapsed:.1f} / {route.arrival_time:.1f}")
+    print(f"{names[route.path[-1]]} 覆盖到了 {target_station.name}，成功发送数据包 (耗时 {route.latency}, {route.hops} 跳)")
+    return route
 
 
 def create_orbiting_satellites(num_satellites, orbit_heights, speeds, communication_radius, inclinations, coverage_radius, angular_velocities):
@@ -187,6 +536,11 @@ def create_orbiting_satellites(num_satellites, orbit_heights, speeds, communicat
     return satellites #得到一个2维数组， 长度为5， 每个小数组里是每个轨道的卫星
 
 
+def create_constellation(num_satellites, orbit_heights, speeds, communication_radius, inclinations, coverage_radius, angular_velocities):
+    """与 create_orbiting_satellites 参数相同, 但返回数组化的 Constellation (可按轨道迭代, constellation.orbits 是卫星视图)"""
+    return Constellation(num_satellites, orbit_heights, speeds, communication_radius, inclinations, coverage_radius, angular_velocities)
+
+
 # 示例用法
 if __name__ == "__main__":
     # 创建地面基站 (位置用纬度和经度表示)
@@ -216,9 +570,9 @@ if __name__ == "__main__":
     coverage_radius = [d / 2 for d in D]  # 覆盖半径，单位：km
     print("每个轨道的卫星的 覆盖地面信号面积半径是：", coverage_radius) # [535.8983848622454, 589.4882233484699, 669.8729810778067, 616.2831425915822, 562.6933041053577]
 
-    orbits = create_orbiting_satellites(num_satellites, orbit_heights, speeds, communication_radius, inclinations, coverage_radius, angular_velocities)
-    print("satellites的形状是：", len(orbits)) # 5
+    orbits = create_constellation(num_satellites, orbit_heights, speeds, communication_radius, inclinations, coverage_radius, angular_velocities)
+    print("satellites的形状是：", orbits.num_orbits) # 5
 
-    # 开始模拟数据传输
-    simulate_data_transfer(start_station, orbits, target_station, packet_size=50)  # 传输一个大小为50MB的数据包
+    # 开始模拟数据传输 (离散事件模式: 直接跳到下一个事件, 不按真实时间等待; 去掉 clock 参数即按真实时间运行)
+    simulate_data_transfer(start_station, orbits, target_station, packet_size=50, clock=VirtualClock())  # 传输一个大小为50MB的数据包
 
@@ -0,0 +1,34 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# 把一组命名数组放进一块共享内存，供工作进程只读访问。 Named arrays in one shared memory block, read-only in the workers
+def share_arrays(arrays):
+    """
+    Copy named arrays into one shared memory block.
+    :return: (SharedMemory, layout) where layout lists (name, dtype, shape, offset); the caller closes and unlinks
+             the block
+    """
+    layout, offset = [], 0
+    for name, array in arrays.items():
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += -(-array.nbytes // 8) * 8  # 按 8 字节对齐。 8-byte alignment
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (name, dtype, shape, start), array in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)[...] = array
+    return block, layout
+
+
+def attach_arrays(block_name, layout):
+    """
+    Open a block made by share_arrays (e.g. in a worker's initializer).
+    :return: (SharedMemory, {name: read-only view}); keep the block referenced as long as the views are used
+    """
+    block = shared_memory.SharedMemory(name=block_name)
+    views = {}
+    for name, dtype, shape, start in layout:
+        view = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)
+        view.flags.writeable = False
+        views[name] = view
+    return block, views
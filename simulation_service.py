@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+from event_clock import VirtualClock
+from instrumentation import metrics, tracer
+from router import Route, Router
+from satallite2 import EARTH_RADIUS
+
+
+# 异步模拟服务：一个共享的星座时钟，每个时间步只移动一次星座，所有并发的传输请求共用。
+# Asynchronous simulation service: one shared constellation clock; the constellation is moved once per tick for
+# every concurrent transfer request instead of once per request
+class SimulationService:
+    def __init__(self, constellation, tick=0.5, realtime=False, speedup=1.0, hop_time=0.01, slot=None, clock=None):
+        """
+        Requests are coroutines (await service.transfer(...)); each is routed with Router.route from its start time
+        and resolves when the shared clock reaches the arrival time. All routes share one Router, so requests from the
+        same station in the same slot reuse one search, and the router's snapshots are computed once for everyone.
+        The router is re-anchored to the current constellation state every quarter of the slowest orbital period
+        (its searches are relative to that state), and every request searches at least one full period ahead.
+        Pacing:
+            realtime=False: ticks run back to back (yielding to the other coroutines between ticks), and the clock
+                            stops while no request is pending
+            realtime=True:  one tick of simulation time per tick / speedup seconds of wall time
+        :param constellation: a satallite2.Constellation, moved by the service (once per tick)
+        :param tick: simulation time per tick, in Satellite.move time units (0.5 as in simulate_data_transfer)
+        :param speedup: simulation time units per wall-clock second in real-time mode
+        :param hop_time, slot: passed to Router
+        :param clock: shared VirtualClock (default: a new one starting at 0)
+        """
+        self.constellation = constellation
+        self.tick = float(tick)
+        self.realtime = realtime
+        self.speedup = float(speedup)
+        self.clock = VirtualClock() if clock is None else clock
+        if slot is None:  # 与 Router 的默认值相同。 Same default as Router
+            slot = float(np.min(constellation.coverage_radius / EARTH_RADIUS / constellation.angular_velocity)) / 8
+        self.router_options = {"hop_time": hop_time, "slot": slot}
+        self.period = float(2 * math.pi / np.min(constellation.angular_velocity))  # 最慢卫星的轨道周期
+        self.anchor_interval = self.period / 4
+        self._anchor()
+
+        self._waiting = []  # 尚未出发的请求 (出发时间, 序号, 基站, 基站, future)。 Requests not yet departed
+        self._in_flight = []  # 已路由、等待到达的请求 (到达时间, 序号, future, route)。 Routed, waiting to arrive
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def _anchor(self):
+        # 路由时间相对于 epoch；epoch 取在时隙边界上，所以重新锚定不会改变拓扑的采样时刻。
+        # Router times are relative to the epoch, which is kept on a slot boundary so re-anchoring never shifts the
+        # times at which the topology is sampled
+        slot = self.router_options["slot"]
+        self.epoch = math.floor(self.clock.now / slot) * slot
+        self.router = Router(self.constellation, horizon=self.period + self.anchor_interval, start=self.epoch - self.clock.now,
+                             **self.router_options)
+
+    @property
+    def now(self):
+        return self.clock.now
+
+    @property
+    def pending(self):
+        return len(self._waiting) + len(self._in_flight)
+
+    def transfer(self, start_station, target_station, packet_size=None, at=None):
+        """
+        Submit a transfer; the packet size is kept with the request but not modelled, as in simulate_data_transfer.
+        :param at: simulation time the packet is handed to the start station (default: now; earlier times are now)
+        :return: asyncio.Future resolving to a router.Route with absolute departure / arrival times
+        """
+        future = asyncio.get_running_loop().create_future()
+        departure = self.clock.now if at is None else max(float(at), self.clock.now)
+        heapq.heappush(self._waiting, (departure, next(self._sequence), start_station, target_station, future))
+        metrics.count("service_requests")
+        if departure <= self.clock.now:
+            self._depart()
+        self._wakeup.set()
+        return future
+
+    def _depart(self):
+        # 出发时间已到的请求：路由并放入在途队列。 Route every request whose departure time has come
+        while self._waiting and self._waiting[0][0] <= self.clock.now:
+            departure, sequence, start_station, target_station, future = heapq.heappop(self._waiting)
+            if future.done():  # 已被取消。 Cancelled
+                continue
+            route = self.router.route(start_station, target_station, departure=departure - self.epoch)
+            if not route.delivered:
+                future.set_result(Route(False, departure))
+                metrics.count("service_failed")
+                continue
+            route = Route(True, departure, route.arrival_time + self.epoch, route.path)
+            heapq.heappush(self._in_flight, (route.arrival_time, sequence, future, route))
+
+    def _arrive(self):
+        while self._in_flight and self._in_flight[0][0] <= self.clock.now:
+            _, _, future, route = heapq.heappop(self._in_flight)
+            if not future.done():
+                future.set_result(route)
+                metrics.count("service_delivered")
+
+    def step(self):
+        """
+        Advance the shared clock by one tick: move the constellation once, then route the requests whose start time
+        has come and resolve the ones that have arrived.
+        """
+        self.clock.advance(self.tick)
+        self.constellation.move(self.tick)
+        metrics.count("service_ticks")
+        if self.clock.now - self.epoch >= self.anchor_interval:
+            self._anchor()
+        self._depart()
+        self._arrive()
+        if tracer.debug:
+            tracer.event("service.tick", now=self.clock.now, waiting=len(self._waiting), in_flight=len(self._in_flight))
+
+    async def run(self, until=None):
+        """
+        Run the tick loop until the simulation time `until` (default: until stop() is called).
+        """
+        loop = asyncio.get_running_loop()
+        wall_start, sim_start = loop.time(), self.clock.now
+        while not self._stopping and (until is None or self.clock.now < until):
+            if self.realtime:
+                target = wall_start + (self.clock.now + self.tick - sim_start) / self.speedup
+                await asyncio.sleep(max(0.0, target - loop.time()))
+            elif not self.pending:
+                # 没有请求时时钟停止，等新的请求。 Idle: the clock stops until a request comes in
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            self.step()
+            if not self.realtime:
+                await asyncio.sleep(0)  # 让被唤醒的请求先运行。 Let the woken requests run before the next tick
+        self._stopping = False
+
+    def stop(self):
+        """
+        Make run() return after the current tick (or right away if it has not started yet).
+        """
+        self._stopping = True
+        self._wakeup.set()
@@ -0,0 +1,312 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from event_clock import VirtualClock
+from instrumentation import metrics
+
+# 模拟状态的快照 (检查点) 和追加写入的轨迹日志。 Snapshots (checkpoints) of the simulation state and append-only trajectory logs
+#
+# A snapshot is a directory holding structured NumPy arrays (one record per satellite / station) and meta.json with the
+# clock and the model. np.load(..., mmap_mode="r") maps the arrays, so analysis workers read the state zero-copy
+# without re-running the propagation.
+#
+#   satellites.npy   one record per satellite (SATELLITE_FIELDS for satallite2, ORBIT_SATELLITE_FIELDS for satallite)
+#   stations.npy     one record per ground station: name and lat/lon (satallite2.Station) or position (satallite.Node)
+#   elements.npy     orbital elements of the propagator, if the constellation has one
+#   meta.json        model, clock time, step and the propagator / ephemeris settings
+
+FORMAT_VERSION = 1
+
+# satallite2.Constellation 每颗卫星保存的字段 (名字另存)。 Per-satellite fields of a satallite2.Constellation (plus the name)
+SATELLITE_FIELDS = (("orbit_index", "<i8", ()), ("speed", "<f8", ()), ("orbit_height", "<f8", ()),
+                    ("communication_radius", "<f8", ()), ("theta", "<f8", ()), ("inclination", "<f8", ()),
+                    ("coverage_radius", "<f8", ()), ("angular_velocity", "<f8", ()), ("time", "<f8", ()),
+                    ("position_3d", "<f8", (3,)), ("lat_lon", "<f8", (2,)))
+
+# satallite.Satellite 的字段 (覆盖半径和角速度由轨道高度决定)。 Fields of a satallite.Satellite
+ORBIT_SATELLITE_FIELDS = (("position", "<f8", (2,)), ("speed", "<f8", ()), ("orbitHeight", "<f8", ()),
+                          ("communication_radius", "<f8", ()), ("theta", "<f8", ()))
+
+# 轨迹日志每帧保存的字段。 Fields of one trajectory frame, per model
+TRAJECTORY_FIELDS = {"constellation": (("theta", ()), ("position_3d", (3,)), ("lat_lon", (2,))),
+                     "single_orbit": (("theta", ()), ("position", (2,)))}
+
+
+def _names_dtype(names):
+    return "<U%d" % max([1] + [len(name) for name in names])
+
+
+def _record_dtype(fields, names):
+    return np.dtype([("name", _names_dtype(names))] + [(name, dtype, shape) for name, dtype, shape in fields])
+
+
+def _replace_directory(source, directory):
+    """把写好的临时目录换成 directory, 中断时旧快照保持完整。 Swap a finished temporary directory in; an interruption leaves the old snapshot intact"""
+    old = directory + ".old"
+    if os.path.exists(old):
+        shutil.rmtree(old)
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(source, directory)
+    if os.path.exists(old):
+        shutil.rmtree(old)
+
+
+class Snapshot:
+    def __init__(self, model, satellites, stations, time=0.0, step=0, elements=None, meta=None):
+        """
+        Full simulation state: one record per satellite and per station, and the simulation clock.
+        :param model: "constellation" (satallite2.Constellation) or "single_orbit" (list of satallite.Satellite)
+        :param satellites, stations: structured arrays (may be memory-mapped)
+        :param time: simulation clock (VirtualClock.now)
+        :param step: number of steps the run had completed, for resuming
+        :param elements: structured array of propagators.ELEMENT_FIELDS, if the constellation has a propagator
+        :param meta: propagator / ephemeris settings
+        """
+        self.model = model
+        self.satellites = satellites
+        self.stations = stations
+        self.time = float(time)
+        self.step = int(step)
+        self.elements = elements
+        self.meta = dict(meta or {})
+
+    @classmethod
+    def capture(cls, state, stations=(), clock=None, step=0):
+        """
+        :param state: satallite2.Constellation or a list of satallite.Satellite
+        :param stations: satallite2.Station or satallite.Node objects
+        :param clock: VirtualClock (or a time)
+        """
+        from satallite2 import Constellation
+
+        time = clock.now if isinstance(clock, VirtualClock) else float(clock or 0.0)
+        stations = list(stations)
+        station_names = [station.name for station in stations]
+        if isinstance(state, Constellation):
+            model, coordinate = "constellation", "lat_lon"
+            satellites = np.empty(state.size, dtype=_record_dtype(SATELLITE_FIELDS, state.names))
+            satellites["name"] = state.names
+            for name, _, _ in SATELLITE_FIELDS:
+                satellites[name] = getattr(state, name)
+        else:
+            model, coordinate = "single_orbit", "position"
+            satellites = np.empty(len(state), dtype=_record_dtype(ORBIT_SATELLITE_FIELDS, [s.name for s in state]))
+            satellites["name"] = [satellite.name for satellite in state]
+            for name, _, _ in ORBIT_SATELLITE_FIELDS:
+                satellites[name] = [getattr(satellite, name) for satellite in state]
+        station_records = np.empty(len(stations), dtype=[("name", _names_dtype(station_names)), (coordinate, "<f8", (2,))])
+        station_records["name"] = station_names
+        station_records[coordinate] = np.array([getattr(station, coordinate) for station in stations], dtype=float).reshape(-1, 2)
+
+        elements, meta = None, {}
+        if model == "constellation" and state.propagator is not None:
+            from propagators import ELEMENT_FIELDS
+
+            propagator = state.propagator
+            elements = np.empty(len(propagator.elements), dtype=[(name, "<f8") for name in ELEMENT_FIELDS])
+            for name, array in propagator.elements.arrays().items():
+                elements[name] = array
+            meta.update(propagator=type(propagator).__name__, propagator_options=propagator.options(),
+                        origin=propagator.elements.origin)
+        if model == "constellation" and state.ephemeris is not None:
+            meta["ephemeris_resolution"] = state.ephemeris.resolution
+        return cls(model, satellites, station_records, time, step, elements, meta)
+
+    def save(self, directory):
+        """
+        Write the snapshot to a temporary directory first and swap it in, so a run interrupted while checkpointing
+        still has its previous checkpoint.
+        """
+        directory = os.path.normpath(directory)
+        temporary = directory + ".tmp"
+        if os.path.exists(temporary):
+            shutil.rmtree(temporary)
+        os.makedirs(temporary)
+        np.save(os.path.join(temporary, "satellites.npy"), self.satellites)
+        np.save(os.path.join(temporary, "stations.npy"), self.stations)
+        if self.elements is not None:
+            np.save(os.path.join(temporary, "elements.npy"), self.elements)
+        with open(os.path.join(temporary, "meta.json"), "w") as f:
+            json.dump(dict(self.meta, format=FORMAT_VERSION, model=self.model, time=self.time, step=self.step), f)
+        _replace_directory(temporary, directory)
+        metrics.count("snapshots_saved")
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Load a saved snapshot; with mmap_mode="r" the records are memory-mapped, so loading is zero-copy and
+        several processes share the same pages.
+        """
+        directory = os.path.normpath(directory)
+        if not os.path.exists(directory) and os.path.exists(directory + ".old"):  # 替换到一半时中断。 Interrupted mid-swap
+            directory += ".old"
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.pop("format") != FORMAT_VERSION:
+            raise ValueError(f"{directory} is not a snapshot of format {FORMAT_VERSION}")
+        elements_path = os.path.join(directory, "elements.npy")
+        elements = np.load(elements_path, mmap_mode=mmap_mode) if os.path.exists(elements_path) else None
+        return cls(meta.pop("model"), np.load(os.path.join(directory, "satellites.npy"), mmap_mode=mmap_mode),
+                   np.load(os.path.join(directory, "stations.npy"), mmap_mode=mmap_mode),
+                   meta.pop("time"), meta.pop("step"), elements, meta)
+
+    def clock(self):
+        return VirtualClock(self.time)
+
+    def station_objects(self):
+        """
+        :return: the stations as satallite2.Station (constellation model) or satallite.Node objects
+        """
+        if self.model == "constellation":
+            from satallite2 import Station
+
+            return [Station(str(record["name"]), record["lat_lon"]) for record in self.stations]
+        from satallite import Node
+
+        return [Node(str(record["name"]), record["position"]) for record in self.stations]
+
+    def constellation(self, copy=True):
+        """
+        Rebuild the satallite2.Constellation. With copy=False its arrays are the snapshot's (memory-mapped, read-only)
+        columns, which is enough for computations that do not move the satellites.
+        """
+        from satallite2 import Constellation
+
+        if self.model != "constellation":
+            raise ValueError(f"a {self.model} snapshot has no Constellation")
+        records = self.satellites
+
+        def column(name):
+            return np.array(records[name]) if copy else records[name]
+
+        constellation = Constellation.from_arrays(*(column(name) for name, _, _ in SATELLITE_FIELDS[:8]),
+                                                  names=records["name"].tolist())
+        constellation.time = np.array(records["time"])
+        if self.elements is not None:
+            from propagators import ELEMENT_FIELDS, PROPAGATORS, OrbitalElements
+
+            elements = OrbitalElements(*(self.elements[name] for name in ELEMENT_FIELDS), names=constellation.names,
+                                       origin=self.meta.get("origin", 0.0))
+            propagator_class = {cls.__name__: cls for cls in PROPAGATORS.values()}[self.meta["propagator"]]
+            constellation.propagator = propagator_class(elements, **self.meta.get("propagator_options", {}))
+            constellation.update_positions()
+        if "ephemeris_resolution" in self.meta:
+            constellation.use_ephemeris(resolution=self.meta["ephemeris_resolution"])
+        return constellation
+
+    def orbit_satellites(self):
+        """
+        :return: the satallite.Satellite list of a single-orbit snapshot
+        """
+        from satallite import Satellite
+
+        if self.model != "single_orbit":
+            raise ValueError(f"a {self.model} snapshot has no single-orbit satellites")
+        return [Satellite(str(record["name"]), np.array(record["position"]),
+                          *(float(record[name]) for name, _, _ in ORBIT_SATELLITE_FIELDS[1:])) for record in self.satellites]
+
+    def restore(self, copy=True):
+        """
+        :return: (constellation or satellite list, stations, VirtualClock, step) to resume a run from
+        """
+        state = self.constellation(copy) if self.model == "constellation" else self.orbit_satellites()
+        return state, self.station_objects(), self.clock(), self.step
+
+
+def save_checkpoint(directory, state, stations=(), clock=None, step=0):
+    snapshot = Snapshot.capture(state, stations, clock, step)
+    snapshot.save(directory)
+    return snapshot
+
+
+# 追加写入的轨迹日志。 Append-only trajectory log
+class TrajectoryLog:
+    def __init__(self, directory, state, every=1, resume_step=None):
+        """
+        Every recorded frame is one fixed-size record (step, time and the per-satellite fields of TRAJECTORY_FIELDS)
+        appended to frames.bin, so a reader maps the complete frames with read_trajectory while the run goes on.
+        :param state: the constellation or satellite list being logged (fixes the frame layout)
+        :param every: record one frame every `every` steps
+        :param resume_step: when resuming from a checkpoint, frames after this step (written after the checkpoint
+                            was taken) are dropped, as is a frame cut short by the interruption
+        """
+        from satallite2 import Constellation
+
+        self.directory = directory
+        self.every = int(every)
+        self.model = "constellation" if isinstance(state, Constellation) else "single_orbit"
+        size = state.size if self.model == "constellation" else len(state)
+        self.dtype = np.dtype([("step", "<i8"), ("time", "<f8")] +
+                              [(name, "<f8", (size,) + shape) for name, shape in TRAJECTORY_FIELDS[self.model]])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "frames.bin")
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if np.dtype([tuple(field) for field in meta["dtype"]]) != self.dtype:
+                raise ValueError(f"the trajectory log in {directory} has a different frame layout")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"format": FORMAT_VERSION, "model": self.model, "every": self.every,
+                           "dtype": self.dtype.descr}, f)
+        frames = 0
+        if os.path.exists(path):
+            frames = os.path.getsize(path) // self.dtype.itemsize
+            if resume_step is not None and frames:
+                steps = np.memmap(path, dtype=self.dtype, mode="r", shape=(frames,))["step"]
+                frames = int(np.searchsorted(steps, resume_step, side="right"))
+                del steps
+        self._file = open(path, "ab")
+        self._file.truncate(frames * self.dtype.itemsize)
+        self._frame = np.zeros((), dtype=self.dtype)
+
+    def record(self, state, time, step):
+        """
+        Append a frame if step is a multiple of `every`.
+        :return: True if a frame was written
+        """
+        if step % self.every:
+            return False
+        frame = self._frame
+        frame["step"] = step
+        frame["time"] = time
+        for name, _ in TRAJECTORY_FIELDS[self.model]:
+            if self.model == "constellation":
+                frame[name] = getattr(state, name)
+            else:
+                frame[name] = [getattr(satellite, name) for satellite in state]
+        self._file.write(frame.tobytes())
+        self._file.flush()
+        metrics.count("trajectory_frames")
+        return True
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_trajectory(directory, mmap_mode="r"):
+    """
+    :return: the complete frames of a trajectory log as a structured array (memory-mapped with mmap_mode="r");
+             e.g. frames["lat_lon"][k] is the (N, 2) sub-points of the k-th frame
+    """
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    dtype = np.dtype([tuple(field) for field in meta["dtype"]])
+    path = os.path.join(directory, "frames.bin")
+    frames = os.path.getsize(path) // dtype.itemsize
+    if frames == 0:
+        return np.empty(0, dtype=dtype)
+    if mmap_mode is None:
+        return np.fromfile(path, dtype=dtype, count=frames)
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, shape=(frames,))
@@ -0,0 +1,178 @@
+import functools
+import itertools
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from instrumentation import metrics
+from satallite import EARTH_PERIMETER, EARTH_RADIUS, Node
+
+# 单轨道模型 (satallite.py) 的参数扫描。 Parameter sweep of the single-orbit model of satallite.py
+#
+# Every configuration is a ring of evenly spaced satellites (x = i * EARTH_PERIMETER / N, theta = 2*pi*i / N) on one
+# ground track at a fixed offset from the station, moving with Satellite.move and tested with Satellite.is_covering.
+
+# 每个配置的参数。 Parameters of a configuration
+CONFIG_COLUMNS = ("num_satellites", "orbit_height", "speed", "communication_radius")
+
+# 结果表的列。 Columns of the results table
+SWEEP_COLUMNS = CONFIG_COLUMNS + (
+    "coverage_radius",  # Satellite.coverage_radius of this orbit height
+    "coverage_fraction",  # fraction of time the station is covered (= probability of no wait)
+    "gap_count", "mean_gap", "max_gap",  # coverage gaps per ground-track period
+    "mean_wait", "wait_p50", "wait_p90", "wait_p99",  # wait until coverage for a uniformly random arrival
+    "isl_link_length", "isl_neighbors", "isl_ring_connected",  # inter-satellite links of the ring
+)
+
+WAIT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def parse_values(tokens, integer=False):
+    """
+    Values for one swept parameter: each token is a number or START:STOP:COUNT (COUNT evenly spaced values including
+    both ends); integer parameters are rounded and deduplicated.
+    """
+    values = []
+    for token in tokens:
+        token = str(token)
+        if ":" in token:
+            start, stop, count = token.split(":")
+            values.extend(np.linspace(float(start), float(stop), int(count)).tolist())
+        else:
+            values.append(float(token))
+    if integer:
+        values = sorted({int(round(value)) for value in values})
+    return values
+
+
+def configurations(num_satellites, orbit_heights, speeds, communication_radii):
+    """
+    :return: (n, len(CONFIG_COLUMNS)) array with every combination of the given values
+    """
+    return np.array(list(itertools.product(num_satellites, orbit_heights, speeds, communication_radii)),
+                    dtype=float).reshape(-1, len(CONFIG_COLUMNS))
+
+
+def coverage_radius(orbit_height):
+    """与 Satellite.__init__ 相同的覆盖半径。 Coverage radius as in Satellite.__init__"""
+    return EARTH_RADIUS * np.arccos(EARTH_RADIUS / (EARTH_RADIUS + np.asarray(orbit_height, dtype=float)))
+
+
+def coverage_gaps(num_satellites, speed, radius, station_position, track_offset, resolution=64):
+    """
+    Coverage gaps of a station over one ground-track period T = EARTH_PERIMETER / speed, after which the ring repeats.
+    The coverage margin (radius - distance, with the formulas of Satellite.move and Satellite.is_covering) of every
+    satellite is evaluated on a time grid in one NumPy call; the gap edges are the linear interpolations of the sign
+    changes of the best margin.
+    :param resolution: grid points per coverage radius travelled
+    :return: (gap lengths, T); a station never covered has one gap of infinite length
+    """
+    period = EARTH_PERIMETER / speed
+    station_x, station_y = station_position
+    samples = max(int(math.ceil(EARTH_PERIMETER * resolution / radius)), 2 * num_satellites)
+    step = period / samples
+    times = np.arange(samples) * step
+    x0 = np.arange(num_satellites) * (EARTH_PERIMETER / num_satellites)
+
+    dx = (x0 + speed * times[:, None]) % EARTH_PERIMETER - station_x
+    wrapped = np.where(dx > EARTH_PERIMETER / 2, EARTH_PERIMETER - dx - station_x, dx)
+    margin = radius - np.sqrt(wrapped ** 2 + (track_offset - station_y) ** 2)
+    best = margin.max(axis=1)
+
+    covered = best >= 0
+    if covered.all():
+        return np.empty(0), period
+    if not covered.any():
+        return np.array([np.inf]), period
+
+    following = np.roll(best, -1)
+    edge = np.flatnonzero(covered != np.roll(covered, -1))  # 在 edge 和 edge + 1 之间变号。 Sign change between edge and edge + 1
+    crossing = times[edge] + step * best[edge] / (best[edge] - following[edge])
+    down = crossing[covered[edge]]  # 覆盖 -> 未覆盖。 Covered -> uncovered
+    up = crossing[~covered[edge]]
+    if up[0] < down[0]:
+        up = np.append(up[1:], up[0] + period)
+    return up - down, period
+
+
+def wait_statistics(gaps, period, quantiles=WAIT_QUANTILES):
+    """
+    Waiting time until coverage for an arrival uniform over the period: it is 0 while covered and uniform over the rest
+    of a gap otherwise, so P(wait > w) = sum(max(gap - w, 0)) / period.
+    :return: (mean wait, wait quantiles)
+    """
+    if np.isinf(gaps).any():
+        return math.inf, np.full(len(quantiles), math.inf)
+    if not len(gaps):
+        return 0.0, np.zeros(len(quantiles))
+    gaps = np.sort(gaps)[::-1]
+    total = np.cumsum(gaps)
+    # S(w) = sum(max(gap - w, 0)) at w = gaps[j] (and at w = 0), increasing in j
+    breakpoints = np.concatenate(([0.0], total[:-1] - np.arange(1, len(gaps)) * gaps[1:], [total[-1]]))
+    target = (1 - np.asarray(quantiles, dtype=float)) * period
+    k = np.clip(np.searchsorted(breakpoints, target), 1, len(gaps))
+    wait = np.maximum((total[k - 1] - target) / k, 0.0)
+    return float(np.sum(gaps ** 2) / (2 * period)), wait
+
+
+def ring_links(num_satellites, orbit_height, communication_radius):
+    """
+    Inter-satellite links of an evenly spaced ring, with the chord distance of Satellite.can_communicate.
+    :return: (adjacent link length, satellites within range of each satellite, whether the ring is connected)
+    """
+    if num_satellites < 2:
+        return math.inf, 0, False
+    radius = orbit_height + EARTH_RADIUS
+    chords = 2 * radius * np.abs(np.sin(math.pi * np.arange(1, num_satellites) / num_satellites))
+    link_length = float(chords[0])
+    return link_length, int(np.count_nonzero(chords <= communication_radius)), link_length <= communication_radius
+
+
+def evaluate(config, station_position=(0.0, 0.0), track_offset=500.0, resolution=64):
+    """
+    :param config: one row of configurations()
+    :return: one row of SWEEP_COLUMNS
+    """
+    num_satellites, orbit_height, speed, communication_radius = config
+    num_satellites = int(num_satellites)
+    radius = float(coverage_radius(orbit_height))
+    gaps, period = coverage_gaps(num_satellites, speed, radius, station_position, track_offset, resolution)
+    mean_wait, waits = wait_statistics(gaps, period)
+    link_length, neighbors, connected = ring_links(num_satellites, orbit_height, communication_radius)
+    covered_time = 0.0 if np.isinf(gaps).any() else period - float(gaps.sum())
+    return (num_satellites, orbit_height, speed, communication_radius, radius, covered_time / period,
+            0 if np.isinf(gaps).any() else len(gaps), float(gaps.mean()) if len(gaps) else 0.0,
+            float(gaps.max(initial=0.0)), mean_wait, *waits, link_length, neighbors, float(connected))
+
+
+def _evaluate_chunk(rows, station_position, track_offset, resolution):
+    return [evaluate(row, station_position, track_offset, resolution) for row in rows]
+
+
+def run_sweep(configs, station=None, track_offset=500.0, processes=None, chunksize=16, resolution=64):
+    """
+    Evaluate every configuration (coverage gaps and waiting times for the station, ISL ring connectivity).
+    :param configs: (n, len(CONFIG_COLUMNS)) array, e.g. from configurations()
+    :param station: ground station (satallite.Node); default Node("GroundStation", [0, 0]) as in the example
+    :param track_offset: y of the satellites' ground track (the example uses 500)
+    :param processes: number of worker processes (default: os.cpu_count(); 1 runs in this process)
+    :param chunksize: configurations per task
+    :return: (n, len(SWEEP_COLUMNS)) results table in the order of configs
+    """
+    configs = np.asarray(configs, dtype=float).reshape(-1, len(CONFIG_COLUMNS))
+    station = Node("GroundStation", [0, 0]) if station is None else station
+    work = functools.partial(_evaluate_chunk, station_position=tuple(float(value) for value in station.position),
+                             track_offset=float(track_offset), resolution=resolution)
+    chunks = [configs[first:first + chunksize] for first in range(0, len(configs), chunksize)]
+    processes = os.cpu_count() if processes is None else processes
+
+    with metrics.timer("sweep"):
+        if processes <= 1 or len(chunks) <= 1:
+            rows = [row for chunk in map(work, chunks) for row in chunk]
+        else:
+            with multiprocessing.Pool(min(processes, len(chunks))) as pool:
+                rows = [row for chunk in pool.imap(work, chunks) for row in chunk]
+    metrics.count("sweep_configurations", len(configs))
+    return np.array(rows, dtype=float).reshape(-1, len(SWEEP_COLUMNS))